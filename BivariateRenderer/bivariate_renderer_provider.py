@@ -4,6 +4,7 @@ from qgis.PyQt.QtGui import QIcon
 
 from qgis.core import QgsProcessingProvider
 from BivariateRenderer.tools.tool_calculate_categories import CalculateCategoriesAlgorithm
+from BivariateRenderer.tools.tool_create_bivariate_classes import CreateBivariateClassesAlgorithm
 
 
 class BivariateRendererProvider(QgsProcessingProvider):
@@ -26,6 +27,7 @@ class BivariateRendererProvider(QgsProcessingProvider):
         Loads all algorithms belonging to this provider.
         """
         self.addAlgorithm(CalculateCategoriesAlgorithm())
+        self.addAlgorithm(CreateBivariateClassesAlgorithm())
 
     def id(self):
         """
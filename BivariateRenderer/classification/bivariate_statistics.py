@@ -0,0 +1,254 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.core import QgsVectorLayer, QgsClassificationMethod, QgsClassificationRange
+
+from .class_breaks import ClassBreaks
+from .field_statistics import FieldStatistics, FieldStatisticsReader
+from .field_statistics_cache import FieldStatisticsCache
+
+
+@dataclass(frozen=True, eq=False)
+class BivariateStatistics:
+    """
+    Bivariate classification of two fields: classes of each field, statistics they were
+    calculated from and numbers of features in each pair of classes (contingency table, rows are
+    classes of field 1, columns classes of field 2), if they were counted. Features with NULL
+    value in any of the fields do not belong to any pair of classes.
+    """
+
+    classes_1: List[QgsClassificationRange]
+    classes_2: List[QgsClassificationRange]
+    breaks_1: ClassBreaks
+    breaks_2: ClassBreaks
+    statistics_1: FieldStatistics
+    statistics_2: FieldStatistics
+    counts: Optional[np.ndarray] = None
+
+    @property
+    def null_count_1(self) -> int:
+        return self.statistics_1.null_count
+
+    @property
+    def null_count_2(self) -> int:
+        return self.statistics_2.null_count
+
+    @property
+    def classified_count(self) -> int:
+        """Number of features with values of both fields."""
+        return int(self.counts.sum())
+
+    @property
+    def empty_categories(self) -> int:
+        """Number of pairs of classes without any feature."""
+        return int(np.count_nonzero(self.counts == 0))
+
+    def __str__(self) -> str:
+
+        nulls = f"NULL values: {self.null_count_1} in field 1, {self.null_count_2} in field 2."
+
+        if self.counts is None:
+            return nulls
+
+        return (f"{self.classified_count} features in {self.counts.size} categories, "
+                f"{self.empty_categories} categories without features. {nulls}")
+
+
+def classify_and_count(layer: QgsVectorLayer,
+                       field_name_1: str,
+                       field_name_2: str,
+                       method: Optional[QgsClassificationMethod] = None,
+                       number_of_classes: int = 0,
+                       sample_size: int = 0,
+                       count_categories: bool = True,
+                       classes: Optional[Tuple[List[QgsClassificationRange],
+                                               List[QgsClassificationRange]]] = None
+                       ) -> Optional[BivariateStatistics]:
+    """
+    Classes of both fields with their NULL counts and (with `count_categories`) counts of
+    features in pairs of classes, see `BivariateStatisticsReader`. Statistics of the fields are
+    taken from and stored in `FieldStatisticsCache`. None if the fields cannot be classified.
+    """
+
+    reader = BivariateStatisticsReader(layer, field_name_1, field_name_2, method,
+                                       number_of_classes, sample_size, count_categories, classes)
+
+    statistics = reader.read()
+
+    for field_name, field_statistics in reader.read_statistics.items():
+        FieldStatisticsCache().store(layer, field_name, field_statistics)
+
+    return statistics
+
+
+class BivariateStatisticsReader:
+    """
+    Reader of `BivariateStatistics` of two fields of a layer. Fields are classified either by the
+    method or by given classes (e.g. of a renderer), statistics of the fields that are not cached
+    are read together (aggregated by the data source if values are not needed, see
+    `FieldStatisticsReader`).
+
+    Classes are only known once the statistics are read, so the features are counted afterwards,
+    by a single GROUP BY query for layers stored in SQLite databases, otherwise both fields are
+    read once more in a single attribute-only pass. Counting values during the first pass would
+    need to keep values of both fields in memory and would prevent reading aggregates only.
+
+    It is created from the layer in the main thread (cached statistics are taken then), reading
+    does not access the layer itself, so it can run in a background task. Statistics read from
+    the layer are available in `read_statistics` afterwards, to be stored in the cache in the
+    main thread.
+    """
+
+    def __init__(self,
+                 layer: QgsVectorLayer,
+                 field_name_1: str,
+                 field_name_2: str,
+                 method: Optional[QgsClassificationMethod] = None,
+                 number_of_classes: int = 0,
+                 sample_size: int = 0,
+                 count_categories: bool = True,
+                 classes: Optional[Tuple[List[QgsClassificationRange],
+                                         List[QgsClassificationRange]]] = None):
+
+        if method is None and classes is None:
+            raise ValueError("Either classification method or classes need to be provided.")
+
+        self.field_names = [field_name_1, field_name_2]
+
+        self.method = method
+        self.number_of_classes = number_of_classes
+        self.sample_size = sample_size
+        self.classes = classes
+
+        # given classes only need NULL counts of the fields, which are aggregated
+        self.with_values = classes is None and method.valuesRequired()
+
+        self.cached_statistics: Dict[str, FieldStatistics] = {}
+
+        for field_name in self.field_names:
+
+            statistics = FieldStatisticsCache().cached(layer, field_name, self.with_values,
+                                                       sample_size)
+
+            if statistics is not None:
+                self.cached_statistics[field_name] = statistics
+
+        missing = [x for x in dict.fromkeys(self.field_names) if x not in self.cached_statistics]
+
+        self.statistics_reader: Optional[FieldStatisticsReader] = None
+
+        if missing:
+            self.statistics_reader = FieldStatisticsReader(layer, missing)
+
+        self.counts_reader: Optional[FieldStatisticsReader] = None
+
+        if count_categories:
+            self.counts_reader = FieldStatisticsReader(layer, self.field_names)
+
+        self.read_statistics: Dict[str, FieldStatistics] = {}
+
+    @property
+    def statistics_cached(self) -> bool:
+        """Are statistics of both fields cached, so that only counting reads the layer?"""
+        return self.statistics_reader is None
+
+    def read(self,
+             is_canceled: Callable[[], bool] = lambda: False) -> Optional[BivariateStatistics]:
+        """Statistics of both fields, None if reading was canceled or classification failed."""
+
+        statistics = dict(self.cached_statistics)
+
+        if self.statistics_reader is not None:
+
+            read_statistics = self.statistics_reader.read(self.with_values, is_canceled,
+                                                          self.sample_size)
+
+            if read_statistics is None:
+                return None
+
+            self.read_statistics = dict(zip(self.statistics_reader.field_names, read_statistics))
+
+            statistics.update(self.read_statistics)
+
+        statistics_1, statistics_2 = [statistics[x] for x in self.field_names]
+
+        if self.classes is not None:
+            classes_1, classes_2 = self.classes
+        else:
+            classes_1 = statistics_1.classes(self.method, self.number_of_classes)
+            classes_2 = statistics_2.classes(self.method, self.number_of_classes)
+
+        if classes_1 is None or classes_2 is None:
+            return None
+
+        breaks = (ClassBreaks(classes_1), ClassBreaks(classes_2))
+
+        counts = None
+
+        if self.counts_reader is not None:
+
+            counts = self._count(breaks, is_canceled)
+
+            if counts is None:
+                return None
+
+        return BivariateStatistics(classes_1, classes_2, breaks[0], breaks[1], statistics_1,
+                                   statistics_2, counts)
+
+    def _count(self, breaks: Tuple[ClassBreaks, ClassBreaks],
+               is_canceled: Callable[[], bool]) -> Optional[np.ndarray]:
+
+        if self.counts_reader.sqlite_source is not None:
+
+            counts = self._count_sqlite(breaks)
+
+            if counts is not None:
+                return counts
+
+        return class_pair_counts(breaks, self.counts_reader.column_chunks(), is_canceled)
+
+    def _count_sqlite(self, breaks: Tuple[ClassBreaks, ClassBreaks]) -> Optional[np.ndarray]:
+
+        source = self.counts_reader.sqlite_source
+
+        try:
+
+            if not all(source.has_column(x) for x in self.field_names):
+                return None
+
+            return source.class_pair_counts(self.field_names[0], breaks[0], self.field_names[1],
+                                            breaks[1])
+
+        except sqlite3.Error:
+            return None
+
+
+def class_pair_counts(breaks: Tuple[ClassBreaks, ClassBreaks],
+                      chunks: Iterable[List[np.ndarray]],
+                      is_canceled: Callable[[], bool] = lambda: False) -> Optional[np.ndarray]:
+    """
+    Contingency table of classes of values of two fields given in aligned chunks (NULL values
+    are NaN), None if counting was canceled.
+    """
+
+    breaks_1, breaks_2 = breaks
+
+    counts = np.zeros(len(breaks_1) * len(breaks_2), dtype=np.int64)
+
+    for values_1, values_2 in chunks:
+
+        if is_canceled():
+            return None
+
+        indices_1 = breaks_1.class_indices(values_1)
+        indices_2 = breaks_2.class_indices(values_2)
+
+        classified = (indices_1 >= 0) & (indices_2 >= 0)
+
+        counts += np.bincount(indices_1[classified] * len(breaks_2) + indices_2[classified],
+                              minlength=len(counts))
+
+    return counts.reshape(len(breaks_1), len(breaks_2))
@@ -0,0 +1,82 @@
+from bisect import bisect_right
+from typing import List, Optional, Tuple, Any
+
+import numpy as np
+
+from qgis.core import QgsClassificationRange
+
+
+class ClassBreaks:
+    """
+    Class breaks of a single field compiled into plain floats, so that class of a value can be
+    found by bisection instead of iterating over `QgsClassificationRange` objects.
+
+    Values equal to a break belong to the upper class, values below the first break belong to
+    the first class and values above the last break to the last class. NULL and NaN values do not
+    belong to any class.
+    """
+
+    breaks: Tuple[float, ...]
+    midpoints: Tuple[float, ...]
+    number_of_classes: int
+
+    def __init__(self, classes: List[QgsClassificationRange]):
+
+        self.number_of_classes = len(classes)
+
+        if classes:
+            self.breaks = tuple([float(classes[0].lowerBound())] +
+                                [float(x.upperBound()) for x in classes])
+        else:
+            self.breaks = tuple()
+
+        self.midpoints = tuple((float(x.lowerBound()) + float(x.upperBound())) / 2
+                               for x in classes)
+
+        self._inner_breaks = self.breaks[1:-1]
+
+    def __len__(self) -> int:
+        return self.number_of_classes
+
+    def class_index(self, value: Any) -> Optional[int]:
+
+        if value is None or self.number_of_classes == 0:
+            return None
+
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+
+        # NaN
+        if value != value:
+            return None
+
+        return bisect_right(self._inner_breaks, value)
+
+    def is_out_of_range(self, value: Any) -> bool:
+        """Is the (not NULL) value outside of the range of the classes?"""
+
+        if self.number_of_classes == 0:
+            return True
+
+        return float(value) < self.breaks[0] or self.breaks[-1] < float(value)
+
+    def class_indices(self, values: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of `class_index`. Missing values should be provided as NaN, their class
+        index is -1.
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+
+        if self.number_of_classes == 0:
+            return np.full(values.shape, -1, dtype=np.int64)
+
+        indices = np.searchsorted(np.asarray(self._inner_breaks, dtype=np.float64),
+                                  values,
+                                  side="right")
+
+        indices[np.isnan(values)] = -1
+
+        return indices
@@ -0,0 +1,214 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.core import QgsVectorLayer, QgsProviderRegistry
+
+from .sql_aggregates import Aggregates, aggregates_sql, aggregates_from_row, quoted_identifier
+
+try:
+    from osgeo import gdal, ogr
+except ImportError:
+    gdal = None
+    ogr = None
+
+
+def arrow_stream_available() -> bool:
+    """Is GDAL with Arrow array stream interface (GDAL >= 3.6) available?"""
+    return ogr is not None and hasattr(ogr.Layer, "GetArrowStreamAsNumPy")
+
+
+def read_numeric_columns(layer: QgsVectorLayer,
+                         field_names: List[str]) -> Optional[Tuple[np.ndarray, List[np.ndarray]]]:
+    """
+    Reads feature ids and values of numeric fields of OGR based layer directly into NumPy arrays,
+    using GDAL Arrow array stream. NULL values are returned as NaN.
+
+    Returns None if this is not possible (other provider, old GDAL, layer with subset string or
+    edits in edit buffer), in that case features need to be iterated as usual.
+    """
+
+    uri = ogr_columns_uri(layer)
+
+    if uri is None:
+        return None
+
+    return read_ogr_numeric_columns(uri, field_names)
+
+
+def iterate_numeric_columns(
+        layer: QgsVectorLayer,
+        field_names: List[str]) -> Optional[Iterator[Tuple[np.ndarray, List[np.ndarray]]]]:
+    """
+    Batches of feature ids and values of numeric fields of OGR based layer, read as in
+    `read_numeric_columns`, so that the columns can be processed without having them in memory
+    at once. Returns None if this is not possible.
+    """
+
+    uri = ogr_columns_uri(layer)
+
+    if uri is None:
+        return None
+
+    return iterate_ogr_numeric_columns(uri, field_names)
+
+
+def ogr_columns_uri(layer: QgsVectorLayer) -> Optional[Dict[str, Any]]:
+    """
+    Decoded uri of OGR based layer, if its columns can be read by `read_ogr_numeric_columns`,
+    otherwise None. Reading itself does not touch the layer and may run in another thread.
+    """
+
+    if not arrow_stream_available():
+        return None
+
+    return ogr_source_uri(layer)
+
+
+def ogr_source_uri(layer: QgsVectorLayer) -> Optional[Dict[str, Any]]:
+    """
+    Decoded uri of OGR based layer, if the data source can be opened by GDAL directly instead of
+    through the layer (GDAL available, no subset string, no edits in edit buffer), otherwise None.
+    """
+
+    if ogr is None or layer.providerType() != "ogr":
+        return None
+
+    if layer.subsetString() or (layer.editBuffer() is not None and
+                                layer.editBuffer().isModified()):
+        return None
+
+    return QgsProviderRegistry.instance().decodeUri("ogr", layer.source())
+
+
+def ogr_aggregates(uri: Dict[str, Any], field_names: List[str]) -> Optional[List[Aggregates]]:
+    """
+    `Aggregates` of fields of OGR layer given by uri, calculated by a single SQL query of the
+    data source (OGR SQL runs in GDAL reading only the fields, the SQL of the database for
+    database formats). None if the layer or fields cannot be opened or the query fails.
+    """
+
+    opened = _open_ogr_layer(uri, field_names)
+
+    if opened is None:
+        return None
+
+    dataset, ogr_layer = opened
+
+    try:
+        result = dataset.ExecuteSQL(
+            aggregates_sql(quoted_identifier(ogr_layer.GetName()), field_names))
+    except RuntimeError:
+        return None
+
+    if result is None:
+        return None
+
+    try:
+        feature = result.GetNextFeature()
+
+        if feature is None:
+            return None
+
+        row = [feature.GetField(i) for i in range(feature.GetFieldCount())]
+    finally:
+        dataset.ReleaseResultSet(result)
+
+    return aggregates_from_row(row, len(field_names))
+
+
+def read_ogr_numeric_columns(
+        uri: Dict[str, Any],
+        field_names: List[str]) -> Optional[Tuple[np.ndarray, List[np.ndarray]]]:
+    """Feature ids and values of fields of OGR layer given by uri, see `read_numeric_columns`."""
+
+    batches = iterate_ogr_numeric_columns(uri, field_names)
+
+    if batches is None:
+        return None
+
+    fids = []
+    values = [[] for _ in field_names]
+
+    for batch_fids, batch_values in batches:
+
+        fids.append(batch_fids)
+
+        for i, field_values in enumerate(batch_values):
+            values[i].append(field_values)
+
+    if not fids:
+        return np.empty(0, dtype=np.int64), [np.empty(0, dtype=np.float64) for _ in field_names]
+
+    return np.concatenate(fids), [np.concatenate(x) for x in values]
+
+
+def iterate_ogr_numeric_columns(
+        uri: Dict[str, Any],
+        field_names: List[str]) -> Optional[Iterator[Tuple[np.ndarray, List[np.ndarray]]]]:
+    """
+    Batches of feature ids and values of fields of OGR layer given by uri (NULL values are NaN),
+    so that the columns can be processed without having them in memory at once. None if the
+    layer or fields cannot be opened.
+    """
+
+    opened = _open_ogr_layer(uri, field_names)
+
+    if opened is None:
+        return None
+
+    dataset, ogr_layer = opened
+
+    layer_definition = ogr_layer.GetLayerDefn()
+
+    all_field_names = [
+        layer_definition.GetFieldDefn(i).GetName() for i in range(layer_definition.GetFieldCount())
+    ]
+
+    ogr_layer.SetIgnoredFields([x for x in all_field_names if x not in field_names] +
+                               ["OGR_GEOMETRY", "OGR_STYLE"])
+
+    fid_column = ogr_layer.GetFIDColumn() or "OGC_FID"
+
+    return _column_batches(dataset, ogr_layer, fid_column, field_names)
+
+
+def _open_ogr_layer(uri: Dict[str, Any], field_names: List[str]) -> Optional[Tuple[Any, Any]]:
+    """Dataset and layer given by uri, None if they cannot be opened or miss any of the fields."""
+
+    dataset = gdal.OpenEx(uri.get("path", ""), gdal.OF_VECTOR | gdal.OF_READONLY)
+
+    if dataset is None:
+        return None
+
+    if uri.get("layerName"):
+        ogr_layer = dataset.GetLayerByName(uri["layerName"])
+    else:
+        ogr_layer = dataset.GetLayer(uri.get("layerId") or 0)
+
+    if ogr_layer is None:
+        return None
+
+    layer_definition = ogr_layer.GetLayerDefn()
+
+    all_field_names = [
+        layer_definition.GetFieldDefn(i).GetName() for i in range(layer_definition.GetFieldCount())
+    ]
+
+    if not all(field_name in all_field_names for field_name in field_names):
+        return None
+
+    return dataset, ogr_layer
+
+
+def _column_batches(dataset: Any, ogr_layer: Any, fid_column: str,
+                    field_names: List[str]) -> Iterator[Tuple[np.ndarray, List[np.ndarray]]]:
+
+    # dataset is an argument only to stay open while the stream of its layer is read
+    stream = ogr_layer.GetArrowStreamAsNumPy(options=["INCLUDE_FID=YES", "USE_MASKED_ARRAYS=YES"])
+
+    for batch in stream:
+        yield np.asarray(batch[fid_column], dtype=np.int64), [
+            np.ma.filled(np.ma.asarray(batch[field_name]).astype(np.float64), np.nan)
+            for field_name in field_names
+        ]
@@ -0,0 +1,71 @@
+from typing import List, Optional
+
+from qgis.core import (QgsVectorLayer, QgsProviderRegistry, QgsDataSourceUri,
+                       QgsAbstractDatabaseProviderConnection, QgsProviderConnectionException)
+
+from .sql_aggregates import Aggregates, aggregates_sql, aggregates_from_row
+
+# providers of database servers, which calculate aggregates of their tables themselves
+DATABASE_PROVIDERS = ("postgres", "mssql", "oracle", "hana")
+
+
+class DatabaseSource:
+    """
+    Table of a database server (PostgreSQL, MS SQL Server, Oracle, SAP HANA) backing a vector
+    layer, queried through connection of the data provider, so that aggregates are calculated by
+    the server instead of transferring all the values. Queries do not access the layer and may
+    run in another thread.
+    """
+
+    def __init__(self,
+                 connection: QgsAbstractDatabaseProviderConnection,
+                 table: str,
+                 where: str = ""):
+
+        self.connection = connection
+        self.table = table
+        self.where = where
+
+    def columns_aggregates(self, columns: List[str]) -> Optional[List[Aggregates]]:
+        """`Aggregates` of the columns calculated by a single query, None if the query fails."""
+
+        try:
+            rows = self.connection.executeSql(aggregates_sql(self.table, columns, self.where))
+        except QgsProviderConnectionException:
+            return None
+
+        if not rows:
+            return None
+
+        return aggregates_from_row(rows[0], len(columns))
+
+
+def database_source(layer: QgsVectorLayer) -> Optional[DatabaseSource]:
+    """
+    Database table of the layer if it comes from a database server and the table can be queried
+    directly (table, not SQL query, and no unsaved edits), otherwise None. Subset string of such
+    layers is SQL of the database, it is used as condition of the queries.
+    """
+
+    if layer is None or not layer.isValid() or layer.providerType() not in DATABASE_PROVIDERS:
+        return None
+
+    if layer.editBuffer() is not None and layer.editBuffer().isModified():
+        return None
+
+    uri = QgsDataSourceUri(layer.source())
+
+    if not uri.table() or uri.table().startswith("("):
+        return None
+
+    metadata = QgsProviderRegistry.instance().providerMetadata(layer.providerType())
+
+    if metadata is None:
+        return None
+
+    try:
+        connection = metadata.createConnection(layer.source(), {})
+    except QgsProviderConnectionException:
+        return None
+
+    return DatabaseSource(connection, uri.quotedTablename(), layer.subsetString())
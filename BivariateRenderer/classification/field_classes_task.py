@@ -0,0 +1,151 @@
+from typing import Dict, List, Optional
+
+from qgis.core import (QgsTask, QgsVectorLayer, QgsClassificationMethod, QgsClassificationRange)
+
+from .bivariate_statistics import BivariateStatistics, BivariateStatisticsReader
+from .field_statistics import FieldStatistics, FieldStatisticsReader, SamplingError
+from .field_statistics_cache import FieldStatisticsCache
+
+
+class FieldClassesTask(QgsTask):
+    """
+    Background task classifying fields of the layer. Statistics of the fields that are not
+    cached are read in the task, together in a single pass over the layer, results are stored in
+    `FieldStatisticsCache` once the task finishes (in the main thread).
+
+    Two fields are classified as a pair by `BivariateStatisticsReader`, with `count_categories`
+    it also counts features in pairs of classes, which reads the layer once more, so the counts
+    are only calculated on request.
+    """
+
+    classes: Dict[str, List[QgsClassificationRange]]
+
+    def __init__(self,
+                 layer: QgsVectorLayer,
+                 field_names: List[str],
+                 method: QgsClassificationMethod,
+                 number_of_classes: int,
+                 sample_size: int = 0,
+                 count_categories: bool = False):
+
+        self.field_names = list(dict.fromkeys(field_names))
+
+        super().__init__(f"Classifying fields {', '.join(self.field_names)}", QgsTask.CanCancel)
+
+        self.layer = layer
+        self.setDependentLayers([layer])
+
+        self.method = method
+        self.number_of_classes = number_of_classes
+        self.sample_size = sample_size
+
+        self.statistics: Dict[str, FieldStatistics] = {}
+        self._cached_field_names = set()
+
+        self.reader: Optional[FieldStatisticsReader] = None
+        self.bivariate_reader: Optional[BivariateStatisticsReader] = None
+
+        if len(field_names) == 2:
+            self.bivariate_reader = BivariateStatisticsReader(layer, field_names[0],
+                                                              field_names[1], method,
+                                                              number_of_classes, sample_size,
+                                                              count_categories)
+        else:
+            self._init_reader(layer)
+
+        self.classes = {}
+        self.sampling_errors: Dict[str, Optional[SamplingError]] = {}
+        self.bivariate_statistics: Optional[BivariateStatistics] = None
+
+    def _init_reader(self, layer: QgsVectorLayer) -> None:
+
+        for field_name in self.field_names:
+
+            statistics = FieldStatisticsCache().cached(layer, field_name,
+                                                       self.method.valuesRequired(),
+                                                       self.sample_size)
+
+            if statistics is not None:
+                self.statistics[field_name] = statistics
+
+        self._cached_field_names = set(self.statistics)
+
+        missing = [x for x in self.field_names if x not in self._cached_field_names]
+
+        if missing:
+            self.reader = FieldStatisticsReader(layer, missing)
+
+    def run(self) -> bool:
+
+        if self.bivariate_reader is not None:
+            return self._run_bivariate()
+
+        if self.reader is not None and not self._read_statistics():
+            return False
+
+        if self.isCanceled():
+            return False
+
+        for field_name in self.field_names:
+
+            statistics = self.statistics[field_name]
+
+            classes = statistics.classes(self.method, self.number_of_classes)
+
+            if classes is None:
+                return False
+
+            self.set_classes(field_name, statistics, classes)
+
+        return True
+
+    def _run_bivariate(self) -> bool:
+
+        statistics = self.bivariate_reader.read(self.isCanceled)
+
+        if statistics is None:
+            return False
+
+        self.bivariate_statistics = statistics
+
+        field_name_1, field_name_2 = self.bivariate_reader.field_names
+
+        self.set_classes(field_name_1, statistics.statistics_1, statistics.classes_1)
+        self.set_classes(field_name_2, statistics.statistics_2, statistics.classes_2)
+
+        return True
+
+    def set_classes(self, field_name: str, statistics: FieldStatistics,
+                    classes: List[QgsClassificationRange]) -> None:
+
+        self.statistics[field_name] = statistics
+        self.classes[field_name] = classes
+
+        if self.method.valuesRequired():
+            self.sampling_errors[field_name] = statistics.sampling_error(classes)
+
+    def _read_statistics(self) -> bool:
+
+        statistics = self.reader.read(self.method.valuesRequired(), self.isCanceled,
+                                      self.sample_size)
+
+        if statistics is None:
+            return False
+
+        self.statistics.update(zip(self.reader.field_names, statistics))
+
+        return True
+
+    def finished(self, result: bool) -> None:
+
+        if self.bivariate_reader is not None:
+            statistics = self.bivariate_reader.read_statistics
+        else:
+            statistics = {
+                field_name: x
+                for field_name, x in self.statistics.items()
+                if field_name not in self._cached_field_names
+            }
+
+        for field_name, field_statistics in statistics.items():
+            FieldStatisticsCache().store(self.layer, field_name, field_statistics)
@@ -0,0 +1,597 @@
+import math
+import sqlite3
+from dataclasses import dataclass, field, replace
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.core import (QgsVectorLayer, QgsFeatureRequest, QgsClassificationMethod,
+                       QgsClassificationRange, QgsClassificationQuantile,
+                       QgsClassificationJenks, QgsVectorLayerFeatureSource)
+
+from .class_breaks import ClassBreaks
+from .columnar import (arrow_stream_available, ogr_source_uri, ogr_aggregates,
+                       iterate_ogr_numeric_columns)
+from .database_source import database_source
+from .jenks import jenks_breaks
+from .quantile_sketch import KllSketch
+from .sql_aggregates import Aggregates
+from .sqlite_source import SqliteSource, sqlite_source
+
+# sampling is reproducible, same layer gives the same sample
+SAMPLE_SEED = 20220614
+
+# fields with more (not NULL) values are summarized by quantile sketch instead of keeping values
+MAX_VALUES = 10000000
+SKETCH_K = 400
+
+# columns of SQLite databases with more values are not loaded, quantiles are selected by rank
+MAX_LOADED_SQLITE_VALUES = 100000
+
+
+@dataclass(frozen=True, eq=False)
+class FieldStatistics:
+    """
+    Statistics of a numeric field of a layer, from which class breaks of any classification
+    method and any number of classes can be derived without reading the layer again.
+
+    `values` are sorted not NULL values of the field, they are only collected if some method that
+    needs them was requested (min and max are enough for the others). If `sample_size` is set,
+    `values` are a random sample of that size, while the other statistics are still exact. For
+    fields with too many values to keep in memory, only quantile `sketch` is kept instead.
+
+    Large columns of SQLite databases keep only `ranked_source` (table and column), quantiles
+    select just the values at needed ranks in the database, all sorted values are loaded (once)
+    only for methods that need them.
+    """
+
+    count: int
+    null_count: int
+    minimum: Optional[float]
+    maximum: Optional[float]
+    values: Optional[np.ndarray] = None
+    sample_size: int = 0
+    sketch: Optional[KllSketch] = None
+    ranked_source: Optional[Tuple[SqliteSource, str]] = None
+
+    _loaded_values: Dict[str, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+
+    @property
+    def has_values(self) -> bool:
+        return self.values is not None or self.sketch is not None or \
+            self.ranked_source is not None
+
+    def sorted_values(self) -> Optional[np.ndarray]:
+        """Sorted values, loaded from the database (once) if only `ranked_source` is kept."""
+
+        if self.values is not None or self.ranked_source is None:
+            return self.values
+
+        if "values" not in self._loaded_values:
+            source, column = self.ranked_source
+            self._loaded_values["values"] = source.sorted_values(column)
+
+        return self._loaded_values["values"]
+
+    @property
+    def sampled(self) -> bool:
+        return self.sample_size > 0
+
+    def classes(self, method: QgsClassificationMethod,
+                number_of_classes: int) -> Optional[List[QgsClassificationRange]]:
+        """Classes of the field by the method, None if the statistics are not sufficient."""
+
+        if self.count == 0:
+            return []
+
+        if not method.valuesRequired():
+            return method.classes(self.minimum, self.maximum, number_of_classes)
+
+        if isinstance(method, QgsClassificationQuantile):
+
+            if self.values is not None:
+                return ranges_from_breaks(
+                    method, quantile_breaks(self.values.item, len(self.values), number_of_classes))
+
+            if self.sketch is not None:
+                return ranges_from_breaks(
+                    method,
+                    quantile_breaks(self.sketch.value_at_rank, self.count, number_of_classes))
+
+            if self.ranked_source is not None:
+                return self._ranked_quantile_classes(method, number_of_classes)
+
+        if isinstance(method, QgsClassificationJenks):
+
+            if self.sketch is not None:
+                items, cumulative_weights = self.sketch.weighted_items()
+
+                breaks = jenks_breaks(items, number_of_classes,
+                                      np.diff(cumulative_weights, prepend=0))
+
+                # extremes of the sketch are exact, unlike its items
+                breaks[0] = self.minimum
+                breaks[-1] = self.maximum
+
+                return ranges_from_breaks(method, breaks)
+
+        try:
+            values = self.sorted_values()
+        except sqlite3.Error:
+            return None
+
+        if values is None:
+            return None
+
+        if isinstance(method, QgsClassificationJenks):
+            return ranges_from_breaks(method, jenks_breaks(values, number_of_classes))
+
+        return method.classes(values.tolist(), number_of_classes)
+
+    def _ranked_quantile_classes(
+            self, method: QgsClassificationMethod,
+            number_of_classes: int) -> Optional[List[QgsClassificationRange]]:
+
+        source, column = self.ranked_source
+
+        ranks = quantile_ranks(self.count, number_of_classes)
+
+        try:
+            values = dict(zip(ranks, source.values_at_ranks(column, ranks)))
+        except sqlite3.Error:
+            return None
+
+        return ranges_from_breaks(
+            method, quantile_breaks(values.__getitem__, self.count, number_of_classes))
+
+    def sample(self, sample_size: int) -> "FieldStatistics":
+        """
+        Statistics with values reduced to random sample (exact values are sampled again).
+        Statistics with sketch are returned as they are.
+        """
+
+        if self.values is None or self.sampled or sample_size <= 0 or \
+                sample_size >= len(self.values):
+            return self
+
+        collector = FieldValuesCollector(sample_size)
+        collector.add(self.values)
+
+        return replace(collector.statistics(), null_count=self.null_count)
+
+    def sampling_error(self, classes: List[QgsClassificationRange],
+                       confidence: float = 0.95) -> Optional["SamplingError"]:
+        """
+        Class counts estimated from the sample with bound of their difference from the exact
+        counts, None if the values are not sampled.
+        """
+
+        if not self.sampled or not classes:
+            return None
+
+        indices = ClassBreaks(classes).class_indices(self.values)
+        sample_counts = np.bincount(indices, minlength=len(classes))
+
+        scale = self.count / len(self.values)
+
+        # Dvoretzky-Kiefer-Wolfowitz inequality bounds difference of sample and exact cumulative
+        # distribution by epsilon, class count is difference of two of those
+        epsilon = math.sqrt(math.log(2 / (1 - confidence)) / (2 * len(self.values)))
+
+        return SamplingError(sample_size=len(self.values),
+                             count=self.count,
+                             estimated_counts=[int(round(x * scale)) for x in sample_counts],
+                             max_count_error=int(math.ceil(2 * epsilon * self.count)),
+                             confidence=confidence)
+
+    @staticmethod
+    def from_values(values: np.ndarray, sample_size: int = 0) -> "FieldStatistics":
+        """Statistics of values of the field, NULL values are NaN."""
+
+        collector = FieldValuesCollector(sample_size)
+        collector.add(values)
+
+        return collector.statistics()
+
+
+@dataclass(frozen=True)
+class SamplingError:
+    """Class counts estimated from a sample and bound of their error at given confidence."""
+
+    sample_size: int
+    count: int
+    estimated_counts: List[int]
+    max_count_error: int
+    confidence: float
+
+    @property
+    def max_relative_error(self) -> float:
+        return self.max_count_error / max(self.count, 1)
+
+    def __str__(self) -> str:
+        return (f"Classes calculated from sample of {self.sample_size} of {self.count} values. "
+                f"Estimated class counts {self.estimated_counts} differ from exact counts by at "
+                f"most {self.max_count_error} ({self.max_relative_error:.1%}) "
+                f"with {self.confidence:.0%} confidence.")
+
+
+class FieldValuesCollector:
+    """
+    Collects statistics of field values added in chunks. All not NULL values are kept, or if
+    `sample_size` is set, a reproducible uniform random sample of that size (reservoir sampling),
+    so memory does not grow with number of features. Without sampling, once there are more than
+    `max_values` values, they are summarized by quantile sketch instead of being kept. Without
+    `with_values` only count, NULL count, minimum and maximum are collected.
+    """
+
+    def __init__(self,
+                 sample_size: int = 0,
+                 seed: int = SAMPLE_SEED,
+                 max_values: int = MAX_VALUES,
+                 with_values: bool = True):
+
+        self.sample_size = max(sample_size, 0)
+        self.max_values = max_values
+        self.with_values = with_values
+
+        self._sketch: Optional[KllSketch] = None
+        self._seed = seed
+
+        self.count = 0
+        self.null_count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+        self._parts: List[np.ndarray] = []
+        self._reservoir = np.empty(self.sample_size, dtype=np.float64)
+        self._random = np.random.default_rng(seed)
+
+    def add(self, values: np.ndarray) -> None:
+        """Adds values, NULL values are NaN."""
+
+        values = np.asarray(values, dtype=np.float64)
+
+        not_null = values[~np.isnan(values)]
+
+        self.null_count += len(values) - len(not_null)
+
+        if len(not_null) == 0:
+            return
+
+        self.minimum = min(self.minimum, float(not_null.min()))
+        self.maximum = max(self.maximum, float(not_null.max()))
+
+        if not self.with_values:
+            self.count += len(not_null)
+            return
+
+        if self.sample_size == 0:
+
+            self.count += len(not_null)
+
+            if self._sketch is not None:
+                self._sketch.update(not_null)
+                return
+
+            self._parts.append(not_null)
+
+            if self.count > self.max_values:
+
+                self._sketch = KllSketch(SKETCH_K, self._seed)
+
+                for part in self._parts:
+                    self._sketch.update(part)
+
+                self._parts = []
+
+            return
+
+        # fill the reservoir first
+        missing = max(self.sample_size - self.count, 0)
+
+        if missing:
+            filled = not_null[:missing]
+            self._reservoir[self.count:self.count + len(filled)] = filled
+            self.count += len(filled)
+            not_null = not_null[len(filled):]
+
+        if len(not_null) == 0:
+            return
+
+        # item with index t (from 0) replaces random item of the reservoir with probability k/(t+1)
+        positions = self.count + np.arange(len(not_null))
+        replaced = np.floor(self._random.random(len(not_null)) * (positions + 1)).astype(np.int64)
+
+        selected = replaced < self.sample_size
+
+        self._reservoir[replaced[selected]] = not_null[selected]
+
+        self.count += len(not_null)
+
+    def statistics(self) -> FieldStatistics:
+
+        if not self.with_values:
+            return FieldStatistics(count=self.count,
+                                   null_count=self.null_count,
+                                   minimum=self.minimum if self.count else None,
+                                   maximum=self.maximum if self.count else None)
+
+        if self._sketch is not None:
+            return FieldStatistics(count=self.count,
+                                   null_count=self.null_count,
+                                   minimum=self.minimum,
+                                   maximum=self.maximum,
+                                   sketch=self._sketch)
+
+        if self.sample_size and self.count > self.sample_size:
+            values = np.sort(self._reservoir)
+            sample_size = self.sample_size
+        else:
+            if self.sample_size:
+                values = np.sort(self._reservoir[:self.count])
+            elif self._parts:
+                values = np.sort(np.concatenate(self._parts))
+            else:
+                values = np.empty(0, dtype=np.float64)
+            sample_size = 0
+
+        return FieldStatistics(count=self.count,
+                               null_count=self.null_count,
+                               minimum=self.minimum if self.count else None,
+                               maximum=self.maximum if self.count else None,
+                               values=values,
+                               sample_size=sample_size)
+
+
+def calculate_field_statistics(layer: QgsVectorLayer,
+                               field_name: str,
+                               with_values: bool,
+                               sample_size: int = 0) -> FieldStatistics:
+    """Reads statistics of the field from the layer, see `FieldStatisticsReader`."""
+
+    return calculate_fields_statistics(layer, [field_name], with_values, sample_size)[0]
+
+
+def calculate_fields_statistics(layer: QgsVectorLayer,
+                                field_names: List[str],
+                                with_values: bool,
+                                sample_size: int = 0) -> List[FieldStatistics]:
+    """Reads statistics of the fields from the layer together, see `FieldStatisticsReader`."""
+
+    return FieldStatisticsReader(layer, field_names).read(with_values, sample_size=sample_size)
+
+
+class FieldStatisticsReader:
+    """
+    Reader of statistics of fields of a layer, all the fields are read together. If values are
+    not needed, count, minimum and maximum are aggregated by the data source whenever it can do
+    that (SQL of SQLite databases and database servers, OGR SQL), otherwise the fields are read
+    in a single attribute-only pass. For layers stored in SQLite databases values are sorted by
+    SQL queries, OGR layers are read as columns if possible, otherwise features are iterated.
+
+    It is created from the layer in the main thread, reading does not access the layer itself,
+    so it can run in a background task.
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, layer: QgsVectorLayer, field_names: List[str]):
+
+        self.field_names = list(field_names)
+        self.field_indices = [layer.fields().lookupField(x) for x in self.field_names]
+
+        self.sqlite_source = sqlite_source(layer)
+        self.database_source = database_source(layer)
+        self.ogr_uri = ogr_source_uri(layer)
+
+        # fallback if the data source cannot be read directly
+        self.feature_source = QgsVectorLayerFeatureSource(layer)
+
+    def read(self,
+             with_values: bool,
+             is_canceled: Callable[[], bool] = lambda: False,
+             sample_size: int = 0) -> Optional[List[FieldStatistics]]:
+        """
+        Statistics of the fields (in order of field names), None if reading was canceled. With
+        `sample_size` only random sample of that size is kept as values.
+        """
+
+        if self.sqlite_source is not None:
+
+            statistics = self._read_sqlite(with_values, is_canceled, sample_size)
+
+            if statistics is not None or is_canceled():
+                return statistics
+
+        if not with_values:
+
+            aggregates = self._aggregates()
+
+            if aggregates is not None:
+                return [FieldStatistics(*field_aggregates) for field_aggregates in aggregates]
+
+        collectors = [
+            FieldValuesCollector(sample_size, with_values=with_values) for _ in self.field_names
+        ]
+
+        for columns in self.column_chunks():
+
+            if is_canceled():
+                return None
+
+            for collector, values in zip(collectors, columns):
+                collector.add(values)
+
+        return [collector.statistics() for collector in collectors]
+
+    def column_chunks(self) -> Iterator[List[np.ndarray]]:
+        """
+        Values of the fields in chunks (NULL values are NaN), chunks of all the fields hold values
+        of the same features. OGR layers are read as columns using GDAL Arrow stream if possible,
+        otherwise features are iterated without geometries.
+        """
+
+        if self.ogr_uri is not None and arrow_stream_available():
+
+            batches = iterate_ogr_numeric_columns(self.ogr_uri, self.field_names)
+
+            if batches is not None:
+
+                for _, columns in batches:
+                    yield columns
+
+                return
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(self.field_indices)
+
+        columns = [array("d") for _ in self.field_indices]
+
+        for feature in self.feature_source.getFeatures(request):
+
+            for column, field_index in zip(columns, self.field_indices):
+                column.append(float_or_nan(feature.attribute(field_index)))
+
+            if len(columns[0]) == self.chunk_size:
+                yield [np.frombuffer(column, dtype=np.float64) for column in columns]
+                columns = [array("d") for _ in self.field_indices]
+
+        yield [np.frombuffer(column, dtype=np.float64) for column in columns]
+
+    def _aggregates(self) -> Optional[List[Aggregates]]:
+        """Aggregates calculated by database server or GDAL, None if that is not possible."""
+
+        if self.database_source is not None:
+
+            aggregates = self.database_source.columns_aggregates(self.field_names)
+
+            if aggregates is not None:
+                return aggregates
+
+        if self.ogr_uri is not None:
+            return ogr_aggregates(self.ogr_uri, self.field_names)
+
+        return None
+
+    def _read_sqlite(self, with_values: bool, is_canceled: Callable[[], bool],
+                     sample_size: int) -> Optional[List[FieldStatistics]]:
+
+        try:
+
+            if not all(self.sqlite_source.has_column(x) for x in self.field_names):
+                return None
+
+            statistics = [
+                FieldStatistics(*field_aggregates)
+                for field_aggregates in self.sqlite_source.columns_aggregates(self.field_names)
+            ]
+
+            if not with_values:
+                return statistics
+
+            for i, field_name in enumerate(self.field_names):
+
+                if sample_size == 0 and statistics[i].count <= MAX_LOADED_SQLITE_VALUES:
+                    statistics[i] = replace(
+                        statistics[i], values=self.sqlite_source.sorted_values(field_name))
+                    continue
+
+                # values stay in the database, quantiles select only the values at needed ranks
+                if sample_size == 0:
+                    statistics[i] = replace(statistics[i],
+                                            ranked_source=(self.sqlite_source, field_name))
+                    continue
+
+                # stream values into sample
+                collector = FieldValuesCollector(sample_size)
+
+                for chunk in self.sqlite_source.iterate_values(field_name):
+
+                    if is_canceled():
+                        return None
+
+                    collector.add(chunk)
+
+                statistics[i] = replace(collector.statistics(),
+                                        null_count=statistics[i].null_count)
+
+            return statistics
+
+        except sqlite3.Error:
+            return None
+
+
+def float_or_nan(value: Any) -> float:
+    """Value as float, NaN for NULL and values that are not numbers."""
+
+    if value is None:
+        return np.nan
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def quantile_ranks(count: int, number_of_classes: int) -> List[int]:
+    """Positions of sorted values needed by `quantile_breaks`."""
+
+    ranks = {0, count - 1}
+
+    if count > 1:
+        for i in range(1, number_of_classes):
+            position = int((i / number_of_classes) * (count - 1))
+            ranks.update([position, min(position + 1, count - 1)])
+
+    return sorted(ranks)
+
+
+def quantile_breaks(value_at, count: int, number_of_classes: int) -> List[float]:
+    """
+    Lower bound of the first class and upper bounds of all classes, calculated from sorted values
+    (accessed by position) the same way as `QgsClassificationQuantile` does.
+    """
+
+    breaks = [value_at(0)]
+
+    quantile = value_at(0)
+
+    for i in range(1, number_of_classes):
+
+        if count > 1:
+            a = (i / number_of_classes) * (count - 1)
+            aa = int(a)
+            r = a - aa
+            quantile = (1 - r) * value_at(aa) + r * value_at(min(aa + 1, count - 1))
+
+        breaks.append(quantile)
+
+    breaks.append(value_at(count - 1))
+
+    return breaks
+
+
+def ranges_from_breaks(method: QgsClassificationMethod,
+                       breaks: List[float]) -> List[QgsClassificationRange]:
+    """Classes between consecutive breaks, labeled by the classification method."""
+
+    classes = []
+
+    number_of_classes = len(breaks) - 1
+
+    for i in range(number_of_classes):
+
+        if i == 0:
+            position = QgsClassificationMethod.LowerBound
+        elif i == number_of_classes - 1:
+            position = QgsClassificationMethod.UpperBound
+        else:
+            position = QgsClassificationMethod.Inner
+
+        label = method.labelForRange(breaks[i], breaks[i + 1], position)
+
+        classes.append(QgsClassificationRange(label, breaks[i], breaks[i + 1]))
+
+    return classes
@@ -0,0 +1,119 @@
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from qgis.core import QgsVectorLayer
+
+from ..utils import Singleton
+from .field_statistics import FieldStatistics, calculate_fields_statistics
+
+
+class FieldStatisticsCache(metaclass=Singleton):
+    """
+    Plugin-wide cache of `FieldStatistics` per layer and field, shared by the renderer widget and
+    processing tools. Statistics of a layer are dropped when its data (including the edit buffer),
+    fields or subset string change, or when the layer is deleted.
+    """
+
+    def __init__(self):
+
+        self._statistics: Dict[Tuple[str, str], FieldStatistics] = {}
+        self._connected_layers: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def statistics(self,
+                   layer: QgsVectorLayer,
+                   field_name: str,
+                   with_values: bool = False,
+                   sample_size: int = 0) -> FieldStatistics:
+        """Statistics of the field, read from the layer only if not cached yet."""
+
+        return self.fields_statistics(layer, [field_name], with_values, sample_size)[0]
+
+    def fields_statistics(self,
+                          layer: QgsVectorLayer,
+                          field_names: List[str],
+                          with_values: bool = False,
+                          sample_size: int = 0) -> List[FieldStatistics]:
+        """
+        Statistics of the fields, those that are not cached yet are read from the layer together
+        in a single pass.
+        """
+
+        statistics = {
+            field_name: self.cached(layer, field_name, with_values, sample_size)
+            for field_name in field_names
+        }
+
+        missing = [field_name for field_name, x in statistics.items() if x is None]
+
+        if missing:
+
+            for field_name, field_statistics in zip(
+                    missing, calculate_fields_statistics(layer, missing, with_values,
+                                                         sample_size)):
+
+                self.store(layer, field_name, field_statistics)
+
+                statistics[field_name] = field_statistics
+
+        return [statistics[field_name] for field_name in field_names]
+
+    def cached(self,
+               layer: QgsVectorLayer,
+               field_name: str,
+               with_values: bool = False,
+               sample_size: int = 0) -> Optional[FieldStatistics]:
+        """
+        Cached statistics sufficient for the request, or None. Values sampled with different
+        sample size (or sampled values if all values are requested) are not sufficient, all values
+        are sampled if sample is requested.
+        """
+
+        with self._lock:
+            statistics = self._statistics.get((layer.id(), field_name))
+
+        if statistics is None or not with_values:
+            return statistics
+
+        if not statistics.has_values:
+            return None
+
+        if statistics.sampled and statistics.sample_size != sample_size:
+            return None
+
+        # sample cannot be taken from sketch
+        if sample_size and statistics.values is None:
+            return None
+
+        return statistics.sample(sample_size)
+
+    def store(self, layer: QgsVectorLayer, field_name: str, statistics: FieldStatistics) -> None:
+
+        layer_id = layer.id()
+
+        with self._lock:
+
+            self._statistics[(layer_id, field_name)] = statistics
+
+            connect = layer_id not in self._connected_layers
+            self._connected_layers.add(layer_id)
+
+        if connect:
+            layer.dataChanged.connect(lambda: self.invalidate(layer_id))
+            layer.layerModified.connect(lambda: self.invalidate(layer_id))
+            layer.afterRollBack.connect(lambda: self.invalidate(layer_id))
+            layer.updatedFields.connect(lambda: self.invalidate(layer_id))
+            layer.subsetStringChanged.connect(lambda: self.invalidate(layer_id))
+            layer.willBeDeleted.connect(lambda: self.invalidate(layer_id))
+
+    def invalidate(self, layer_id: Optional[str] = None) -> None:
+        """Drops cached statistics of the layer, or of all layers if no id is given."""
+
+        with self._lock:
+
+            if layer_id is None:
+                self._statistics.clear()
+                return
+
+            for key in [key for key in self._statistics if key[0] == layer_id]:
+                del self._statistics[key]
@@ -0,0 +1,144 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+def jenks_breaks(values: np.ndarray,
+                 number_of_classes: int,
+                 weights: Optional[np.ndarray] = None) -> List[float]:
+    """
+    Exact Jenks natural breaks (optimal 1-D k-means, minimal weighted sum of squared deviations
+    from class means) of the values. Returns lower bound of the first class and upper bounds of
+    all classes, as `QgsClassificationJenks` does.
+
+    Works on sorted unique values with weights (number of occurrences, or weights of sketch
+    items). The dynamic programming uses divide and conquer over monotone optimal split points,
+    O(k * n log n) for n unique values, with all splits on the same recursion level evaluated at
+    once by NumPy.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+
+    if weights is None:
+        weights = np.ones(len(values), dtype=np.float64)
+
+    not_nan = ~np.isnan(values)
+
+    unique_values, inverse = np.unique(values[not_nan], return_inverse=True)
+    unique_weights = np.bincount(inverse, weights=np.asarray(weights, dtype=np.float64)[not_nan])
+
+    if len(unique_values) == 0:
+        return []
+
+    if len(unique_values) <= number_of_classes:
+        # every value is its own class
+        return [float(unique_values[0])] + unique_values.tolist()
+
+    ends = optimal_class_ends(unique_values, unique_weights, number_of_classes)
+
+    return [float(unique_values[0])] + [float(unique_values[end - 1]) for end in ends]
+
+
+def optimal_class_ends(values: np.ndarray, weights: np.ndarray,
+                       number_of_classes: int) -> List[int]:
+    """
+    Exclusive end positions of classes of sorted unique `values` minimizing the total weighted
+    within class sum of squared deviations.
+    """
+
+    n = len(values)
+
+    # centered values limit cancellation in the prefix sums
+    centered = values - np.average(values, weights=weights)
+
+    cumulative_weights = np.concatenate([[0.0], np.cumsum(weights)])
+    cumulative_sums = np.concatenate([[0.0], np.cumsum(weights * centered)])
+    cumulative_squares = np.concatenate([[0.0], np.cumsum(weights * centered * centered)])
+
+    def cost(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+        """Weighted sum of squared deviations of values[start:end] from their mean."""
+
+        weight = cumulative_weights[end] - cumulative_weights[start]
+        total = cumulative_sums[end] - cumulative_sums[start]
+
+        return np.maximum(
+            cumulative_squares[end] - cumulative_squares[start] - total * total / weight, 0)
+
+    ends = np.arange(n + 1)
+
+    # costs[i] - minimal cost of classifying first i values into current number of classes
+    costs = np.full(n + 1, np.inf)
+    costs[1:] = cost(np.zeros(n, dtype=np.int64), ends[1:])
+
+    splits = []
+
+    for classes in range(2, number_of_classes + 1):
+
+        new_costs, split = _next_level(costs, cost, classes, n)
+
+        costs = new_costs
+        splits.append(split)
+
+    # backtrack class ends from the last class
+    class_ends = [n]
+
+    for split in reversed(splits):
+        class_ends.append(int(split[class_ends[-1]]))
+
+    return list(reversed(class_ends))
+
+
+def _next_level(previous_costs: np.ndarray, cost, classes: int, n: int):
+    """
+    Costs of classifying first i values into `classes` classes (i >= classes) and start of the
+    last class for each i. Optimal start is non-decreasing in i, so the i values are processed
+    by divide and conquer, each recursion level as one vectorized step.
+    """
+
+    costs = np.full(n + 1, np.inf)
+    split = np.zeros(n + 1, dtype=np.int64)
+
+    # segments of i (inclusive) with allowed range of the split (inclusive)
+    lows = np.array([classes])
+    highs = np.array([n])
+    split_lows = np.array([classes - 1])
+    split_highs = np.array([n - 1])
+
+    while len(lows):
+
+        middles = (lows + highs) // 2
+
+        candidate_highs = np.minimum(split_highs, middles - 1)
+        lengths = candidate_highs - split_lows + 1
+
+        segment_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        segment_ids = np.repeat(np.arange(len(lows)), lengths)
+
+        starts = np.arange(lengths.sum()) - segment_starts[segment_ids] + split_lows[segment_ids]
+
+        candidate_costs = previous_costs[starts] + cost(starts, middles[segment_ids])
+
+        minimal_costs = np.minimum.reduceat(candidate_costs, segment_starts)
+
+        # first position of the minimum in each segment
+        is_minimal = np.flatnonzero(candidate_costs == minimal_costs[segment_ids])
+        first = is_minimal[np.concatenate(
+            [[True], segment_ids[is_minimal][1:] != segment_ids[is_minimal][:-1]])]
+
+        best_splits = starts[first]
+
+        costs[middles] = minimal_costs
+        split[middles] = best_splits
+
+        left = lows <= middles - 1
+        right = middles + 1 <= highs
+
+        lows, highs, split_lows, split_highs = (
+            np.concatenate([lows[left], middles[right] + 1]),
+            np.concatenate([middles[left] - 1, highs[right]]),
+            np.concatenate([split_lows[left], best_splits[right]]),
+            np.concatenate([best_splits[left], split_highs[right]]),
+        )
+
+    return costs, split
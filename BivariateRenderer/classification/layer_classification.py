@@ -0,0 +1,33 @@
+from typing import List
+
+from qgis.core import QgsVectorLayer, QgsClassificationMethod, QgsClassificationRange
+
+from .field_statistics_cache import FieldStatisticsCache
+
+
+def field_classes(layer: QgsVectorLayer,
+                  field_name: str,
+                  method: QgsClassificationMethod,
+                  number_of_classes: int,
+                  sample_size: int = 0) -> List[QgsClassificationRange]:
+    """
+    Classes of the field calculated by the classification method from cached statistics of the
+    field (see `FieldStatisticsCache`), so changing method or number of classes does not read the
+    layer again. Expressions instead of field names are classified by the method itself.
+
+    With `sample_size` methods that need all values of the field use only a random sample of them
+    instead, see `FieldStatistics.sampling_error` for the resulting error.
+    """
+
+    if layer.fields().lookupField(field_name) < 0:
+        return method.classes(layer, field_name, number_of_classes)
+
+    statistics = FieldStatisticsCache().statistics(layer, field_name, method.valuesRequired(),
+                                                   sample_size)
+
+    classes = statistics.classes(method, number_of_classes)
+
+    if classes is None:
+        return method.classes(layer, field_name, number_of_classes)
+
+    return classes
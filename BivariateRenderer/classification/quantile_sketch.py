@@ -0,0 +1,144 @@
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class KllSketch:
+    """
+    Streaming quantile sketch (Karnin, Lang, Liberty: Optimal Quantile Approximation in Streams)
+    keeping a fixed amount of items regardless of the number of values added. Values are kept in
+    levels of compactors, item on level `h` represents `2^h` values. A full level is sorted and
+    every other item (random offset) is promoted to the next level.
+
+    Count, minimum and maximum are exact. Rank error of quantiles is roughly `1.7 / k` of the
+    count with high probability. Sketches with the same `k` can be merged, the merged sketch has
+    the same error guarantee as sketch of all the values together. While fewer than about `k`
+    values are added, no compaction happens and quantiles are exact.
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+
+        self.k = k
+
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+        self._levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._random = np.random.default_rng(seed)
+        self._weighted_items: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def number_of_items(self) -> int:
+        """Number of items stored in the sketch."""
+        return sum(len(level) for level in self._levels)
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds values to the sketch, NaN values are ignored."""
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+        self._levels[0] = np.concatenate([self._levels[0], values])
+
+        self._compress()
+
+    def merge(self, other: "KllSketch") -> None:
+        """Adds all values summarized by other sketch to this sketch."""
+
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged.")
+
+        if other.count == 0:
+            return
+
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0, dtype=np.float64))
+
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+        self._compress()
+
+    def value_at_rank(self, rank: int) -> float:
+        """Approximate value at position `rank` (from 0) of all values sorted ascending."""
+
+        if self.count == 0:
+            raise ValueError("Sketch is empty.")
+
+        if rank <= 0:
+            return self.minimum
+
+        if rank >= self.count - 1:
+            return self.maximum
+
+        items, cumulative_weights = self.weighted_items()
+
+        index = int(np.searchsorted(cumulative_weights, rank, side="right"))
+
+        return float(items[min(index, len(items) - 1)])
+
+    def quantile(self, q: float) -> float:
+        return self.value_at_rank(int(round(q * (self.count - 1))))
+
+    def weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted items of the sketch and cumulative sum of their weights."""
+
+        if self._weighted_items is None:
+
+            items = np.concatenate(self._levels)
+            weights = np.concatenate([
+                np.full(len(level), 2**h, dtype=np.int64) for h, level in enumerate(self._levels)
+            ])
+
+            order = np.argsort(items, kind="stable")
+
+            self._weighted_items = (items[order], np.cumsum(weights[order]))
+
+        return self._weighted_items
+
+    def _capacity(self, level: int) -> int:
+
+        depth = len(self._levels) - level - 1
+
+        return max(int(math.ceil(self.k * (2 / 3)**depth)), 2)
+
+    def _compress(self) -> None:
+
+        self._weighted_items = None
+
+        while self.number_of_items > sum(self._capacity(h) for h in range(len(self._levels))):
+
+            for level in range(len(self._levels)):
+
+                if len(self._levels[level]) >= self._capacity(level):
+                    self._compact(level)
+                    break
+
+    def _compact(self, level: int) -> None:
+
+        if level + 1 == len(self._levels):
+            self._levels.append(np.empty(0, dtype=np.float64))
+
+        items = np.sort(self._levels[level])
+
+        # with odd number of items one stays on the level, so that total weight is preserved
+        kept = items[:len(items) % 2]
+        items = items[len(kept):]
+
+        promoted = items[int(self._random.integers(2))::2]
+
+        self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+        self._levels[level] = kept
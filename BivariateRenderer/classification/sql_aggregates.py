@@ -0,0 +1,46 @@
+from typing import List, Optional, Sequence, Tuple
+
+# number of not NULL values, number of NULL values, minimum and maximum of a column
+Aggregates = Tuple[int, int, Optional[float], Optional[float]]
+
+
+def quoted_identifier(identifier: str) -> str:
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def aggregates_sql(table: str, columns: List[str], where: str = "") -> str:
+    """
+    Query of `Aggregates` of all columns in a single pass over the (already quoted) table, the
+    columns are quoted. Result is one row, see `aggregates_from_row`.
+    """
+
+    expressions = ["COUNT(*)"]
+
+    for column in columns:
+        column = quoted_identifier(column)
+        expressions.extend([f"COUNT({column})", f"MIN({column})", f"MAX({column})"])
+
+    sql = f"SELECT {', '.join(expressions)} FROM {table}"
+
+    if where:
+        sql += f" WHERE ({where})"
+
+    return sql
+
+
+def aggregates_from_row(row: Sequence, number_of_columns: int) -> List[Aggregates]:
+    """`Aggregates` of each column from result row of `aggregates_sql`."""
+
+    total = int(row[0])
+
+    aggregates = []
+
+    for i in range(number_of_columns):
+
+        count, minimum, maximum = row[1 + 3 * i:4 + 3 * i]
+
+        aggregates.append((int(count), total - int(count),
+                           None if minimum is None else float(minimum),
+                           None if maximum is None else float(maximum)))
+
+    return aggregates
@@ -0,0 +1,245 @@
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.core import QgsVectorLayer, QgsProviderRegistry, QgsDataSourceUri
+
+from .class_breaks import ClassBreaks
+from .sql_aggregates import Aggregates, aggregates_sql, aggregates_from_row, quoted_identifier
+
+SQLITE_SUFFIXES = (".gpkg", ".sqlite", ".db", ".spatialite")
+
+# functions referenced by spatial index triggers of GeoPackage, the triggers only call them when
+# geometry or feature id changes, which attribute updates never do
+GPKG_TRIGGER_FUNCTIONS = ("ST_IsEmpty", "ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY")
+
+
+def _geometry_function_not_available(*args) -> None:
+    raise sqlite3.NotSupportedError("Geometry functions are not available.")
+
+
+class SqliteSource:
+    """
+    Table of GeoPackage or SpatiaLite database backing a vector layer, queried directly with
+    `sqlite3`, so that aggregates over columns are calculated by the database instead of
+    iterating features in Python.
+    """
+
+    def __init__(self, path: str, table: str):
+
+        self.path = path
+        self.table = table
+
+    @contextmanager
+    def connect(self, read_only: bool = True) -> Iterator[sqlite3.Connection]:
+        """Connection to the database, changes are committed on exit, connection is closed."""
+
+        mode = "ro" if read_only else "rw"
+
+        connection = sqlite3.connect(f"{Path(self.path).absolute().as_uri()}?mode={mode}",
+                                     uri=True)
+
+        if not read_only:
+            for function_name in GPKG_TRIGGER_FUNCTIONS:
+                connection.create_function(function_name, -1, _geometry_function_not_available)
+
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def quoted(identifier: str) -> str:
+        return quoted_identifier(identifier)
+
+    def has_column(self, column: str) -> bool:
+
+        with self.connect() as connection:
+            columns = connection.execute(
+                f"PRAGMA table_info({self.quoted(self.table)})").fetchall()
+
+        return column in [x[1] for x in columns]
+
+    def aggregates(self, column: str) -> Aggregates:
+        """Number of not NULL values, number of NULL values, minimum and maximum of the column."""
+        return self.columns_aggregates([column])[0]
+
+    def columns_aggregates(self, columns: List[str]) -> List[Aggregates]:
+        """`aggregates` of all the columns, calculated by a single query."""
+
+        with self.connect() as connection:
+            row = connection.execute(aggregates_sql(self.quoted(self.table), columns)).fetchone()
+
+        return aggregates_from_row(row, len(columns))
+
+    def sorted_values(self, column: str) -> np.ndarray:
+        """Not NULL values of the column, sorted by the database."""
+
+        column = self.quoted(column)
+
+        with self.connect() as connection:
+            rows = connection.execute(f"SELECT {column} FROM {self.quoted(self.table)} "
+                                      f"WHERE {column} IS NOT NULL ORDER BY {column}")
+
+            return np.fromiter((row[0] for row in rows), dtype=np.float64)
+
+    def values_at_ranks(self, column: str, ranks: List[int]) -> List[float]:
+        """
+        Values of the column at given positions (from 0) of not NULL values sorted ascending,
+        selected by ordered window query, so only these values leave the database.
+        """
+
+        column = self.quoted(column)
+
+        unique_ranks = sorted(set(ranks))
+
+        with self.connect() as connection:
+            rows = connection.execute(
+                f"SELECT rank, value FROM ("
+                f"SELECT {column} AS value, ROW_NUMBER() OVER (ORDER BY {column}) - 1 AS rank "
+                f"FROM {self.quoted(self.table)} WHERE {column} IS NOT NULL) "
+                f"WHERE rank IN ({', '.join('?' * len(unique_ranks))})", unique_ranks).fetchall()
+
+        values = {rank: float(value) for rank, value in rows}
+
+        return [values[rank] for rank in ranks]
+
+    def iterate_values(self, column: str, chunk_size: int = 65536) -> Iterator[np.ndarray]:
+        """Not NULL values of the column in chunks, in storage order."""
+
+        column = self.quoted(column)
+
+        with self.connect() as connection:
+
+            cursor = connection.execute(
+                f"SELECT {column} FROM {self.quoted(self.table)} WHERE {column} IS NOT NULL")
+
+            while True:
+
+                rows = cursor.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                yield np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+
+    def update_categories(self, result_column: str, column_1: str, breaks_1: ClassBreaks,
+                          column_2: str, breaks_2: ClassBreaks) -> int:
+        """
+        Sets result column of all rows to 1-based class pair `i-j` (NULL if any of the values is
+        NULL) in a single UPDATE statement. Returns number of updated rows.
+        """
+
+        case_1, parameters_1 = self.class_index_case(column_1, breaks_1)
+        case_2, parameters_2 = self.class_index_case(column_2, breaks_2)
+
+        with self.connect(read_only=False) as connection:
+            cursor = connection.execute(
+                f"UPDATE {self.quoted(self.table)} "
+                f"SET {self.quoted(result_column)} = {case_1} || '-' || {case_2}",
+                parameters_1 + parameters_2)
+
+        return cursor.rowcount
+
+    def class_pair_counts(self, column_1: str, breaks_1: ClassBreaks, column_2: str,
+                          breaks_2: ClassBreaks) -> np.ndarray:
+        """
+        Numbers of rows in pairs of classes (rows are classes of column 1), counted by a single
+        GROUP BY query over the same expressions as `update_categories`. Rows with NULL in any of
+        the columns are not counted.
+        """
+
+        counts = np.zeros((len(breaks_1), len(breaks_2)), dtype=np.int64)
+
+        if counts.size == 0:
+            return counts
+
+        case_1, parameters_1 = self.class_index_case(column_1, breaks_1)
+        case_2, parameters_2 = self.class_index_case(column_2, breaks_2)
+
+        with self.connect() as connection:
+            rows = connection.execute(
+                f"SELECT {case_1}, {case_2}, COUNT(*) FROM {self.quoted(self.table)} "
+                f"WHERE {self.quoted(column_1)} IS NOT NULL AND "
+                f"{self.quoted(column_2)} IS NOT NULL GROUP BY 1, 2",
+                parameters_1 + parameters_2).fetchall()
+
+        for class_1, class_2, count in rows:
+            counts[int(class_1) - 1, int(class_2) - 1] = count
+
+        return counts
+
+    def class_index_case(self, column: str, breaks: ClassBreaks) -> Tuple[str, List[float]]:
+        """SQL expression (with parameters) of 1-based class index as text, see `ClassBreaks`."""
+
+        column = self.quoted(column)
+
+        conditions = [f"WHEN {column} IS NULL THEN NULL"]
+        parameters = []
+
+        for i, break_value in enumerate(breaks.breaks[1:-1]):
+            conditions.append(f"WHEN {column} < ? THEN '{i + 1}'")
+            parameters.append(break_value)
+
+        return f"(CASE {' '.join(conditions)} ELSE '{len(breaks)}' END)", parameters
+
+
+def sqlite_source(layer: QgsVectorLayer) -> Optional[SqliteSource]:
+    """
+    SQLite table of the layer if it comes from GeoPackage or SpatiaLite and the database can be
+    queried directly (no subset string, no unsaved edits), otherwise None.
+    """
+
+    if layer is None or not layer.isValid() or layer.subsetString():
+        return None
+
+    if layer.editBuffer() is not None and layer.editBuffer().isModified():
+        return None
+
+    if layer.providerType() == "spatialite":
+
+        uri = QgsDataSourceUri(layer.source())
+
+        path = uri.database()
+        table = uri.table()
+
+    elif layer.providerType() == "ogr":
+
+        uri = QgsProviderRegistry.instance().decodeUri("ogr", layer.source())
+
+        path = uri.get("path", "")
+        table = uri.get("layerName")
+
+        if not path.lower().endswith(SQLITE_SUFFIXES) or uri.get("layerId") is not None:
+            return None
+
+        if not table:
+            table = single_feature_table(path)
+
+    else:
+        return None
+
+    if not path or not table or not Path(path).is_file():
+        return None
+
+    return SqliteSource(path, table)
+
+
+def single_feature_table(path: str) -> Optional[str]:
+    """Name of the only features table of GeoPackage, if there is exactly one."""
+
+    try:
+        with SqliteSource(path, "").connect() as connection:
+            tables = connection.execute(
+                "SELECT table_name FROM gpkg_contents WHERE data_type = 'features'").fetchall()
+    except sqlite3.Error:
+        return None
+
+    if len(tables) != 1:
+        return None
+
+    return tables[0][0]
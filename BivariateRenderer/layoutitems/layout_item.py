@@ -10,6 +10,7 @@ from qgis.core import (QgsLayoutItem, QgsLayout, QgsLayoutItemAbstractMetadata,
 from ..text_constants import Texts, IDS
 from ..utils import default_line_symbol, get_icon
 from ..renderer.bivariate_renderer import BivariateRenderer
+from ..classification.bivariate_statistics import BivariateStatistics, classify_and_count
 
 from ..legendrenderer.legend_renderer import LegendRenderer
 
@@ -350,6 +351,25 @@ class BivariateRendererLayoutItem(QgsLayoutItem):
 
         return None
 
+    def bivariate_statistics(self) -> Optional[BivariateStatistics]:
+        """
+        Numbers of features of the linked layer in categories of the legend (by class breaks of
+        its renderer) with NULL counts of both fields. None if the layer does not use bivariate
+        renderer.
+        """
+
+        if self.layer is None or not isinstance(self.renderer, BivariateRenderer):
+            return None
+
+        if not self.renderer.field_name_1 or not self.renderer.field_name_2:
+            return None
+
+        return classify_and_count(self.layer,
+                                  self.renderer.field_name_1,
+                                  self.renderer.field_name_2,
+                                  classes=(self.renderer.field_1_classes,
+                                           self.renderer.field_2_classes))
+
     @property
     def linked_layer_name(self):
 
@@ -1,16 +1,24 @@
 from __future__ import annotations
-from typing import List, Dict
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass, replace
+import time
+
+import numpy as np
 
 from PyQt5.QtGui import QColor
 from PyQt5.QtXml import QDomDocument, QDomElement
 
 from qgis.core import (QgsFeatureRenderer, QgsClassificationRange, QgsFeature, QgsColorRamp,
-                       QgsFillSymbol, QgsSymbolLayerUtils)
+                       QgsFillSymbol, QgsSymbolLayerUtils, QgsCategorizedSymbolRenderer,
+                       QgsRendererCategory, QgsExpression)
 
 from ..text_constants import Texts
 from ..colormixing.color_mixing_methods_register import ColorMixingMethodsRegister
 from ..colormixing.color_mixing_method import ColorMixingMethod, ColorMixingMethodDarken
+from ..classification.class_breaks import ClassBreaks
+from .feature_class_cache import FeatureClassCache, FeatureClassCacheConfig
+from .render_statistics import RenderStatistics, RenderStatisticsCollector
+from ..utils import log
 
 
 class BivariateRenderer(QgsFeatureRenderer):
@@ -23,6 +31,8 @@ class BivariateRenderer(QgsFeatureRenderer):
     field_name_2: str
     field_1_classes: List[QgsClassificationRange]
     field_2_classes: List[QgsClassificationRange]
+    field_1_breaks: ClassBreaks
+    field_2_breaks: ClassBreaks
     field_1_labels: List[float]
     field_2_labels: List[float]
     field_1_min: float
@@ -32,6 +42,19 @@ class BivariateRenderer(QgsFeatureRenderer):
 
     color_mixing_method: ColorMixingMethod
 
+    native_rendering: bool
+
+    use_feature_cache: bool
+    feature_cache: Optional[FeatureClassCache]
+
+    statistics_collector: Optional[RenderStatisticsCollector]
+
+    # derived artifacts, each rebuilt lazily only after change of the inputs it depends on
+    # class breaks -> ramp colors (per axis) -> mixed colors -> palette symbols and colors
+    tables: PaletteTables
+
+    render_plan: Optional[RenderPlan]
+
     def __init__(self, syms=None):
 
         super().__init__(Texts.bivariate_renderer_short_name)
@@ -48,7 +71,28 @@ class BivariateRenderer(QgsFeatureRenderer):
         self.color_ramp_1 = None
         self.color_ramp_2 = None
 
-        self.cached = {}
+        # fields are not classified yet, renderer without classes draws nothing
+        self.field_1_classes = []
+        self.field_2_classes = []
+        self.field_1_breaks = ClassBreaks([])
+        self.field_2_breaks = ClassBreaks([])
+        self.field_1_labels = []
+        self.field_2_labels = []
+        self.field_1_min = None
+        self.field_1_max = None
+        self.field_2_min = None
+        self.field_2_max = None
+
+        self.native_rendering = False
+
+        self.use_feature_cache = False
+        self.feature_cache = None
+
+        self.statistics_collector = None
+
+        self.tables = PaletteTables()
+
+        self.render_plan = None
 
     def __repr__(self) -> str:
         return f"BivariateRenderer with {self.number_classes} classes for each attribute, " \
@@ -57,8 +101,96 @@ class BivariateRenderer(QgsFeatureRenderer):
                f"field 1 vals {self.field_1_min};{self.field_1_max} " \
                f"field 2 vals {self.field_2_min};{self.field_2_max} "
 
-    def _reset_cache(self):
-        self.cached = {}
+    def _invalidate_ramp_colors_1(self) -> None:
+        self.tables = replace(self.tables,
+                              ramp_colors_1=None,
+                              mixed_colors=None,
+                              palette=None,
+                              palette_colors=None)
+
+    def _invalidate_ramp_colors_2(self) -> None:
+        self.tables = replace(self.tables,
+                              ramp_colors_2=None,
+                              mixed_colors=None,
+                              palette=None,
+                              palette_colors=None)
+
+    def _invalidate_mixed_colors(self) -> None:
+        self.tables = replace(self.tables, mixed_colors=None, palette=None, palette_colors=None)
+
+    @staticmethod
+    def _sample_color_ramp(color_ramp: QgsColorRamp, breaks: ClassBreaks, minimum: float,
+                           maximum: float) -> Tuple[QColor, ...]:
+
+        return tuple(
+            color_ramp.color((midpoint - minimum) / (maximum - minimum))
+            for midpoint in breaks.midpoints)
+
+    def getRampColors1(self) -> Tuple[QColor, ...]:
+
+        if self.tables.ramp_colors_1 is None:
+            self.tables = replace(self.tables,
+                                  ramp_colors_1=self._sample_color_ramp(
+                                      self.color_ramp_1, self.field_1_breaks, self.field_1_min,
+                                      self.field_1_max))
+
+        return self.tables.ramp_colors_1
+
+    def getRampColors2(self) -> Tuple[QColor, ...]:
+
+        if self.tables.ramp_colors_2 is None:
+            self.tables = replace(self.tables,
+                                  ramp_colors_2=self._sample_color_ramp(
+                                      self.color_ramp_2, self.field_2_breaks, self.field_2_min,
+                                      self.field_2_max))
+
+        return self.tables.ramp_colors_2
+
+    def getMixedColors(self) -> Tuple[Tuple[QColor, ...], ...]:
+        """Colors for all class pairs, indexed as [class of field 1][class of field 2]."""
+
+        if self.tables.mixed_colors is None:
+
+            colors_1 = self.getRampColors1()
+            colors_2 = self.getRampColors2()
+
+            mixed_colors = tuple(
+                tuple(self.color_mixing_method.mix_colors(color_1, color_2)
+                      for color_2 in colors_2)
+                for color_1 in colors_1)
+
+            self.tables = replace(self.tables, mixed_colors=mixed_colors)
+
+        return self.tables.mixed_colors
+
+    def getPalette(self) -> Tuple[Tuple[QgsFillSymbol, ...], ...]:
+        """
+        Symbols for all class pairs, indexed as [class of field 1][class of field 2].
+
+        These symbols are shared with clones of the renderer and must not be modified or started,
+        rendering uses copies of them.
+        """
+
+        if self.tables.palette is None:
+
+            palette = []
+
+            for row_colors in self.getMixedColors():
+
+                row = []
+
+                for color in row_colors:
+
+                    symbol = self.get_default_symbol()
+                    symbol.setColor(color)
+
+                    row.append(symbol)
+
+                palette.append(tuple(row))
+
+            self.tables = replace(self.tables, palette=tuple(palette))
+
+        return self.tables.palette
 
     def getLegendCategorySize(self) -> int:
 
@@ -102,33 +234,115 @@ class BivariateRenderer(QgsFeatureRenderer):
 
         return position
 
+    def getPaletteColors(self) -> np.ndarray:
+        """RGBA colors of palette as array of shape (classes of field 1, classes of field 2, 4)."""
+
+        if self.tables.palette_colors is None:
+
+            colors = np.zeros((len(self.field_1_breaks), len(self.field_2_breaks), 4),
+                              dtype=np.uint8)
+
+            for i, row in enumerate(self.getMixedColors()):
+                for j, color in enumerate(row):
+                    colors[i, j] = (color.red(), color.green(), color.blue(), color.alpha())
+
+            colors.flags.writeable = False
+
+            self.tables = replace(self.tables, palette_colors=colors)
+
+        return self.tables.palette_colors
+
+    def classify_arrays(self, values1: np.ndarray,
+                        values2: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Classify value pairs in bulk, using the same class breaks and palette as rendering.
+
+        Missing values should be provided as NaN. Returns class indices for field 1 and field 2
+        (-1 for values without class) and array of RGBA colors with shape (n, 4), fully transparent
+        for pairs without class.
+        """
+
+        indices_1 = self.field_1_breaks.class_indices(values1)
+        indices_2 = self.field_2_breaks.class_indices(values2)
+
+        if indices_1.shape != indices_2.shape:
+            raise ValueError("Arrays of values for field 1 and field 2 must have the same shape.")
+
+        valid = (indices_1 >= 0) & (indices_2 >= 0)
+
+        colors = np.zeros(indices_1.shape + (4,), dtype=np.uint8)
+        colors[valid] = self.getPaletteColors()[indices_1[valid], indices_2[valid]]
+
+        return indices_1, indices_2, colors
+
     def setColorMixingMethod(self, method: ColorMixingMethod) -> None:
         self.color_mixing_method = method
-        self._reset_cache()
+        self._invalidate_mixed_colors()
 
     def setClassificationMethodName(self, name: str) -> None:
         self.classification_method_name = name
-        self._reset_cache()
 
     def setNumberOfClasses(self, number: int) -> None:
         self.number_classes = int(number)
-        self._reset_cache()
 
     def setColorRamp1(self, color_ramp: QgsColorRamp) -> None:
         self.color_ramp_1 = color_ramp
-        self._reset_cache()
+        self._invalidate_ramp_colors_1()
 
     def setColorRamp2(self, color_ramp: QgsColorRamp) -> None:
         self.color_ramp_2 = color_ramp
-        self._reset_cache()
+        self._invalidate_ramp_colors_2()
+
+    def setNativeRendering(self, native: bool) -> None:
+        """
+        If set, features are drawn by an internal `QgsCategorizedSymbolRenderer` that classifies
+        them by expression, instead of classifying each feature in Python.
+        """
+        self.native_rendering = bool(native)
+
+    def setUseFeatureCache(self, use: bool) -> None:
+        """
+        If set, class pairs of features are cached by feature id (built in background task and
+        updated on layer edits), so that repeated rendering skips classification of attributes.
+        """
+        self.use_feature_cache = bool(use)
+
+        if self.use_feature_cache and self.feature_cache is None:
+            self.feature_cache = FeatureClassCache()
+
+    def setCollectStatistics(self, collect: bool, log_statistics: bool = False) -> None:
+        """
+        If set, every render records `RenderStatistics`, available as `lastRenderStatistics()`
+        and written into the message log on `stopRender` if `log_statistics` is set.
+        """
+        if collect:
+            self.statistics_collector = RenderStatisticsCollector(log_statistics)
+        else:
+            self.statistics_collector = None
+
+    def lastRenderStatistics(self) -> Optional[RenderStatistics]:
+
+        if self.statistics_collector is None:
+            return None
+
+        return self.statistics_collector.last
+
+    def _renew_feature_cache(self) -> None:
+        # cache is shared by clones, renderer with different fields or classes needs its own
+        if self.feature_cache is not None:
+            self.feature_cache = FeatureClassCache()
 
     def setFieldName1(self, field_name: str) -> None:
         self.field_name_1 = field_name
-        self._reset_cache()
+        self._renew_feature_cache()
 
     def setFieldName2(self, field_name: str) -> None:
         self.field_name_2 = field_name
-        self._reset_cache()
+        self._renew_feature_cache()
+
+    def has_classes(self) -> bool:
+        """Are both fields classified?"""
+        return len(self.field_1_breaks) > 0 and len(self.field_2_breaks) > 0
 
     def classes_to_legend_breaks(self, classes: List[QgsClassificationRange]) -> List[float]:
 
@@ -154,7 +368,10 @@ class BivariateRenderer(QgsFeatureRenderer):
 
         self.field_1_labels = self.classes_to_legend_breaks(classes)
 
-        self._reset_cache()
+        self.field_1_breaks = ClassBreaks(classes)
+
+        self._invalidate_ramp_colors_1()
+        self._renew_feature_cache()
 
     def setField2Classes(self, classes: List[QgsClassificationRange]) -> None:
         self.field_2_classes = classes
@@ -166,29 +383,38 @@ class BivariateRenderer(QgsFeatureRenderer):
 
         self.field_2_labels = self.classes_to_legend_breaks(classes)
 
-        self._reset_cache()
+        self.field_2_breaks = ClassBreaks(classes)
+
+        self._invalidate_ramp_colors_2()
+        self._renew_feature_cache()
 
-    def positionValueField1(self, value: float) -> float:
+    def classIndexField1(self, value: float) -> Optional[int]:
+        return self.field_1_breaks.class_index(value)
 
-        class_value1 = None
+    def classIndexField2(self, value: float) -> Optional[int]:
+        return self.field_2_breaks.class_index(value)
 
-        for range_class in self.field_1_classes:
+    def positionValueField1(self, value: float) -> Optional[float]:
 
-            if range_class.lowerBound() <= value <= range_class.upperBound():
-                class_value1 = (range_class.lowerBound() + range_class.upperBound()) / 2
+        class_index = self.classIndexField1(value)
+
+        if class_index is None:
+            return None
+
+        class_value1 = self.field_1_breaks.midpoints[class_index]
 
         position_value1 = (class_value1 - self.field_1_min) / (self.field_1_max - self.field_1_min)
 
         return position_value1
 
-    def positionValueField2(self, value: float) -> float:
+    def positionValueField2(self, value: float) -> Optional[float]:
 
-        class_value2 = None
+        class_index = self.classIndexField2(value)
 
-        for range_class in self.field_2_classes:
+        if class_index is None:
+            return None
 
-            if range_class.lowerBound() <= value <= range_class.upperBound():
-                class_value2 = (range_class.lowerBound() + range_class.upperBound()) / 2
+        class_value2 = self.field_2_breaks.midpoints[class_index]
 
         position_value2 = (class_value2 - self.field_2_min) / (self.field_2_max - self.field_2_min)
 
@@ -197,11 +423,14 @@ class BivariateRenderer(QgsFeatureRenderer):
     def getFeatureValueCombinationHash(self, value1: float, value2: float) -> int:
         return hash(f"{value1}-{value2}")
 
-    def getFeatureColor(self, value1: float, value2: float) -> QColor:
+    def getFeatureColor(self, value1: float, value2: float) -> Optional[QColor]:
 
         position_value1 = self.positionValueField1(value1)
         position_value2 = self.positionValueField2(value2)
 
+        if position_value1 is None or position_value2 is None:
+            return None
+
         color1 = self.color_ramp_1.color(position_value1)
         color2 = self.color_ramp_2.color(position_value2)
 
@@ -209,48 +438,269 @@ class BivariateRenderer(QgsFeatureRenderer):
 
         return result_color
 
+    @staticmethod
+    def class_index_expression(field_name: str, breaks: ClassBreaks) -> str:
+        """Expression returning 1-based class index of the field as string, see `ClassBreaks`."""
+
+        field = QgsExpression.quotedColumnRef(field_name)
+
+        conditions = [f"WHEN {field} IS NULL THEN NULL"]
+
+        for i, break_value in enumerate(breaks.breaks[1:-1]):
+            conditions.append(f"WHEN {field} < {break_value!r} THEN '{i + 1}'")
+
+        return f"CASE {' '.join(conditions)} ELSE '{len(breaks)}' END"
+
+    def class_pair_expression(self) -> str:
+        """Expression returning class pair of the feature as `i-j` string (1-based indices)."""
+
+        expression_1 = self.class_index_expression(self.field_name_1, self.field_1_breaks)
+        expression_2 = self.class_index_expression(self.field_name_2, self.field_2_breaks)
+
+        return f"{expression_1} || '-' || {expression_2}"
+
+    def createCategorizedRenderer(self) -> QgsCategorizedSymbolRenderer:
+        """Native renderer producing the same output as this renderer."""
+
+        categories = []
+
+        for i, row in enumerate(self.getPalette()):
+            for j, symbol in enumerate(row):
+                key = f"{i + 1}-{j + 1}"
+                categories.append(QgsRendererCategory(key, symbol.clone(), key))
+
+        return QgsCategorizedSymbolRenderer(self.class_pair_expression(), categories)
+
+    def renderFeature(self, feature: QgsFeature, context, layer=-1, selected=False,
+                      drawVertexMarker=False) -> bool:
+
+        plan = self.render_plan
+
+        if plan is not None and plan.native_renderer is not None:
+
+            if plan.statistics is not None:
+                plan.statistics.features_rendered += 1
+
+            return plan.native_renderer.renderFeature(feature, context, layer, selected,
+                                                      drawVertexMarker)
+
+        return super().renderFeature(feature, context, layer, selected, drawVertexMarker)
+
     def symbolForFeature(self, feature: QgsFeature, context):
 
-        value1 = feature.attribute(self.field_name_1)
-        value2 = feature.attribute(self.field_name_2)
+        plan = self.render_plan
+
+        if plan is not None and plan.native_renderer is not None:
+            return plan.native_renderer.symbolForFeature(feature, context)
+
+        if plan is None:
+            return self.symbol_for_values(feature.attribute(self.field_name_1),
+                                          feature.attribute(self.field_name_2))
+
+        if plan.statistics is not None:
+            return self._symbol_for_feature_with_statistics(plan, feature)
+
+        codes = plan.feature_codes
+
+        if codes is not None:
+
+            fid = feature.id()
+
+            if 0 <= fid < len(codes):
+
+                code = codes[fid]
+
+                if code < FeatureClassCache.NO_CLASS:
+                    return plan.palette_by_code[code]
+
+                if code == FeatureClassCache.NO_CLASS:
+                    return None
+
+        if plan.field_index_1 < 0 or plan.field_index_2 < 0:
+            return None
+
+        class_index_1 = plan.breaks_1.class_index(feature.attribute(plan.field_index_1))
+        class_index_2 = plan.breaks_2.class_index(feature.attribute(plan.field_index_2))
+
+        if class_index_1 is None or class_index_2 is None:
+            return None
+
+        return plan.palette[class_index_1][class_index_2]
+
+    def _symbol_for_feature_with_statistics(self, plan: RenderPlan, feature: QgsFeature):
+        # separate from symbolForFeature, so that counting costs nothing when it is not enabled
+
+        start = time.perf_counter()
+
+        statistics = plan.statistics
+        statistics.features_rendered += 1
+
+        symbol = None
+
+        code = FeatureClassCache.NOT_CACHED
+
+        if plan.feature_codes is not None:
+
+            fid = feature.id()
+
+            if 0 <= fid < len(plan.feature_codes):
+                code = plan.feature_codes[fid]
+
+            if code == FeatureClassCache.NOT_CACHED:
+                statistics.feature_cache_misses += 1
+            else:
+                statistics.feature_cache_hits += 1
+
+        if code < FeatureClassCache.NO_CLASS:
+
+            symbol = plan.palette_by_code[code]
+
+        elif code == FeatureClassCache.NOT_CACHED and plan.field_index_1 >= 0 and \
+                plan.field_index_2 >= 0:
+
+            class_indices = []
+
+            for breaks, field_index in ((plan.breaks_1, plan.field_index_1),
+                                        (plan.breaks_2, plan.field_index_2)):
+
+                value = feature.attribute(field_index)
 
-        identifier = self.getFeatureValueCombinationHash(value1, value2)
+                class_index = breaks.class_index(value)
 
-        if identifier not in self.cached:
-            feature_symbol = self.get_default_symbol()
-            feature_symbol.setColor(self.getFeatureColor(value1, value2))
+                if class_index is None:
+                    statistics.null_values += 1
+                elif breaks.is_out_of_range(value):
+                    statistics.out_of_range_values += 1
 
-            self.cached[identifier] = feature_symbol.clone()
+                class_indices.append(class_index)
 
-        self.cached[identifier].startRender(context)
+            if None not in class_indices:
+                symbol = plan.palette[class_indices[0]][class_indices[1]]
 
-        return self.cached[identifier]
+        if symbol is None:
+            statistics.features_without_symbol += 1
+
+        statistics.symbol_for_feature_time += time.perf_counter() - start
+
+        return symbol
 
     def startRender(self, context, fields):
         super().startRender(context, fields)
 
+        statistics = None
+
+        if self.statistics_collector is not None:
+            statistics = RenderStatistics()
+            start = time.perf_counter()
+
+        native_renderer = None
+        palette = None
+        feature_codes = None
+
+        if self.native_rendering:
+            native_renderer = self.createCategorizedRenderer()
+            native_renderer.startRender(context, fields)
+        else:
+            # shared palette symbols stay untouched, started copies are private to this render
+            palette = [[symbol.clone() for symbol in row] for row in self.getPalette()]
+
+            for row in palette:
+                for symbol in row:
+                    symbol.startRender(context, fields)
+
+            feature_codes = self._feature_codes(context)
+
+        if statistics is not None:
+            statistics.palette_build_time = time.perf_counter() - start
+            statistics.palette_size = len(self.field_1_breaks) * len(self.field_2_breaks)
+
+        self.render_plan = RenderPlan(
+            field_index_1=fields.lookupField(self.field_name_1),
+            field_index_2=fields.lookupField(self.field_name_2),
+            breaks_1=self.field_1_breaks,
+            breaks_2=self.field_2_breaks,
+            palette=palette,
+            native_renderer=native_renderer,
+            feature_codes=feature_codes,
+            palette_by_code=[symbol for row in palette for symbol in row] if palette else None,
+            statistics=statistics)
+
+    def _feature_codes(self, context) -> Optional[bytearray]:
+
+        if not self.use_feature_cache or self.feature_cache is None:
+            return None
+
+        if not FeatureClassCache.supports_class_counts(len(self.field_1_breaks),
+                                                       len(self.field_2_breaks)):
+            return None
+
+        layer_id = context.expressionContext().variable("layer_id")
+
+        if not layer_id:
+            return None
+
+        return self.feature_cache.codes_for(
+            FeatureClassCacheConfig(layer_id, self.field_name_1, self.field_name_2,
+                                    self.field_1_breaks, self.field_2_breaks))
+
     def stopRender(self, context):
-        for s in list(self.cached.values()):
-            s.stopRender(context)
+        if self.render_plan is not None:
+            if self.render_plan.native_renderer is not None:
+                self.render_plan.native_renderer.stopRender(context)
+            else:
+                for row in self.render_plan.palette:
+                    for s in row:
+                        s.stopRender(context)
+
+            if self.render_plan.statistics is not None and self.statistics_collector is not None:
+
+                self.statistics_collector.add(self.render_plan.statistics)
+
+                if self.statistics_collector.log_statistics:
+                    log(self.render_plan.statistics)
+
+            self.render_plan = None
         super().stopRender(context)
 
     def usedAttributes(self, context):
         return [self.field_name_1, self.field_name_2]
 
     def symbols(self, context):
-        return list(self.cached.values())
+        return [symbol for row in self.getPalette() for symbol in row]
 
     def clone(self) -> QgsFeatureRenderer:
+
+        # build the palette once here, so that all clones share it instead of building their own
+        self.getPalette()
+        self.getPaletteColors()
+
         r = BivariateRenderer()
-        r.setFieldName1(self.field_name_1)
-        r.setFieldName2(self.field_name_2)
+        r.field_name_1 = self.field_name_1
+        r.field_name_2 = self.field_name_2
         r.classification_method_name = self.classification_method_name
-        r.setNumberOfClasses(self.number_classes)
-        r.setColorRamp1(self.color_ramp_1.clone())
-        r.setColorRamp2(self.color_ramp_2.clone())
-        r.setField1Classes(self.field_1_classes)
-        r.setField2Classes(self.field_2_classes)
-        r.setColorMixingMethod(self.color_mixing_method)
+        r.number_classes = self.number_classes
+        r.color_ramp_1 = self.color_ramp_1.clone() if self.color_ramp_1 is not None else None
+        r.color_ramp_2 = self.color_ramp_2.clone() if self.color_ramp_2 is not None else None
+        r.color_mixing_method = self.color_mixing_method
+        r.native_rendering = self.native_rendering
+        r.use_feature_cache = self.use_feature_cache
+        r.feature_cache = self.feature_cache
+        r.statistics_collector = self.statistics_collector
+
+        # class ranges, breaks and palette tables are never modified in place, only replaced
+        r.field_1_classes = self.field_1_classes
+        r.field_1_labels = self.field_1_labels
+        r.field_1_min = self.field_1_min
+        r.field_1_max = self.field_1_max
+        r.field_1_breaks = self.field_1_breaks
+
+        r.field_2_classes = self.field_2_classes
+        r.field_2_labels = self.field_2_labels
+        r.field_2_min = self.field_2_min
+        r.field_2_max = self.field_2_max
+        r.field_2_breaks = self.field_2_breaks
+
+        r.tables = self.tables
 
         return r
 
@@ -301,6 +751,10 @@ class BivariateRenderer(QgsFeatureRenderer):
 
         renderer_elem.setAttribute('color_mixing_method', self.color_mixing_method.name())
 
+        renderer_elem.setAttribute('native_rendering', str(self.native_rendering))
+
+        renderer_elem.setAttribute('use_feature_cache', str(self.use_feature_cache))
+
         return renderer_elem
 
     @staticmethod
@@ -312,7 +766,7 @@ class BivariateRenderer(QgsFeatureRenderer):
         r.setFieldName2(element.attribute("field_name_2"))
 
         r.setNumberOfClasses(int(element.attribute("number_of_classes")))
-        r.setClassificationMethodName(element.attribute("classification_method_name "))
+        r.setClassificationMethodName(element.attribute("classification_method_name"))
 
         if r.classification_method_name == "":
             r.classification_method_name = None
@@ -366,6 +820,10 @@ class BivariateRenderer(QgsFeatureRenderer):
         else:
             r.setColorMixingMethod(ColorMixingMethodDarken())
 
+        r.setNativeRendering(element.attribute('native_rendering') == "True")
+
+        r.setUseFeatureCache(element.attribute('use_feature_cache') == "True")
+
         return r
 
     def load(self, symbology_elem: QDomElement, context):
@@ -389,15 +847,13 @@ class BivariateRenderer(QgsFeatureRenderer):
 
     def symbol_for_values(self, value1: float, value2: float) -> QgsFillSymbol:
 
-        identifier = self.getFeatureValueCombinationHash(value1, value2)
+        class_index_1 = self.classIndexField1(value1)
+        class_index_2 = self.classIndexField2(value2)
 
-        if identifier not in self.cached:
-            feature_symbol = self.get_default_symbol()
-            feature_symbol.setColor(self.getFeatureColor(value1, value2))
+        if class_index_1 is None or class_index_2 is None:
+            return None
 
-            self.cached[identifier] = feature_symbol.clone()
-
-        return self.cached[identifier]
+        return self.getPalette()[class_index_1][class_index_2]
 
     def legend_polygon_size(self, width: float) -> float:
 
@@ -409,20 +865,11 @@ class BivariateRenderer(QgsFeatureRenderer):
 
         polygons = []
 
-        x = 0
-        for field_1_cat in self.field_1_classes:
+        for x, row in enumerate(self.getPalette()):
 
-            y = 0
-            for field_2_cat in self.field_2_classes:
+            for y, symbol in enumerate(row):
 
-                polygons.append(
-                    LegendPolygon(x=x,
-                                  y=y,
-                                  symbol=self.get_symbol_for_values(
-                                      (field_1_cat.lowerBound() + field_1_cat.upperBound()) / 2,
-                                      (field_2_cat.lowerBound() + field_2_cat.upperBound()) / 2)))
-                y += 1
-            x += 1
+                polygons.append(LegendPolygon(x=x, y=y, symbol=symbol))
 
         return polygons
 
@@ -448,6 +895,35 @@ class BivariateRenderer(QgsFeatureRenderer):
                 return False
 
 
+@dataclass(frozen=True)
+class PaletteTables:
+    """
+    Immutable artifacts derived from renderer settings. Clones of the renderer reference the same
+    object, any change of settings replaces it with a copy that has the dependent fields unset.
+    """
+
+    ramp_colors_1: Optional[Tuple[QColor, ...]] = None
+    ramp_colors_2: Optional[Tuple[QColor, ...]] = None
+    mixed_colors: Optional[Tuple[Tuple[QColor, ...], ...]] = None
+    palette: Optional[Tuple[Tuple[QgsFillSymbol, ...], ...]] = None
+    palette_colors: Optional[np.ndarray] = None
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    """Lookup tables resolved in `startRender` and used for every feature until `stopRender`."""
+
+    field_index_1: int
+    field_index_2: int
+    breaks_1: ClassBreaks
+    breaks_2: ClassBreaks
+    palette: Optional[List[List[QgsFillSymbol]]]
+    native_renderer: Optional[QgsCategorizedSymbolRenderer] = None
+    feature_codes: Optional[bytearray] = None
+    palette_by_code: Optional[List[QgsFillSymbol]] = None
+    statistics: Optional[RenderStatistics] = None
+
+
 @dataclass
 class LegendPolygon:
 
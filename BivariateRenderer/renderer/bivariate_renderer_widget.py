@@ -1,20 +1,30 @@
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
 from qgis.PyQt.QtGui import (QImage, QColor, QPainter, QPixmap)
 
-from qgis.PyQt.QtWidgets import (QFormLayout, QLabel, QComboBox)
+from qgis.PyQt.QtWidgets import (QFormLayout, QLabel, QComboBox, QProgressBar, QCheckBox)
 
-from qgis.PyQt.QtCore import pyqtSignal
+from qgis.PyQt.QtCore import pyqtSignal, QTimer
 
-from qgis.gui import (QgsRendererWidget, QgsColorRampButton, QgsFieldComboBox, QgsDoubleSpinBox)
+from qgis.gui import (QgsRendererWidget, QgsColorRampButton, QgsFieldComboBox, QgsDoubleSpinBox,
+                      QgsSpinBox)
 
 from qgis.core import (QgsGradientColorRamp, QgsClassificationMethod, QgsClassificationJenks,
                        QgsClassificationEqualInterval, QgsClassificationQuantile,
                        QgsClassificationPrettyBreaks, QgsClassificationLogarithmic,
-                       QgsFieldProxyModel, QgsRenderContext, QgsTextFormat)
+                       QgsFieldProxyModel, QgsRenderContext, QgsTextFormat, QgsApplication,
+                       QgsClassificationRange)
 
 from .bivariate_renderer import BivariateRenderer
 from ..legendrenderer.legend_renderer import LegendRenderer
 from ..colormixing.color_mixing_methods_register import ColorMixingMethodsRegister
 from ..colorramps.color_ramps_register import BivariateColorRampsRegister
+from ..classification.layer_classification import field_classes
+from ..classification.field_classes_task import FieldClassesTask
+from ..classification.bivariate_statistics import BivariateStatistics
+from ..classification.field_statistics import SamplingError
+from ..classification.field_statistics_cache import FieldStatisticsCache
 
 from ..utils import (log)
 
@@ -60,6 +70,9 @@ class BivariateRendererWidget(QgsRendererWidget):
 
     legend_changed = pyqtSignal()
 
+    # milliseconds
+    update_delay = 50
+
     def __init__(self, layer, style, renderer: BivariateRenderer):
 
         super().__init__(layer, style)
@@ -71,6 +84,45 @@ class BivariateRendererWidget(QgsRendererWidget):
 
         self.legend_renderer = LegendRenderer()
 
+        # running classification task for each axis (field 1 and field 2), possibly shared
+        self.classification_tasks = {1: None, 2: None}
+
+        # classes calculated from sample of values, 0 uses all values
+        self.sample_size = 0
+        self.sampling_errors = {1: None, 2: None}
+
+        self.label_sampling = QLabel()
+        self.label_sampling.setWordWrap(True)
+        self.label_sampling.setVisible(False)
+
+        # NULL values and counts of features in categories, counting reads the layer once more,
+        # so it is only done on request
+        self.count_categories = False
+
+        self.label_counts = QLabel()
+        self.label_counts.setWordWrap(True)
+        self.label_counts.setVisible(False)
+
+        self.pb_classification = QProgressBar()
+        self.pb_classification.setRange(0, 0)
+        self.pb_classification.setTextVisible(False)
+        self.pb_classification.setVisible(False)
+
+        # changes of controls only request updates, these are applied together after a short
+        # delay, or when updates are resumed
+        self._updates_suspended = 0
+        self._pending_classifications = set()
+        self._legend_update_pending = False
+
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(self.update_delay)
+        self.update_timer.timeout.connect(self.apply_pending_updates)
+
+        self.legend_changed.connect(self.request_legend_update)
+
+        self.suspend_updates()
+
         # objects
         self.classification_method = QgsClassificationEqualInterval()
         self.number_of_classes = self.bivariate_renderer.number_classes
@@ -116,6 +168,22 @@ class BivariateRendererWidget(QgsRendererWidget):
         self.sb_number_classes.valueChanged.connect(self.setNumberOfClasses)
         self.sb_number_classes.setValue(self.number_of_classes)
 
+        self.sb_sample_size = QgsSpinBox()
+        self.sb_sample_size.setMinimum(0)
+        self.sb_sample_size.setMaximum(100000000)
+        self.sb_sample_size.setSingleStep(10000)
+        self.sb_sample_size.setSpecialValueText("All values")
+        self.sb_sample_size.setToolTip(
+            "Classify random sample of values of this size (only for methods that need all "
+            "values of the field).")
+        self.sb_sample_size.valueChanged.connect(self.setSampleSize)
+
+        self.cb_count_categories = QCheckBox()
+        self.cb_count_categories.setToolTip(
+            "Count features in categories of the legend after classification (reads the layer "
+            "once more).")
+        self.cb_count_categories.toggled.connect(self.setCountCategories)
+
         self.cb_classification_methods = QComboBox()
         self.cb_classification_methods.addItems(list(self.classification_methods.keys()))
         self.cb_classification_methods.currentIndexChanged.connect(self.setClassificationMethod)
@@ -170,31 +238,36 @@ class BivariateRendererWidget(QgsRendererWidget):
 
         self.label_legend = QLabel()
 
-        self.legend_changed.connect(self.update_legend)
-
         self.form_layout = QFormLayout()
         self.form_layout.addRow("Predefined color ramps:", self.cb_color_ramps)
         self.form_layout.addRow("Select number of classes:", self.sb_number_classes)
-        self.form_layout.addRow(
-            "",
-            QLabel(
-                "Data are categorized using Equal Interval classification method into provided number of categories for both fields."
-            ))
-        # self.form_layout.addRow("Select classification method:", self.cb_classification_methods)
+        self.form_layout.addRow("Select classification method:", self.cb_classification_methods)
+        self.form_layout.addRow("Sample size for classification:", self.sb_sample_size)
+        self.form_layout.addRow("Count features in categories:", self.cb_count_categories)
         self.form_layout.addRow("Select color mixing method:", self.cb_colormixing_methods)
         self.form_layout.addRow("Select field 1:", self.cb_field1)
         self.form_layout.addRow("Select color ramp 1:", self.bt_color_ramp1)
         self.form_layout.addRow("Select field 2:", self.cb_field2)
         self.form_layout.addRow("Select color ramp 2:", self.bt_color_ramp2)
+        self.form_layout.addRow("", self.pb_classification)
+        self.form_layout.addRow("", self.label_sampling)
+        self.form_layout.addRow("", self.label_counts)
         self.form_layout.addRow("Example of legend:", self.label_legend)
         self.setLayout(self.form_layout)
 
-        self.update_legend()
+        self._legend_update_pending = True
+
+        self.resume_updates()
 
     def update_legend(self):
 
         self.label_legend.clear()
 
+        # legend is drawn once both fields are classified (classes of new renderer are calculated
+        # in background)
+        if not self.bivariate_renderer.has_classes():
+            return
+
         image = QImage(self.size, self.size, QImage.Format_ARGB32)
         image.fill(QColor(0, 0, 0, 0))
 
@@ -289,16 +362,241 @@ class BivariateRendererWidget(QgsRendererWidget):
         self.legend_changed.emit()
 
     def setField1Classes(self) -> None:
-
-        self.bivariate_renderer.setField1Classes(
-            self.classification_method.classes(self.vectorLayer(), self.field_name_1,
-                                               self.number_of_classes))
+        self.request_classification(1)
 
     def setField2Classes(self) -> None:
+        self.request_classification(2)
+
+    def suspend_updates(self) -> None:
+        """Collects requested classifications and legend updates until `resume_updates`."""
+        self._updates_suspended += 1
+
+    def resume_updates(self) -> None:
+
+        self._updates_suspended = max(self._updates_suspended - 1, 0)
+
+        if self._updates_suspended == 0:
+            self.apply_pending_updates()
+
+    @contextmanager
+    def updates_suspended(self) -> Iterator[None]:
+
+        self.suspend_updates()
+
+        try:
+            yield
+        finally:
+            self.resume_updates()
+
+    def request_classification(self, axis: int) -> None:
+
+        self._pending_classifications.add(axis)
+
+        self.schedule_updates()
+
+    def request_legend_update(self) -> None:
+
+        self._legend_update_pending = True
+
+        self.schedule_updates()
+
+    def schedule_updates(self) -> None:
+
+        # restarting the timer coalesces rapid changes of controls into one update
+        if self._updates_suspended == 0:
+            self.update_timer.start()
+
+    def apply_pending_updates(self) -> None:
+        """Runs requested classifications (at most one per axis) and legend update at once."""
+
+        self.update_timer.stop()
+
+        axes = sorted(self._pending_classifications)
+        self._pending_classifications.clear()
+
+        if axes:
+            self.classify_fields(axes)
+
+        if self._legend_update_pending:
+            self._legend_update_pending = False
+            self.update_legend()
+
+    def classify_fields(self, axes: List[int]) -> None:
+        """
+        Classifies fields of the axes. Classes of methods that need only cached minimum and
+        maximum are set immediately, the other fields are classified by one background task
+        (reading the fields that are not cached in a single pass), which replaces (and cancels)
+        any older tasks for the axes. If features in categories are counted, both fields are
+        classified by the task, which counts them afterwards.
+        """
+
+        axes = set(axes)
+
+        if self.count_categories:
+            axes.update((1, 2))
+
+        # axes sharing a task with the classified ones lose it, so they are classified again
+        for axis in list(axes):
+            axes.update(
+                other_axis for other_axis, task in self.classification_tasks.items()
+                if task is not None and task is self.classification_tasks[axis])
+
+        for axis in axes:
+            self.cancel_classification(axis)
+
+        # counts of the previous classes do not apply anymore
+        self.update_counts_label(None)
+
+        layer = self.vectorLayer()
+
+        task_axes = []
+
+        for axis in sorted(axes):
+
+            field_name = self.axis_field_name(axis)
+
+            # classes from all values (possibly cached) can take a while, so they are calculated
+            # in background as well
+            if layer.fields().lookupField(field_name) >= 0 and (
+                    self.count_categories or self.classification_method.valuesRequired() or
+                    FieldStatisticsCache().cached(layer, field_name) is None):
+                task_axes.append(axis)
+                continue
+
+            # classes are derived from cached minimum and maximum without reading the layer,
+            # expressions are classified by the method itself
+            self.set_field_classes(
+                axis,
+                field_classes(layer, field_name, self.classification_method,
+                              self.number_of_classes, self.sample_size))
+
+        if not task_axes:
+            return
+
+        task = FieldClassesTask(layer, [self.axis_field_name(axis) for axis in task_axes],
+                                self.classification_method, self.number_of_classes,
+                                self.sample_size, self.count_categories)
+
+        task.taskCompleted.connect(self.classification_completed)
+        task.taskTerminated.connect(self.classification_terminated)
+
+        for axis in task_axes:
+            self.classification_tasks[axis] = task
+
+        self.update_classification_indicator()
+
+        QgsApplication.taskManager().addTask(task)
+
+    def axis_field_name(self, axis: int) -> str:
+        return self.field_name_1 if axis == 1 else self.field_name_2
+
+    def cancel_classification(self, axis: int) -> None:
+
+        task = self.classification_tasks[axis]
+
+        self.classification_tasks[axis] = None
+
+        if task is not None:
+            task.cancel()
+
+        self.update_classification_indicator()
+
+    def classification_running(self) -> bool:
+        return bool(self._pending_classifications) or any(
+            task is not None for task in self.classification_tasks.values())
+
+    def classification_completed(self) -> None:
+
+        task = self.sender()
+
+        axes = self.task_axes(task)
+
+        for axis in axes:
+
+            self.classification_tasks[axis] = None
+
+            field_name = self.axis_field_name(axis)
+
+            if field_name in task.classes:
+                self.set_field_classes(axis, task.classes[field_name],
+                                       task.sampling_errors.get(field_name))
+
+        self.update_classification_indicator()
+
+        if len(axes) == 2 and self.count_categories:
+            self.update_counts_label(task.bivariate_statistics)
+
+        if axes:
+            self.legend_changed.emit()
+
+    def classification_terminated(self) -> None:
+
+        for axis in self.task_axes(self.sender()):
+            self.classification_tasks[axis] = None
+
+        self.update_classification_indicator()
+
+    def task_axes(self, task: FieldClassesTask) -> List[int]:
+        """Axes classified by the task, none for tasks that were replaced by newer ones."""
+
+        return [
+            axis for axis, axis_task in self.classification_tasks.items()
+            if axis_task is not None and axis_task is task
+        ]
+
+    def set_field_classes(self,
+                          axis: int,
+                          classes: List[QgsClassificationRange],
+                          sampling_error: Optional[SamplingError] = None) -> None:
+
+        if not classes:
+            return
+
+        self.sampling_errors[axis] = sampling_error
+        self.update_sampling_label()
+
+        if axis == 1:
+            self.bivariate_renderer.setField1Classes(classes)
+        else:
+            self.bivariate_renderer.setField2Classes(classes)
+
+    def update_sampling_label(self) -> None:
+
+        texts = [
+            f"Field {axis}: {error}" for axis, error in self.sampling_errors.items()
+            if error is not None
+        ]
+
+        self.label_sampling.setText("\n".join(texts))
+        self.label_sampling.setVisible(bool(texts))
+
+    def update_counts_label(self, statistics: Optional[BivariateStatistics]) -> None:
+
+        self.label_counts.setText(str(statistics) if statistics is not None else "")
+        self.label_counts.setVisible(statistics is not None)
+
+    def setSampleSize(self) -> None:
+
+        self.sample_size = int(self.sb_sample_size.value())
+
+        self.setField1Classes()
+        self.setField2Classes()
+
+        self.legend_changed.emit()
+
+    def setCountCategories(self) -> None:
+
+        self.count_categories = self.cb_count_categories.isChecked()
+
+        if self.count_categories:
+            # counts need classes of both fields from the same task
+            self.setField1Classes()
+            self.setField2Classes()
+        else:
+            self.update_counts_label(None)
 
-        self.bivariate_renderer.setField2Classes(
-            self.classification_method.classes(self.vectorLayer(), self.field_name_2,
-                                               self.number_of_classes))
+    def update_classification_indicator(self) -> None:
+        self.pb_classification.setVisible(self.classification_running())
 
     def log_renderer(self) -> None:
 
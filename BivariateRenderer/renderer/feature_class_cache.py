@@ -0,0 +1,358 @@
+import threading
+from typing import Optional, Any, Iterable, List
+
+from qgis.PyQt.QtCore import QObject, QCoreApplication, pyqtSignal
+
+from qgis.core import (QgsTask, QgsApplication, QgsProject, QgsVectorLayer, QgsFeatureRequest,
+                       QgsVectorLayerFeatureSource, QgsFeature)
+
+from ..classification.class_breaks import ClassBreaks
+
+
+class FeatureClassCacheConfig:
+    """Layer, fields and class breaks that codes in `FeatureClassCache` were calculated for."""
+
+    def __init__(self, layer_id: str, field_name_1: str, field_name_2: str, breaks_1: ClassBreaks,
+                 breaks_2: ClassBreaks):
+
+        self.layer_id = layer_id
+        self.field_name_1 = field_name_1
+        self.field_name_2 = field_name_2
+        self.breaks_1 = breaks_1
+        self.breaks_2 = breaks_2
+
+    def __eq__(self, other: object) -> bool:
+
+        if not isinstance(other, FeatureClassCacheConfig):
+            return False
+
+        # class breaks are immutable and shared by renderer clones, so identity is enough
+        return (self.layer_id == other.layer_id and self.field_name_1 == other.field_name_1 and
+                self.field_name_2 == other.field_name_2 and self.breaks_1 is other.breaks_1 and
+                self.breaks_2 is other.breaks_2)
+
+    def code(self, value1: Any, value2: Any) -> int:
+
+        class_index_1 = self.breaks_1.class_index(value1)
+        class_index_2 = self.breaks_2.class_index(value2)
+
+        if class_index_1 is None or class_index_2 is None:
+            return FeatureClassCache.NO_CLASS
+
+        return class_index_1 * len(self.breaks_2) + class_index_2
+
+
+class FeatureClassCacheTask(QgsTask):
+    """Background task calculating class pair codes for all features of the layer."""
+
+    def __init__(self, source: QgsVectorLayerFeatureSource, field_index_1: int,
+                 field_index_2: int, config: FeatureClassCacheConfig, feature_count: int):
+
+        super().__init__("Caching bivariate classes of features", QgsTask.CanCancel)
+
+        self.source = source
+        self.field_index_1 = field_index_1
+        self.field_index_2 = field_index_2
+        self.config = config
+        self.feature_count = max(feature_count, 1)
+
+        # feature ids are used as indices, do not build cache for layers with very sparse ids
+        self.max_fid = max(FeatureClassCache.MINIMAL_MAX_FID, 4 * feature_count)
+
+        # False if the build failed because of the feature ids, such build is not retried
+        self.fids_supported = True
+
+        self.codes = bytearray()
+
+    def run(self) -> bool:
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([self.field_index_1, self.field_index_2])
+
+        codes = bytearray()
+
+        for number, feature in enumerate(self.source.getFeatures(request)):
+
+            if self.isCanceled():
+                return False
+
+            fid = feature.id()
+
+            if fid < 0 or fid > self.max_fid:
+                self.fids_supported = False
+                return False
+
+            if fid >= len(codes):
+                codes.extend(bytes([FeatureClassCache.NOT_CACHED]) * (fid + 1 - len(codes)))
+
+            codes[fid] = self.config.code(feature.attribute(self.field_index_1),
+                                          feature.attribute(self.field_index_2))
+
+            if number % 10000 == 0:
+                self.setProgress(100 * number / self.feature_count)
+
+        self.codes = codes
+
+        return True
+
+
+class FeatureClassCache(QObject):
+    """
+    Class pair codes of features stored compactly as one byte per feature id. The codes are
+    calculated in a background task and afterwards kept up to date by listening to edits of the
+    layer, so that repeated rendering of the same features can skip classification.
+
+    The object lives in the main thread (it is moved there if created elsewhere) and is shared
+    between clones of the renderer. Renderers only read `codes`, rebuild is requested through a
+    queued signal. Changes of the state are guarded by a lock, as renderers request codes from
+    render threads.
+
+    Data changed outside of the edit buffer (provider level writes, reload of the layer) and
+    changes of fields are not reported per feature, they drop the whole cache.
+    """
+
+    NOT_CACHED = 255
+    NO_CLASS = 254
+
+    MINIMAL_MAX_FID = 1000000
+
+    build_requested = pyqtSignal(object)
+
+    config: Optional[FeatureClassCacheConfig]
+    codes: Optional[bytearray]
+
+    def __init__(self):
+
+        super().__init__()
+
+        self.config = None
+        self.codes = None
+
+        self._layer = None
+        self._task = None
+        self._pending_config = None
+        self._dirty_fids = set()
+        self._lock = threading.Lock()
+
+        application = QCoreApplication.instance()
+
+        if application is not None and self.thread() != application.thread():
+            self.moveToThread(application.thread())
+
+        self.build_requested.connect(self._build)
+
+    def codes_for(self, config: FeatureClassCacheConfig) -> Optional[bytearray]:
+        """Cached codes if they match the config, otherwise requests (re)build and returns None."""
+
+        with self._lock:
+
+            if self.codes is not None and self.config == config:
+                return self.codes
+
+            if self._pending_config == config:
+                return None
+
+            self._pending_config = config
+
+        self.build_requested.emit(config)
+
+        return None
+
+    @staticmethod
+    def supports_class_counts(classes_1: int, classes_2: int) -> bool:
+        return classes_1 * classes_2 < FeatureClassCache.NO_CLASS
+
+    def _build(self, config: FeatureClassCacheConfig) -> None:
+
+        with self._lock:
+            if config != self._pending_config:
+                return
+
+        layer = QgsProject.instance().mapLayer(config.layer_id)
+
+        if not isinstance(layer, QgsVectorLayer):
+            return
+
+        field_index_1 = layer.fields().lookupField(config.field_name_1)
+        field_index_2 = layer.fields().lookupField(config.field_name_2)
+
+        if field_index_1 < 0 or field_index_2 < 0:
+            return
+
+        if self._task is not None:
+            self._task.cancel()
+
+        self._disconnect_layer()
+
+        with self._lock:
+            self.config = None
+            self.codes = None
+            self._dirty_fids = set()
+
+        task = FeatureClassCacheTask(QgsVectorLayerFeatureSource(layer), field_index_1,
+                                     field_index_2, config, layer.featureCount())
+        task.taskCompleted.connect(lambda: self._task_completed(task))
+        task.taskTerminated.connect(lambda: self._task_terminated(task))
+
+        self._task = task
+
+        # edits made while the task runs are collected and applied once it finishes
+        self._connect_layer(layer)
+
+        QgsApplication.taskManager().addTask(task)
+
+    def _task_completed(self, task: FeatureClassCacheTask) -> None:
+
+        if task is not self._task:
+            return
+
+        self._task = None
+
+        with self._lock:
+
+            self._pending_config = None
+
+            self.codes = task.codes
+            self.config = task.config
+
+            dirty_fids = self._dirty_fids
+            self._dirty_fids = set()
+
+        self._refresh_features(dirty_fids)
+
+    def _task_terminated(self, task: FeatureClassCacheTask) -> None:
+
+        if task is not self._task:
+            return
+
+        self._task = None
+        self._disconnect_layer()
+
+        # canceled build is requested again by the next render, build failing because of the
+        # feature ids keeps the pending config, so that renderers do not request it again
+        if task.fids_supported:
+            with self._lock:
+                self._pending_config = None
+
+    def _connect_layer(self, layer: QgsVectorLayer) -> None:
+
+        self._layer = layer
+
+        layer.attributeValueChanged.connect(self._attribute_value_changed)
+        layer.featureAdded.connect(self._feature_added)
+        layer.featureDeleted.connect(self._feature_deleted)
+        layer.committedFeaturesAdded.connect(self._committed_features_added)
+        layer.afterRollBack.connect(self.invalidate)
+        layer.willBeDeleted.connect(self.invalidate)
+        layer.dataChanged.connect(self._data_changed)
+        layer.updatedFields.connect(self.invalidate)
+
+    def _disconnect_layer(self) -> None:
+
+        if self._layer is None:
+            return
+
+        layer = self._layer
+        self._layer = None
+
+        layer.attributeValueChanged.disconnect(self._attribute_value_changed)
+        layer.featureAdded.disconnect(self._feature_added)
+        layer.featureDeleted.disconnect(self._feature_deleted)
+        layer.committedFeaturesAdded.disconnect(self._committed_features_added)
+        layer.afterRollBack.disconnect(self.invalidate)
+        layer.willBeDeleted.disconnect(self.invalidate)
+        layer.dataChanged.disconnect(self._data_changed)
+        layer.updatedFields.disconnect(self.invalidate)
+
+    def invalidate(self) -> None:
+        """Drops cached codes, next render requests a rebuild."""
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        self._disconnect_layer()
+
+        with self._lock:
+            self.config = None
+            self.codes = None
+            self._pending_config = None
+            self._dirty_fids = set()
+
+    def _data_changed(self) -> None:
+
+        # edits in the edit buffer are applied per feature
+        if self._layer is not None and not self._layer.isEditable():
+            self.invalidate()
+
+    def _set_code(self, fid: int, code: int) -> None:
+
+        with self._lock:
+
+            codes = self.codes
+
+            if fid >= len(codes):
+
+                if code == self.NOT_CACHED or fid > max(self.MINIMAL_MAX_FID, 4 * len(codes)):
+                    return
+
+                codes.extend(bytes([self.NOT_CACHED]) * (fid + 1 - len(codes)))
+
+            codes[fid] = code
+
+    def _refresh_features(self, fids: Iterable[int]) -> None:
+        """Recalculates codes of given features from current (possibly edited) layer values."""
+
+        # features added to edit buffer have temporary negative ids, these are not cached
+        fids = [fid for fid in fids if fid >= 0]
+
+        if not fids or self._layer is None:
+            return
+
+        if self._task is not None:
+            with self._lock:
+                self._dirty_fids.update(fids)
+            return
+
+        if self.codes is None:
+            return
+
+        for fid in fids:
+            self._set_code(fid, self.NOT_CACHED)
+
+        request = QgsFeatureRequest()
+        request.setFilterFids(fids)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([self.config.field_name_1, self.config.field_name_2],
+                                      self._layer.fields())
+
+        for feature in self._layer.getFeatures(request):
+            self._set_code(
+                feature.id(),
+                self.config.code(feature.attribute(self.config.field_name_1),
+                                 feature.attribute(self.config.field_name_2)))
+
+    def _attribute_value_changed(self, fid: int, index: int, value: Any) -> None:
+
+        field_name = self._layer.fields().at(index).name()
+
+        if field_name in (self._pending_or_current_config().field_name_1,
+                          self._pending_or_current_config().field_name_2):
+            self._refresh_features([fid])
+
+    def _pending_or_current_config(self) -> FeatureClassCacheConfig:
+
+        if self.config is not None:
+            return self.config
+
+        return self._pending_config
+
+    def _feature_added(self, fid: int) -> None:
+        self._refresh_features([fid])
+
+    def _committed_features_added(self, layer_id: str, features: List[QgsFeature]) -> None:
+        self._refresh_features([feature.id() for feature in features])
+
+    def _feature_deleted(self, fid: int) -> None:
+        self._refresh_features([fid])
@@ -0,0 +1,57 @@
+import threading
+from dataclasses import dataclass, replace
+from typing import Optional
+
+
+@dataclass
+class RenderStatistics:
+    """Counters collected by `BivariateRenderer` during one render (between start and stop)."""
+
+    features_rendered: int = 0
+    features_without_symbol: int = 0
+    null_values: int = 0
+    out_of_range_values: int = 0
+    feature_cache_hits: int = 0
+    feature_cache_misses: int = 0
+    symbol_for_feature_time: float = 0
+    palette_build_time: float = 0
+    palette_size: int = 0
+
+    def __str__(self) -> str:
+        return f"Rendered {self.features_rendered} features " \
+               f"({self.features_without_symbol} without symbol) " \
+               f"in {self.symbol_for_feature_time:.4f} s of symbolForFeature, " \
+               f"NULL values {self.null_values}, " \
+               f"out of range values {self.out_of_range_values}, " \
+               f"feature cache hits {self.feature_cache_hits} " \
+               f"and misses {self.feature_cache_misses}, " \
+               f"palette of {self.palette_size} symbols built in {self.palette_build_time:.4f} s."
+
+
+class RenderStatisticsCollector:
+    """
+    Keeps statistics of the last finished render. Shared between renderer clones, which are the
+    objects actually used by render jobs, possibly in parallel threads.
+    """
+
+    def __init__(self, log_statistics: bool = False):
+
+        self.log_statistics = log_statistics
+
+        self._lock = threading.Lock()
+        self._last = None
+
+    def add(self, statistics: RenderStatistics) -> None:
+
+        with self._lock:
+            self._last = statistics
+
+    @property
+    def last(self) -> Optional[RenderStatistics]:
+
+        with self._lock:
+
+            if self._last is None:
+                return None
+
+            return replace(self._last)
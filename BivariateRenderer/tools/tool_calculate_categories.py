@@ -1,8 +1,29 @@
+import itertools
+import sqlite3
+from array import array
+from collections import Counter, deque
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Queue
+from typing import Dict, List, Callable, Any, Iterable, Iterator, Deque, Tuple
+
+import numpy as np
+
 from qgis.core import (QgsProcessingAlgorithm, QgsProcessingParameterVectorLayer, QgsProcessing,
                        QgsProcessingParameterNumber, QgsProcessingParameterField,
-                       QgsProcessingParameterString, QgsField, QgsClassificationEqualInterval)
+                       QgsProcessingParameterString, QgsField, QgsClassificationEqualInterval,
+                       QgsVectorDataProvider, QgsFeatureRequest, QgsProcessingException, NULL,
+                       QgsVectorLayerFeatureSource, QgsProcessingFeedback,
+                       QgsVectorLayer, QgsProcessingParameterEnum,
+                       QgsClassificationQuantile, QgsClassificationJenks,
+                       QgsClassificationPrettyBreaks, QgsClassificationLogarithmic)
 from qgis.PyQt.QtCore import (QVariant)
 
+from ..classification.class_breaks import ClassBreaks
+from ..classification.columnar import iterate_numeric_columns
+from ..classification.bivariate_statistics import BivariateStatistics, classify_and_count
+from ..classification.sqlite_source import sqlite_source
+
 
 class CalculateCategoriesAlgorithm(QgsProcessingAlgorithm):
 
@@ -11,6 +32,15 @@ class CalculateCategoriesAlgorithm(QgsProcessingAlgorithm):
     FIELD_1 = "Field1"
     FIELD_2 = "Field2"
     RESULT_FIELD_NAME = "ResultFieldName"
+    CHUNK_SIZE = "ChunkSize"
+    NUMBER_OF_WORKERS = "NumberOfWorkers"
+    CLASSIFICATION_METHOD = "ClassificationMethod"
+    SAMPLE_SIZE = "SampleSize"
+
+    classification_methods = [
+        QgsClassificationEqualInterval, QgsClassificationQuantile, QgsClassificationJenks,
+        QgsClassificationPrettyBreaks, QgsClassificationLogarithmic
+    ]
 
     def initAlgorithm(self, config=None):
 
@@ -39,11 +69,41 @@ class CalculateCategoriesAlgorithm(QgsProcessingAlgorithm):
                 maxValue=5,
                 defaultValue=3))
 
+        self.addParameter(
+            QgsProcessingParameterEnum(self.CLASSIFICATION_METHOD,
+                                       "Classification method",
+                                       options=[x().name() for x in self.classification_methods],
+                                       defaultValue=0))
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SAMPLE_SIZE,
+                "Classify random sample of values of this size (0 uses all values, only for "
+                "methods that need all values)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=0))
+
         self.addParameter(
             QgsProcessingParameterString(self.RESULT_FIELD_NAME,
                                          "Result field name",
                                          defaultValue="Category"))
 
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CHUNK_SIZE,
+                "Number of features written to the data source at once",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=1,
+                defaultValue=10000))
+
+        self.addParameter(
+            QgsProcessingParameterNumber(self.NUMBER_OF_WORKERS,
+                                         "Number of parallel workers classifying the chunks",
+                                         type=QgsProcessingParameterNumber.Integer,
+                                         minValue=1,
+                                         defaultValue=1))
+
     def processAlgorithm(self, parameters, context, feedback):
 
         layer = self.parameterAsVectorLayer(parameters, self.INPUT_LAYER, context)
@@ -51,49 +111,324 @@ class CalculateCategoriesAlgorithm(QgsProcessingAlgorithm):
         field2 = self.parameterAsString(parameters, self.FIELD_2, context)
         number_of_classes = self.parameterAsDouble(parameters, self.NUMBER_CLASSES, context)
         result_field = self.parameterAsString(parameters, self.RESULT_FIELD_NAME, context)
+        chunk_size = self.parameterAsInt(parameters, self.CHUNK_SIZE, context)
+        number_of_workers = self.parameterAsInt(parameters, self.NUMBER_OF_WORKERS, context)
+        sample_size = self.parameterAsInt(parameters, self.SAMPLE_SIZE, context)
+        classification_alg = self.classification_methods[self.parameterAsEnum(
+            parameters, self.CLASSIFICATION_METHOD, context)]()
+
+        if layer.isEditable():
+            raise QgsProcessingException(
+                "Layer is in edit mode. Save or discard the edits before running the tool.")
+
+        provider = layer.dataProvider()
+
+        if not provider.capabilities() & QgsVectorDataProvider.ChangeAttributeValues:
+            raise QgsProcessingException(
+                "Data provider of the layer does not allow changing attribute values.")
 
-        classification_alg = QgsClassificationEqualInterval()
+        add_result_field = layer.fields().indexOf(result_field) < 0
 
-        layer.startEditing()
+        if add_result_field and not provider.capabilities() & QgsVectorDataProvider.AddAttributes:
+            raise QgsProcessingException(
+                "Data provider of the layer does not allow adding fields.")
 
-        layer.addAttribute(QgsField(result_field, QVariant.String))
+        # statistics of both fields are read together (min and max aggregated by the data source
+        # if possible), features in categories of SQLite databases are counted by GROUP BY query,
+        # otherwise they are counted from the written changes, without another pass
+        statistics = classify_and_count(layer,
+                                        field1,
+                                        field2,
+                                        classification_alg,
+                                        int(number_of_classes),
+                                        sample_size,
+                                        count_categories=sqlite_source(layer) is not None)
 
-        classes_1 = classification_alg.classes(layer, field1, int(number_of_classes))
-        classes_2 = classification_alg.classes(layer, field2, int(number_of_classes))
+        if statistics is None:
+            raise QgsProcessingException("Fields cannot be classified by the method.")
+
+        self.report_sampling_errors(statistics, field1, field2, feedback)
+
+        classes_1 = statistics.breaks_1
+        classes_2 = statistics.breaks_2
+
+        if add_result_field:
+
+            if not provider.addAttributes([QgsField(result_field, QVariant.String)]):
+                raise QgsProcessingException(
+                    f"Field {result_field} could not be added: {provider.lastError()}")
+
+            layer.updateFields()
 
         field_index = layer.fields().indexOf(result_field)
 
-        feature_count = layer.dataProvider().featureCount()
+        field_index_1 = layer.fields().lookupField(field1)
+        field_index_2 = layer.fields().lookupField(field2)
+
+        if self.update_in_database(layer, field1, field2, result_field, classes_1, classes_2,
+                                   feedback):
 
-        features_iterator = layer.getFeatures()
+            feedback.pushInfo("Categories calculated by single SQL UPDATE in the database.")
 
-        for number, feature in enumerate(features_iterator):
+            feedback.pushInfo(str(statistics))
 
-            if feedback.isCanceled():
-                break
+            provider.reloadData()
+            layer.triggerRepaint()
 
-            field_1_value = feature.attribute(field1)
-            field_2_value = feature.attribute(field2)
+            return {}
 
-            for i, range_class in enumerate(classes_1):
+        batches = iterate_numeric_columns(layer, [field1, field2])
 
-                if range_class.lowerBound() <= field_1_value <= range_class.upperBound():
-                    class_value_1 = i + 1
+        if batches is not None:
 
-            for i, range_class in enumerate(classes_2):
+            feedback.pushInfo("Values of fields read as columns using GDAL Arrow stream.")
 
-                if range_class.lowerBound() <= field_2_value <= range_class.upperBound():
-                    class_value_2 = i + 1
+            # columns are streamed, each chunk is written before next batch is read
+            feature_count = layer.featureCount()
 
-            layer.changeAttributeValue(feature.id(), field_index,
-                                       "{}-{}".format(class_value_1, class_value_2))
+            chunks = self.column_chunks(batches, chunk_size)
 
-            feedback.setProgress((number / feature_count) * 100)
+            def classify_chunk(
+                    chunk: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> Dict[int, Dict[int, str]]:
 
-        layer.commitChanges()
+                return self.classify_columns(chunk[0], chunk[1], chunk[2], classes_1, classes_2,
+                                             field_index)
+
+        else:
+
+            fids = self.feature_ids(layer)
+
+            feature_count = len(fids)
+
+            chunks = [fids[start:start + chunk_size] for start in range(0, len(fids), chunk_size)]
+
+            sources = Queue()
+
+            for _ in range(number_of_workers):
+                sources.put(QgsVectorLayerFeatureSource(layer))
+
+            def classify_chunk(chunk_fids: array) -> Dict[int, Dict[int, str]]:
+
+                source = sources.get()
+
+                try:
+                    return self.classify_features(source, chunk_fids, field_index_1, field_index_2,
+                                                  classes_1, classes_2, field_index)
+                finally:
+                    sources.put(source)
+
+        # chunks are written in order, so the result does not depend on number of workers, with
+        # more workers next chunks are read from separate feature sources while a chunk is written
+        written = 0
+
+        counts = np.zeros((len(classes_1), len(classes_2)), dtype=np.int64)
+
+        for changes in self.ordered_map(classify_chunk, chunks, number_of_workers, feedback):
+
+            if not provider.changeAttributeValues(changes):
+                raise QgsProcessingException(
+                    f"Categories could not be written: {provider.lastError()}")
+
+            self.add_category_counts(counts, changes, field_index)
+
+            written += len(changes)
+
+            feedback.setProgress((written / max(feature_count, 1)) * 100)
+
+        if not feedback.isCanceled():
+            feedback.pushInfo(str(replace(statistics, counts=counts)))
+
+        # provider level changes are not reported by the layer, reload notifies caches of its data
+        provider.reloadData()
+        layer.triggerRepaint()
 
         return {}
 
+    @staticmethod
+    def report_sampling_errors(statistics: BivariateStatistics, field_name_1: str,
+                               field_name_2: str, feedback: QgsProcessingFeedback) -> None:
+        """Reports errors of classes calculated from samples of values."""
+
+        for field_name, field_statistics, classes in [
+            (field_name_1, statistics.statistics_1, statistics.classes_1),
+            (field_name_2, statistics.statistics_2, statistics.classes_2)
+        ]:
+
+            if field_statistics.sampled:
+                feedback.pushInfo(f"{field_name}: {field_statistics.sampling_error(classes)}")
+
+    @staticmethod
+    def add_category_counts(counts: np.ndarray, changes: Dict[int, Dict[int, str]],
+                            result_field_index: int) -> None:
+        """Adds numbers of features in categories `i-j` of written changes to `counts`."""
+
+        categories = Counter(x[result_field_index] for x in changes.values()
+                             if isinstance(x[result_field_index], str))
+
+        for category, count in categories.items():
+
+            class_1, class_2 = category.split("-")
+
+            counts[int(class_1) - 1, int(class_2) - 1] += count
+
+    @staticmethod
+    def update_in_database(layer: QgsVectorLayer, field_1: str, field_2: str, result_field: str,
+                           classes_1: ClassBreaks, classes_2: ClassBreaks,
+                           feedback: QgsProcessingFeedback) -> bool:
+        """
+        Writes categories directly in GeoPackage or SpatiaLite database, if the layer is stored in
+        one. Returns False if this is not possible and features need to be processed in Python,
+        failure of the UPDATE is reported as warning.
+        """
+
+        source = sqlite_source(layer)
+
+        if source is None:
+            return False
+
+        try:
+
+            if not all(
+                    source.has_column(column) for column in (field_1, field_2, result_field)):
+                return False
+
+            source.update_categories(result_field, field_1, classes_1, field_2, classes_2)
+
+        except sqlite3.Error as error:
+
+            # geometry functions of triggers are not available outside of GDAL/SpatiaLite
+            if isinstance(error, sqlite3.NotSupportedError):
+                reason = "a trigger of the table calls geometry functions"
+            else:
+                reason = str(error)
+
+            feedback.pushWarning(f"Categories could not be written by SQL UPDATE ({reason}), "
+                                 f"features are processed by the data provider instead.")
+
+            return False
+
+        return True
+
+    @staticmethod
+    def classify_features(source: QgsVectorLayerFeatureSource, fids: array, field_index_1: int,
+                          field_index_2: int, classes_1: ClassBreaks, classes_2: ClassBreaks,
+                          result_field_index: int) -> Dict[int, Dict[int, str]]:
+        """Attribute changes with categories for features with given ids."""
+
+        request = CalculateCategoriesAlgorithm.attributes_request([field_index_1, field_index_2])
+        request.setFilterFids(list(fids))
+
+        changes: Dict[int, Dict[int, str]] = {}
+
+        for feature in source.getFeatures(request):
+
+            class_value_1 = classes_1.class_index(feature.attribute(field_index_1))
+            class_value_2 = classes_2.class_index(feature.attribute(field_index_2))
+
+            if class_value_1 is None or class_value_2 is None:
+                value = NULL
+            else:
+                value = "{}-{}".format(class_value_1 + 1, class_value_2 + 1)
+
+            changes[feature.id()] = {result_field_index: value}
+
+        return changes
+
+    @staticmethod
+    def classify_columns(fids: np.ndarray, values_1: np.ndarray, values_2: np.ndarray,
+                         classes_1: ClassBreaks, classes_2: ClassBreaks,
+                         result_field_index: int) -> Dict[int, Dict[int, str]]:
+        """Attribute changes with categories for features with given ids and field values."""
+
+        indices_1 = classes_1.class_indices(values_1)
+        indices_2 = classes_2.class_indices(values_2)
+
+        categories = [
+            "{}-{}".format(i + 1, j + 1) for i in range(len(classes_1))
+            for j in range(len(classes_2))
+        ]
+
+        codes = np.where((indices_1 >= 0) & (indices_2 >= 0),
+                         indices_1 * len(classes_2) + indices_2, -1)
+
+        return {
+            fid: {
+                result_field_index: categories[code] if code >= 0 else NULL
+            } for fid, code in zip(fids.tolist(), codes.tolist())
+        }
+
+    @staticmethod
+    def column_chunks(batches: Iterable[Tuple[np.ndarray, List[np.ndarray]]],
+                      chunk_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Batches of feature ids and values of both fields split into chunks of `chunk_size`."""
+
+        for fids, (values_1, values_2) in batches:
+
+            for start in range(0, len(fids), chunk_size):
+
+                end = start + chunk_size
+
+                yield fids[start:end], values_1[start:end], values_2[start:end]
+
+    @staticmethod
+    def ordered_map(function: Callable[[Any], Any], items: Iterable[Any], number_of_workers: int,
+                    feedback: QgsProcessingFeedback) -> Iterator[Any]:
+        """
+        Results of `function` for `items` in the order of the items. With more than one worker
+        the items are processed in a thread pool, with limited number of results waiting to be
+        consumed. Stops when processing is canceled.
+        """
+
+        if number_of_workers == 1:
+
+            for item in items:
+
+                if feedback.isCanceled():
+                    return
+
+                yield function(item)
+
+            return
+
+        with ThreadPoolExecutor(max_workers=number_of_workers) as executor:
+
+            items_iterator = iter(items)
+            pending: Deque[Future] = deque()
+
+            for item in itertools.islice(items_iterator, 2 * number_of_workers):
+                pending.append(executor.submit(function, item))
+
+            while pending:
+
+                if feedback.isCanceled():
+                    for future in pending:
+                        future.cancel()
+                    return
+
+                yield pending.popleft().result()
+
+                for item in itertools.islice(items_iterator, 1):
+                    pending.append(executor.submit(function, item))
+
+    @staticmethod
+    def attributes_request(attribute_indices: List[int]) -> QgsFeatureRequest:
+        """Request fetching only given attributes, without geometry."""
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(attribute_indices)
+
+        return request
+
+    @staticmethod
+    def feature_ids(layer) -> array:
+
+        request = CalculateCategoriesAlgorithm.attributes_request([])
+
+        fids = array("q", (feature.id() for feature in layer.getFeatures(request)))
+
+        return fids
+
     def name(self):
         return "createcategories"
 
@@ -0,0 +1,251 @@
+from typing import Optional
+
+from qgis.core import (QgsProcessingAlgorithm, QgsProcessingParameterFeatureSource, QgsProcessing,
+                       QgsProcessingParameterNumber, QgsProcessingParameterField,
+                       QgsProcessingParameterEnum, QgsProcessingParameterBoolean,
+                       QgsProcessingParameterFeatureSink, QgsProcessingUtils, QgsField, QgsFields,
+                       QgsFeature, QgsFeatureSink, QgsClassificationEqualInterval,
+                       QgsProcessingException, QgsFeatureSource, NULL)
+from qgis.PyQt.QtCore import (QVariant)
+
+from ..colorramps.color_ramps_register import BivariateColorRampsRegister
+from ..colormixing.color_mixing_methods_register import ColorMixingMethodsRegister
+from ..renderer.bivariate_renderer import BivariateRenderer
+from ..text_constants import Texts
+
+
+class CreateBivariateClassesAlgorithm(QgsProcessingAlgorithm):
+
+    INPUT = "Input"
+    FIELD_1 = "Field1"
+    FIELD_2 = "Field2"
+    NUMBER_CLASSES = "NumberOfClasses"
+    COLOR_RAMP = "ColorRamp"
+    COLOR_MIXING_METHOD = "ColorMixingMethod"
+    USE_LAYER_RENDERER = "UseLayerRenderer"
+    OUTPUT = "Output"
+
+    FIELD_CLASS_1 = "class_1"
+    FIELD_CLASS_2 = "class_2"
+    FIELD_CLASS_CODE = "class_code"
+    FIELD_COLOR = "color"
+
+    layer_renderer: Optional[BivariateRenderer] = None
+
+    def initAlgorithm(self, config=None):
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(self.INPUT, "Input polygon layer",
+                                                [QgsProcessing.TypeVectorPolygon]))
+
+        self.addParameter(
+            QgsProcessingParameterField(self.FIELD_1,
+                                        "Select field 1",
+                                        parentLayerParameterName=self.INPUT,
+                                        type=QgsProcessingParameterField.Numeric))
+
+        self.addParameter(
+            QgsProcessingParameterField(self.FIELD_2,
+                                        "Select field 2",
+                                        parentLayerParameterName=self.INPUT,
+                                        type=QgsProcessingParameterField.Numeric))
+
+        self.addParameter(
+            QgsProcessingParameterNumber(self.NUMBER_CLASSES,
+                                         "Number of classes for each field",
+                                         type=QgsProcessingParameterNumber.Integer,
+                                         minValue=2,
+                                         maxValue=5,
+                                         defaultValue=3))
+
+        self.addParameter(
+            QgsProcessingParameterEnum(self.COLOR_RAMP,
+                                       "Color ramps",
+                                       options=BivariateColorRampsRegister().names,
+                                       defaultValue=0))
+
+        self.addParameter(
+            QgsProcessingParameterEnum(self.COLOR_MIXING_METHOD,
+                                       "Color mixing method",
+                                       options=ColorMixingMethodsRegister().names,
+                                       defaultValue=0))
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.USE_LAYER_RENDERER,
+                "Use fields, classes and colors of the layer's Bivariate Renderer, if it has one",
+                defaultValue=True))
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT, "Output layer",
+                                              QgsProcessing.TypeVectorPolygon))
+
+    def prepareAlgorithm(self, parameters, context, feedback):
+
+        # renderer of the layer is cloned here, in the main thread
+        self.layer_renderer = None
+
+        if self.parameterAsBoolean(parameters, self.USE_LAYER_RENDERER, context):
+            self.layer_renderer = self.clone_layer_renderer(parameters, context)
+
+        if self.layer_renderer is not None:
+
+            fields = (self.parameterAsString(parameters, self.FIELD_1, context),
+                      self.parameterAsString(parameters, self.FIELD_2, context))
+
+            renderer_fields = (self.layer_renderer.field_name_1, self.layer_renderer.field_name_2)
+
+            if fields != renderer_fields:
+                raise QgsProcessingException(
+                    f"Selected fields {fields[0]} and {fields[1]} differ from fields "
+                    f"{renderer_fields[0]} and {renderer_fields[1]} of the layer's Bivariate "
+                    "Renderer. Select the renderer's fields or do not use the layer's renderer.")
+
+        return True
+
+    def processAlgorithm(self, parameters, context, feedback):
+
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+
+        renderer = self.layer_renderer
+
+        if renderer is None:
+            renderer = self.create_renderer(source, parameters, context)
+
+        field_index_1 = source.fields().lookupField(renderer.field_name_1)
+        field_index_2 = source.fields().lookupField(renderer.field_name_2)
+
+        if field_index_1 < 0 or field_index_2 < 0:
+            raise QgsProcessingException(
+                f"Fields {renderer.field_name_1} and {renderer.field_name_2} are not in input.")
+
+        output_fields = QgsProcessingUtils.combineFields(source.fields(), self.class_fields())
+
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, output_fields,
+                                               source.wkbType(), source.sourceCrs())
+
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        colors = [[color.name() for color in row] for row in renderer.getMixedColors()]
+        number_of_classes_2 = len(renderer.field_2_breaks)
+
+        feature_count = max(source.featureCount(), 1)
+
+        for number, feature in enumerate(source.getFeatures()):
+
+            if feedback.isCanceled():
+                break
+
+            class_index_1 = renderer.field_1_breaks.class_index(feature.attribute(field_index_1))
+            class_index_2 = renderer.field_2_breaks.class_index(feature.attribute(field_index_2))
+
+            if class_index_1 is None or class_index_2 is None:
+                class_values = [NULL, NULL, NULL, NULL]
+            else:
+                class_values = [
+                    class_index_1 + 1, class_index_2 + 1,
+                    class_index_1 * number_of_classes_2 + class_index_2,
+                    colors[class_index_1][class_index_2]
+                ]
+
+            output_feature = QgsFeature(output_fields)
+            output_feature.setGeometry(feature.geometry())
+            output_feature.setAttributes(feature.attributes() + class_values)
+
+            if not sink.addFeature(output_feature, QgsFeatureSink.FastInsert):
+                raise QgsProcessingException(self.writeFeatureError(sink, parameters, self.OUTPUT))
+
+            feedback.setProgress((number / feature_count) * 100)
+
+        return {self.OUTPUT: dest_id}
+
+    def class_fields(self) -> QgsFields:
+
+        fields = QgsFields()
+        fields.append(QgsField(self.FIELD_CLASS_1, QVariant.Int))
+        fields.append(QgsField(self.FIELD_CLASS_2, QVariant.Int))
+        fields.append(QgsField(self.FIELD_CLASS_CODE, QVariant.Int))
+        fields.append(QgsField(self.FIELD_COLOR, QVariant.String, len=7))
+
+        return fields
+
+    def clone_layer_renderer(self, parameters, context) -> Optional[BivariateRenderer]:
+
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+
+        if layer is not None and layer.renderer() is not None and \
+                layer.renderer().type() == Texts.bivariate_renderer_short_name:
+            return layer.renderer().clone()
+
+        return None
+
+    def create_renderer(self, source: QgsFeatureSource, parameters, context) -> BivariateRenderer:
+
+        field_1 = self.parameterAsString(parameters, self.FIELD_1, context)
+        field_2 = self.parameterAsString(parameters, self.FIELD_2, context)
+        number_of_classes = self.parameterAsInt(parameters, self.NUMBER_CLASSES, context)
+
+        color_ramps = BivariateColorRampsRegister().color_ramps[self.parameterAsEnum(
+            parameters, self.COLOR_RAMP, context)]
+
+        color_mixing_method = ColorMixingMethodsRegister().methods[self.parameterAsEnum(
+            parameters, self.COLOR_MIXING_METHOD, context)]
+
+        classification_method = QgsClassificationEqualInterval()
+
+        renderer = BivariateRenderer()
+        renderer.setFieldName1(field_1)
+        renderer.setFieldName2(field_2)
+        renderer.setNumberOfClasses(number_of_classes)
+        renderer.setClassificationMethodName(classification_method.name())
+        renderer.setColorRamp1(color_ramps.color_ramp_1)
+        renderer.setColorRamp2(color_ramps.color_ramp_2)
+        renderer.setColorMixingMethod(color_mixing_method)
+
+        for field_name, set_classes in ((field_1, renderer.setField1Classes),
+                                        (field_2, renderer.setField2Classes)):
+
+            field_index = source.fields().lookupField(field_name)
+
+            if field_index < 0:
+                raise QgsProcessingException(f"Field {field_name} is not in input.")
+
+            minimum = source.minimumValue(field_index)
+            maximum = source.maximumValue(field_index)
+
+            if minimum is None or maximum is None or minimum == NULL or maximum == NULL:
+                raise QgsProcessingException(
+                    f"Field {field_name} contains only NULL values, it cannot be classified.")
+
+            set_classes(
+                classification_method.classes(float(minimum), float(maximum), number_of_classes))
+
+        return renderer
+
+    def name(self):
+        return "createbivariateclasses"
+
+    def displayName(self):
+        return "Create Bivariate Classes and Colors"
+
+    def shortHelpString(self):
+        return "Copies the input layer into new layer with added fields: classes of both fields " \
+               f"({self.FIELD_CLASS_1}, {self.FIELD_CLASS_2}, numbered from 1), " \
+               f"combined class code ({self.FIELD_CLASS_CODE}, " \
+               "class 1 index * number of classes 2 + class 2 index, both indices from 0) " \
+               f"and mixed color in hex format ({self.FIELD_COLOR}). Input layer is not " \
+               "modified. If the layer's Bivariate Renderer is used, selected fields must be " \
+               "the fields of the renderer."
+
+    def group(self):
+        pass
+
+    def groupId(self):
+        pass
+
+    def createInstance(self):
+        return CreateBivariateClassesAlgorithm()
@@ -0,0 +1,317 @@
+"""
+Micro-benchmarks of hot paths of the plugin on synthetic polygon layers.
+
+Run as module from the repository root (QGIS python libraries need to be on PYTHONPATH):
+
+    python -m benchmarks.benchmark_plugin --sizes 10000 100000 --output results.json
+
+Results are written as JSON, if `--baseline` with previously stored results is provided, ratio of
+each timing to the baseline is added. Synthetic data are generated from `--seed`, so results of
+runs with the same seed are comparable.
+"""
+
+import argparse
+import json
+import platform
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Any, Optional
+
+from qgis.core import (QgsApplication, QgsVectorLayer, QgsFeature, QgsGeometry, QgsField,
+                       QgsRectangle, QgsRenderContext, QgsClassificationEqualInterval,
+                       QgsProcessingContext, QgsProcessingFeedback, QgsFeatureRequest,
+                       Qgis)
+from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtGui import QImage, QPainter, QColor
+
+from BivariateRenderer.renderer.bivariate_renderer import BivariateRenderer
+from BivariateRenderer.colorramps.bivariate_color_ramp import BivariateColorRampGreenPink
+from BivariateRenderer.colormixing.color_mixing_methods_register import ColorMixingMethodsRegister
+from BivariateRenderer.legendrenderer.legend_renderer import LegendRenderer
+from BivariateRenderer.tools.tool_calculate_categories import CalculateCategoriesAlgorithm
+
+DEFAULT_SEED = 42
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DATA_KINDS = ["continuous", "low_cardinality"]
+LEGEND_DPIS = [96, 300, 600]
+LEGEND_SIZE_MM = 50
+
+
+def create_layer(size: int, kind: str, seed: int = DEFAULT_SEED) -> QgsVectorLayer:
+    """Memory layer of `size` square polygons in a grid with numeric fields `value1`, `value2`."""
+
+    layer = QgsVectorLayer("Polygon?crs=EPSG:3857", f"{kind}_{size}", "memory")
+
+    provider = layer.dataProvider()
+    provider.addAttributes(
+        [QgsField("value1", QVariant.Double),
+         QgsField("value2", QVariant.Double)])
+    layer.updateFields()
+
+    rng = random.Random(seed)
+
+    columns = int(size**0.5) + 1
+
+    batch = []
+
+    for i in range(size):
+
+        x = i % columns
+        y = i // columns
+
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + 1, y + 1)))
+
+        if kind == "continuous":
+            feature.setAttributes([rng.random() * 1000, rng.gauss(50, 15)])
+        else:
+            feature.setAttributes([float(rng.randint(0, 9)), float(rng.randint(0, 4))])
+
+        batch.append(feature)
+
+        if len(batch) == 50000:
+            provider.addFeatures(batch)
+            batch = []
+
+    provider.addFeatures(batch)
+
+    layer.updateExtents()
+
+    return layer
+
+
+def create_renderer(layer: QgsVectorLayer) -> BivariateRenderer:
+
+    color_ramps = BivariateColorRampGreenPink()
+    classification = QgsClassificationEqualInterval()
+
+    renderer = BivariateRenderer()
+    renderer.setFieldName1("value1")
+    renderer.setFieldName2("value2")
+    renderer.setColorRamp1(color_ramps.color_ramp_1)
+    renderer.setColorRamp2(color_ramps.color_ramp_2)
+    renderer.setField1Classes(classification.classes(layer, "value1", renderer.number_classes))
+    renderer.setField2Classes(classification.classes(layer, "value2", renderer.number_classes))
+
+    return renderer
+
+
+def measure(function: Callable[[], Any], repeats: int) -> Dict[str, float]:
+
+    timings = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return {"min": min(timings), "mean": sum(timings) / len(timings), "repeats": repeats}
+
+
+def benchmark_symbol_for_feature(renderer: BivariateRenderer, layer: QgsVectorLayer,
+                                 features: List[QgsFeature]) -> Callable[[], None]:
+
+    def run():
+        context = QgsRenderContext()
+        renderer.startRender(context, layer.fields())
+        for feature in features:
+            renderer.symbolForFeature(feature, context)
+        renderer.stopRender(context)
+
+    return run
+
+
+def benchmark_feature_color(renderer: BivariateRenderer,
+                            values: List[tuple]) -> Callable[[], None]:
+
+    def run():
+        for value1, value2 in values:
+            renderer.getFeatureColor(value1, value2)
+
+    return run
+
+
+def benchmark_color_mixing(method, colors: List[tuple]) -> Callable[[], None]:
+
+    def run():
+        for color1, color2 in colors:
+            method.mix_colors(color1, color2)
+
+    return run
+
+
+def benchmark_legend(renderer: BivariateRenderer, dpi: int) -> Callable[[], None]:
+
+    size = int(LEGEND_SIZE_MM * dpi / 25.4)
+
+    def run():
+        image = QImage(size, size, QImage.Format_ARGB32)
+        image.fill(QColor(0, 0, 0, 0))
+
+        painter = QPainter(image)
+
+        context = QgsRenderContext.fromQPainter(painter)
+        context.setScaleFactor(dpi / 25.4)
+
+        legend_renderer = LegendRenderer()
+        legend_renderer.add_axes_arrows = True
+        legend_renderer.add_axes_texts = True
+        legend_renderer.add_axes_ticks_texts = True
+        legend_renderer.texts_axis_x_ticks = renderer.field_1_labels
+        legend_renderer.texts_axis_y_ticks = renderer.field_2_labels
+        legend_renderer.render(context, LEGEND_SIZE_MM, LEGEND_SIZE_MM,
+                               renderer.generate_legend_polygons())
+
+        painter.end()
+
+    return run
+
+
+def benchmark_calculate_categories(layer: QgsVectorLayer, repeats: int) -> Callable[[], None]:
+
+    # the algorithm adds field to the layer, so every run works on fresh copy, copies are made
+    # beforehand, so that the timing does not include them
+    layer_copies = [layer.materialize(QgsFeatureRequest()) for _ in range(repeats)]
+
+    def run():
+        layer_copy = layer_copies.pop()
+
+        algorithm = CalculateCategoriesAlgorithm()
+        algorithm.initAlgorithm()
+
+        parameters = {
+            CalculateCategoriesAlgorithm.INPUT_LAYER: layer_copy,
+            CalculateCategoriesAlgorithm.FIELD_1: "value1",
+            CalculateCategoriesAlgorithm.FIELD_2: "value2",
+            CalculateCategoriesAlgorithm.NUMBER_CLASSES: 3,
+            CalculateCategoriesAlgorithm.RESULT_FIELD_NAME: "Category"
+        }
+
+        algorithm.processAlgorithm(parameters, QgsProcessingContext(), QgsProcessingFeedback())
+
+    return run
+
+
+def run_benchmarks(sizes: List[int],
+                   repeats: int,
+                   processing_max_size: int,
+                   seed: int = DEFAULT_SEED) -> Dict[str, Any]:
+
+    results = []
+
+    rng = random.Random(seed)
+
+    for kind in DATA_KINDS:
+
+        for size in sizes:
+
+            layer = create_layer(size, kind, seed)
+            renderer = create_renderer(layer)
+
+            features = list(layer.getFeatures())
+            values = [(f.attribute("value1"), f.attribute("value2")) for f in features]
+
+            colors = [(renderer.color_ramp_1.color(rng.random()),
+                       renderer.color_ramp_2.color(rng.random())) for _ in range(size)]
+
+            cases = {
+                "BivariateRenderer.symbolForFeature":
+                    benchmark_symbol_for_feature(renderer, layer, features),
+                "BivariateRenderer.getFeatureColor":
+                    benchmark_feature_color(renderer, values),
+            }
+
+            for method in ColorMixingMethodsRegister().methods:
+                cases[f"ColorMixingMethod.mix_colors[{method.name()}]"] = \
+                    benchmark_color_mixing(method, colors)
+
+            if size <= processing_max_size:
+                cases["CalculateCategoriesAlgorithm.processAlgorithm"] = \
+                    benchmark_calculate_categories(layer, repeats)
+
+            for name, function in cases.items():
+
+                results.append({
+                    "benchmark": name,
+                    "data": kind,
+                    "features": size,
+                    "timing": measure(function, repeats)
+                })
+
+    renderer = create_renderer(create_layer(1000, DATA_KINDS[0], seed))
+
+    for dpi in LEGEND_DPIS:
+        results.append({
+            "benchmark": "LegendRenderer.render",
+            "dpi": dpi,
+            "timing": measure(benchmark_legend(renderer, dpi), repeats)
+        })
+
+    return {
+        "environment": {
+            "seed": seed,
+            "python": platform.python_version(),
+            "qgis": Qgis.QGIS_VERSION,
+            "platform": platform.platform()
+        },
+        "results": results
+    }
+
+
+def result_key(result: Dict[str, Any]) -> tuple:
+    return (result["benchmark"], result.get("data"), result.get("features"), result.get("dpi"))
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+
+    baseline_timings = {result_key(x): x["timing"]["min"] for x in baseline["results"]}
+
+    for result in results["results"]:
+
+        baseline_timing = baseline_timings.get(result_key(result))
+
+        if baseline_timing:
+            result["ratio_to_baseline"] = result["timing"]["min"] / baseline_timing
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--processing-max-size",
+                        type=int,
+                        default=100000,
+                        help="Largest layer to run the processing algorithm on.")
+    parser.add_argument("--output", type=Path, help="JSON file to write, stdout if not set.")
+    parser.add_argument("--baseline", type=Path, help="JSON file with stored baseline results.")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=DEFAULT_SEED,
+                        help="Seed of random generator of synthetic data.")
+
+    args = parser.parse_args(arguments)
+
+    qgs_app = QgsApplication([], False)
+    qgs_app.initQgis()
+
+    try:
+        results = run_benchmarks(args.sizes, args.repeats, args.processing_max_size, args.seed)
+    finally:
+        qgs_app.exitQgis()
+
+    if args.baseline:
+        compare_with_baseline(results, json.loads(args.baseline.read_text()))
+
+    text = json.dumps(results, indent=2)
+
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
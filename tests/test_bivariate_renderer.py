@@ -1,13 +1,19 @@
 from PyQt5.QtXml import QDomElement
-from qgis.core import (QgsVectorLayer, QgsProject, QgsLayout, QgsReadWriteContext)
+from qgis.core import (QgsVectorLayer, QgsProject, QgsLayout, QgsReadWriteContext, QgsExpression,
+                       QgsExpressionContext, QgsExpressionContextUtils, QgsRenderContext,
+                       QgsFeatureRequest, QgsMapSettings, QgsMapRendererSequentialJob, QgsStyle)
 from qgis.PyQt.QtXml import QDomDocument
+from qgis.PyQt.QtGui import QColor, QImage
+from qgis.PyQt.QtCore import QSize
 
 from BivariateRenderer.colorramps.color_ramps_register import BivariateColorRampGreenPink
 from BivariateRenderer.renderer.bivariate_renderer import BivariateRenderer
+from BivariateRenderer.renderer.bivariate_renderer_widget import BivariateRendererWidget
 
 from tests import set_up_bivariate_renderer, save_layout_for_layer, assert_images_equal
 
 import pytest
+import numpy as np
 
 
 @pytest.mark.skip(reason="Problem with comparing the outcomes")
@@ -98,3 +104,269 @@ def test_functions(nc_layer: QgsVectorLayer):
 
     assert isinstance(bivariate_renderer.save(QDomDocument("doc"), QgsReadWriteContext()),
                       QDomElement)
+
+
+def test_palette(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    palette = bivariate_renderer.getPalette()
+
+    assert len(palette) == bivariate_renderer.number_classes
+    assert all(len(row) == bivariate_renderer.number_classes for row in palette)
+
+    symbols = set()
+
+    for feature in nc_layer.getFeatures():
+
+        symbol = bivariate_renderer.symbol_for_values(feature.attribute("AREA"),
+                                                      feature.attribute("PERIMETER"))
+
+        assert symbol is not None
+        assert any(symbol is palette_symbol for row in palette for palette_symbol in row)
+
+        symbols.add(id(symbol))
+
+    assert len(symbols) <= bivariate_renderer.number_classes**2
+
+
+def test_classify_arrays(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    features = list(nc_layer.getFeatures())
+
+    values_1 = np.array([f.attribute("AREA") for f in features] + [np.nan], dtype=float)
+    values_2 = np.array([f.attribute("PERIMETER") for f in features] + [1], dtype=float)
+
+    indices_1, indices_2, colors = bivariate_renderer.classify_arrays(values_1, values_2)
+
+    assert indices_1.shape == (len(features) + 1,)
+    assert colors.shape == (len(features) + 1, 4)
+
+    for i, feature in enumerate(features):
+
+        color = bivariate_renderer.getFeatureColor(feature.attribute("AREA"),
+                                                   feature.attribute("PERIMETER"))
+
+        assert indices_1[i] == bivariate_renderer.classIndexField1(feature.attribute("AREA"))
+        assert indices_2[i] == bivariate_renderer.classIndexField2(feature.attribute("PERIMETER"))
+        assert tuple(colors[i]) == (color.red(), color.green(), color.blue(), color.alpha())
+
+    assert indices_1[-1] == -1
+    assert tuple(colors[-1]) == (0, 0, 0, 0)
+
+
+def test_native_rendering(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    categorized_renderer = bivariate_renderer.createCategorizedRenderer()
+
+    assert len(categorized_renderer.categories()) == bivariate_renderer.number_classes**2
+
+    expression = QgsExpression(bivariate_renderer.class_pair_expression())
+
+    assert not expression.hasParserError()
+
+    context = QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(nc_layer))
+
+    for feature in nc_layer.getFeatures():
+
+        context.setFeature(feature)
+
+        class_index_1 = bivariate_renderer.classIndexField1(feature.attribute("AREA"))
+        class_index_2 = bivariate_renderer.classIndexField2(feature.attribute("PERIMETER"))
+
+        assert expression.evaluate(context) == f"{class_index_1 + 1}-{class_index_2 + 1}"
+
+    bivariate_renderer.setNativeRendering(True)
+
+    renderer_from_xml = BivariateRenderer.create_render_from_element(
+        bivariate_renderer.save(QDomDocument("doc"), QgsReadWriteContext()))
+
+    assert renderer_from_xml.native_rendering
+    assert bivariate_renderer.clone().native_rendering
+
+
+def render_layer(layer: QgsVectorLayer) -> QImage:
+
+    settings = QgsMapSettings()
+    settings.setLayers([layer])
+    settings.setDestinationCrs(layer.crs())
+    settings.setExtent(layer.extent())
+    settings.setOutputSize(QSize(600, 300))
+    settings.setBackgroundColor(QColor(255, 255, 255))
+
+    job = QgsMapRendererSequentialJob(settings)
+    job.start()
+    job.waitForFinished()
+
+    return job.renderedImage()
+
+
+def test_native_rendering_identical_output(nc_layer: QgsVectorLayer):
+
+    layer = nc_layer.materialize(QgsFeatureRequest())
+
+    bivariate_renderer = set_up_bivariate_renderer(layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    # NULL values and values outside of the class breaks, on both sides
+    index_1 = layer.fields().lookupField("AREA")
+    index_2 = layer.fields().lookupField("PERIMETER")
+
+    fids = [feature.id() for feature in layer.getFeatures()]
+
+    layer.dataProvider().changeAttributeValues({
+        fids[0]: {index_1: None},
+        fids[1]: {index_2: None},
+        fids[2]: {index_1: -1000.0},
+        fids[3]: {index_2: 1000000.0},
+        fids[4]: {index_1: 1000000.0, index_2: -1000.0},
+    })
+
+    layer.setRenderer(bivariate_renderer.clone())
+
+    image = render_layer(layer)
+
+    bivariate_renderer.setNativeRendering(True)
+
+    layer.setRenderer(bivariate_renderer.clone())
+
+    native_image = render_layer(layer)
+
+    assert image.pixel(0, 0) != image.pixel(300, 150)
+    assert native_image == image
+
+
+def test_incremental_invalidation(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    bivariate_renderer.getPalette()
+
+    ramp_colors_1 = bivariate_renderer.tables.ramp_colors_1
+    ramp_colors_2 = bivariate_renderer.tables.ramp_colors_2
+
+    bivariate_renderer.setColorRamp2(BivariateColorRampGreenPink().color_ramp_1)
+
+    assert bivariate_renderer.tables.ramp_colors_1 is ramp_colors_1
+    assert bivariate_renderer.tables.ramp_colors_2 is None
+    assert bivariate_renderer.tables.palette is None
+
+    bivariate_renderer.getPalette()
+
+    bivariate_renderer.setColorMixingMethod(bivariate_renderer.color_mixing_method)
+
+    assert bivariate_renderer.tables.ramp_colors_1 is ramp_colors_1
+    assert bivariate_renderer.tables.ramp_colors_2 is not None
+    assert bivariate_renderer.tables.ramp_colors_2 != ramp_colors_2
+    assert bivariate_renderer.tables.mixed_colors is None
+
+    palette = bivariate_renderer.getPalette()
+
+    bivariate_renderer.setFieldName1("PERIMETER")
+
+    assert bivariate_renderer.getPalette() is palette
+
+
+def test_clone_shares_tables(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    clone_1 = bivariate_renderer.clone()
+    clone_2 = bivariate_renderer.clone()
+
+    assert clone_1.tables is bivariate_renderer.tables
+    assert clone_2.getPalette() is bivariate_renderer.getPalette()
+    assert clone_1.field_1_breaks is bivariate_renderer.field_1_breaks
+    assert clone_1 == bivariate_renderer
+
+    clone_1.setColorRamp1(BivariateColorRampGreenPink().color_ramp_2)
+
+    assert clone_1.tables is not bivariate_renderer.tables
+    assert clone_1.tables.ramp_colors_2 is bivariate_renderer.tables.ramp_colors_2
+    assert clone_2.tables is bivariate_renderer.tables
+
+
+def test_render_statistics(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    assert bivariate_renderer.lastRenderStatistics() is None
+
+    bivariate_renderer.setCollectStatistics(True)
+
+    context = QgsRenderContext()
+
+    bivariate_renderer.startRender(context, nc_layer.fields())
+
+    for feature in nc_layer.getFeatures():
+        assert bivariate_renderer.symbolForFeature(feature, context)
+
+    bivariate_renderer.stopRender(context)
+
+    statistics = bivariate_renderer.lastRenderStatistics()
+
+    assert statistics.features_rendered == nc_layer.featureCount()
+    assert statistics.features_without_symbol == 0
+    assert statistics.null_values == 0
+    assert statistics.palette_size == bivariate_renderer.number_classes**2
+    assert statistics.symbol_for_feature_time > 0
+
+
+def test_renderer_without_classes(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = BivariateRenderer()
+
+    assert not bivariate_renderer.has_classes()
+
+    clone = bivariate_renderer.clone()
+
+    assert clone.field_1_labels == []
+    assert clone.generate_legend_polygons() == []
+    assert clone.symbol_for_values(1, 2) is None
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER")
+
+    assert bivariate_renderer.has_classes()
+
+
+@pytest.mark.parametrize("method_name", list(BivariateRendererWidget.classification_methods))
+def test_classification_method_round_trip(nc_layer: QgsVectorLayer, method_name: str):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER")
+    bivariate_renderer.setClassificationMethodName(method_name)
+
+    renderer_from_xml = BivariateRenderer.create_render_from_element(
+        bivariate_renderer.save(QDomDocument("doc"), QgsReadWriteContext()))
+
+    assert renderer_from_xml.classification_method_name == method_name
+
+    widget = BivariateRendererWidget(layer=nc_layer,
+                                     style=QgsStyle(),
+                                     renderer=renderer_from_xml)
+
+    assert widget.cb_classification_methods.currentText() == method_name
+    assert widget.classification_method.name() == method_name
@@ -1,14 +1,34 @@
-from qgis.core import (QgsVectorLayer, QgsClassificationMethod, QgsTextFormat)
+import time
+
+from qgis.core import (QgsVectorLayer, QgsClassificationMethod, QgsTextFormat,
+                       QgsClassificationEqualInterval, QgsStyle)
 from qgis.gui import (QgsFieldComboBox, QgsDoubleSpinBox, QgsColorRampButton)
 from qgis.PyQt.QtWidgets import (QComboBox, QLabel, QFormLayout)
+from qgis.PyQt.QtCore import QCoreApplication
 
 from BivariateRenderer.renderer.bivariate_renderer import BivariateRenderer
+from BivariateRenderer.renderer.bivariate_renderer_widget import BivariateRendererWidget
 from BivariateRenderer.colorramps.bivariate_color_ramp import BivariateColorRampGreenPink
 from BivariateRenderer.legendrenderer.legend_renderer import LegendRenderer
+from BivariateRenderer.classification.field_statistics_cache import FieldStatisticsCache
 
 from tests import set_up_bivariate_renderer_widget
 
 
+def bounds(classes):
+    return [(x.lowerBound(), x.upperBound()) for x in classes]
+
+
+def wait_for_classification(widget: BivariateRendererWidget) -> None:
+
+    deadline = time.monotonic() + 10
+
+    while widget.classification_running() and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+
+    assert not widget.classification_running()
+
+
 def test_widget_elements(nc_layer: QgsVectorLayer):
 
     widget = set_up_bivariate_renderer_widget(nc_layer)
@@ -45,3 +65,105 @@ def test_widget_values(nc_layer: QgsVectorLayer):
 
     assert widget.bt_color_ramp1.colorRamp().properties() == color_ramp.color_ramp_1.properties()
     assert widget.bt_color_ramp2.colorRamp().properties() == color_ramp.color_ramp_2.properties()
+
+
+def test_widget_background_classification(nc_layer: QgsVectorLayer):
+
+    widget = set_up_bivariate_renderer_widget(nc_layer)
+
+    FieldStatisticsCache().invalidate()
+
+    widget.cb_field1.setField("PERIMETER")
+
+    wait_for_classification(widget)
+
+    expected = QgsClassificationEqualInterval().classes(nc_layer, "PERIMETER",
+                                                        widget.number_of_classes)
+
+    assert widget.bivariate_renderer.field_name_1 == "PERIMETER"
+    assert bounds(widget.bivariate_renderer.field_1_classes) == bounds(expected)
+
+    # statistics are cached now, classification is immediate
+    widget.sb_number_classes.setValue(4)
+    widget.apply_pending_updates()
+
+    assert not widget.classification_running()
+    assert len(widget.bivariate_renderer.field_1_classes) == 4
+
+
+def test_widget_coalesced_updates(nc_layer: QgsVectorLayer, monkeypatch):
+
+    widget = set_up_bivariate_renderer_widget(nc_layer)
+    widget.apply_pending_updates()
+
+    legend_updates = []
+    classifications = []
+
+    monkeypatch.setattr(widget, "update_legend", lambda: legend_updates.append(True))
+    monkeypatch.setattr(widget, "classify_fields", classifications.append)
+
+    with widget.updates_suspended():
+        widget.cb_field1.setField("PERIMETER")
+        widget.cb_field2.setField("AREA")
+        widget.sb_number_classes.setValue(4)
+        widget.sb_number_classes.setValue(5)
+
+        assert legend_updates == []
+        assert classifications == []
+
+    assert legend_updates == [True]
+    # both axes are classified together, fields are read in a single pass
+    assert classifications == [[1, 2]]
+
+    widget.bt_color_ramp1.setColorRamp(BivariateColorRampGreenPink().color_ramp_2)
+    widget.bt_color_ramp2.setColorRamp(BivariateColorRampGreenPink().color_ramp_1)
+
+    assert widget.update_timer.isActive()
+
+    widget.apply_pending_updates()
+
+    assert legend_updates == [True, True]
+
+
+def test_widget_new_renderer(nc_layer: QgsVectorLayer):
+
+    FieldStatisticsCache().invalidate()
+
+    widget = BivariateRendererWidget(layer=nc_layer,
+                                     style=QgsStyle(),
+                                     renderer=BivariateRenderer())
+
+    # fields are classified in background, legend waits for the classes
+    assert widget.label_legend.pixmap() is None or widget.label_legend.pixmap().isNull()
+
+    wait_for_classification(widget)
+
+    widget.apply_pending_updates()
+
+    assert widget.bivariate_renderer.has_classes()
+    assert not widget.label_legend.pixmap().isNull()
+    assert widget.renderer().clone().has_classes()
+
+
+def test_widget_count_categories(nc_layer: QgsVectorLayer):
+
+    widget = set_up_bivariate_renderer_widget(nc_layer)
+
+    widget.apply_pending_updates()
+    wait_for_classification(widget)
+
+    # features are not counted unless requested
+    assert widget.label_counts.text() == ""
+
+    widget.cb_count_categories.setChecked(True)
+    widget.apply_pending_updates()
+
+    assert widget.classification_running()
+
+    wait_for_classification(widget)
+
+    assert f"{nc_layer.featureCount()} features" in widget.label_counts.text()
+
+    widget.cb_count_categories.setChecked(False)
+
+    assert widget.label_counts.text() == ""
@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from qgis.core import (QgsVectorLayer, QgsFeatureRequest, QgsClassificationEqualInterval,
+                       QgsClassificationQuantile)
+
+from BivariateRenderer.classification.bivariate_statistics import (BivariateStatisticsReader,
+                                                                   classify_and_count,
+                                                                   class_pair_counts)
+from BivariateRenderer.classification.class_breaks import ClassBreaks
+from BivariateRenderer.classification.field_classes_task import FieldClassesTask
+from BivariateRenderer.classification.field_statistics_cache import FieldStatisticsCache
+from BivariateRenderer.classification.layer_classification import field_classes
+from BivariateRenderer.layoutitems.layout_item import BivariateRendererLayoutItem
+
+from tests import set_up_bivariate_renderer
+
+
+def bounds(classes):
+    return [(x.lowerBound(), x.upperBound()) for x in classes]
+
+
+def expected_counts(layer: QgsVectorLayer, breaks_1: ClassBreaks,
+                    breaks_2: ClassBreaks) -> np.ndarray:
+
+    counts = np.zeros((len(breaks_1), len(breaks_2)), dtype=np.int64)
+
+    for feature in layer.getFeatures():
+        counts[breaks_1.class_index(feature.attribute("AREA")),
+               breaks_2.class_index(feature.attribute("PERIMETER"))] += 1
+
+    return counts
+
+
+@pytest.mark.parametrize("method", [QgsClassificationEqualInterval(), QgsClassificationQuantile()])
+def test_classify_and_count(nc_layer: QgsVectorLayer, method):
+
+    # GeoPackage is counted by SQL, memory layer by reading the fields
+    for layer in [nc_layer, nc_layer.materialize(QgsFeatureRequest())]:
+
+        FieldStatisticsCache().invalidate()
+
+        statistics = classify_and_count(layer, "AREA", "PERIMETER", method, 3)
+
+        assert bounds(statistics.classes_1) == pytest.approx(
+            bounds(field_classes(layer, "AREA", method, 3)))
+        assert bounds(statistics.classes_2) == pytest.approx(
+            bounds(field_classes(layer, "PERIMETER", method, 3)))
+
+        assert statistics.null_count_1 == statistics.null_count_2 == 0
+        assert statistics.classified_count == layer.featureCount()
+        assert statistics.counts.tolist() == expected_counts(layer, statistics.breaks_1,
+                                                             statistics.breaks_2).tolist()
+
+        # statistics were stored in the cache
+        assert FieldStatisticsCache().cached(layer, "AREA", method.valuesRequired()) is not None
+
+
+def test_classify_without_counts(nc_layer: QgsVectorLayer):
+
+    FieldStatisticsCache().invalidate()
+
+    statistics = classify_and_count(nc_layer,
+                                    "AREA",
+                                    "PERIMETER",
+                                    QgsClassificationEqualInterval(),
+                                    3,
+                                    count_categories=False)
+
+    assert statistics.counts is None
+    assert len(statistics.classes_1) == 3
+    assert "NULL values" in str(statistics)
+
+    with pytest.raises(ValueError):
+        BivariateStatisticsReader(nc_layer, "AREA", "PERIMETER")
+
+
+def test_sqlite_counts(nc_layer: QgsVectorLayer):
+
+    reader = BivariateStatisticsReader(nc_layer, "AREA", "PERIMETER",
+                                       QgsClassificationQuantile(), 4)
+
+    assert reader.counts_reader.sqlite_source is not None
+
+    statistics = reader.read()
+
+    breaks = (statistics.breaks_1, statistics.breaks_2)
+
+    assert statistics.counts.tolist() == class_pair_counts(
+        breaks, reader.counts_reader.column_chunks()).tolist()
+
+
+def test_task_counts_on_request(nc_layer: QgsVectorLayer):
+
+    method = QgsClassificationEqualInterval()
+
+    task = FieldClassesTask(nc_layer, ["AREA", "PERIMETER"], method, 3)
+
+    assert task.run()
+    assert task.bivariate_statistics.counts is None
+
+    task = FieldClassesTask(nc_layer, ["AREA", "PERIMETER"], method, 3, count_categories=True)
+
+    assert task.run()
+
+    breaks = (ClassBreaks(task.classes["AREA"]), ClassBreaks(task.classes["PERIMETER"]))
+
+    assert task.bivariate_statistics.counts.tolist() == expected_counts(nc_layer,
+                                                                        *breaks).tolist()
+
+
+def test_class_pair_counts():
+
+    breaks = (ClassBreaks(QgsClassificationEqualInterval().classes(0, 10, 2)),
+              ClassBreaks(QgsClassificationEqualInterval().classes(0, 30, 3)))
+
+    chunks = [
+        [np.array([1, 6, np.nan]), np.array([25, 5, 5])],
+        [np.array([9, 2]), np.array([np.nan, 15])],
+    ]
+
+    assert class_pair_counts(breaks, chunks).tolist() == [[0, 1, 1], [1, 0, 0]]
+    assert class_pair_counts((ClassBreaks([]), breaks[1]), chunks).shape == (0, 3)
+    assert class_pair_counts(breaks, chunks, lambda: True) is None
+
+
+def test_layout_item_statistics(nc_layer: QgsVectorLayer, qgs_layout):
+
+    nc_layer.setRenderer(set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER"))
+
+    layout_item = BivariateRendererLayoutItem(qgs_layout)
+
+    assert layout_item.bivariate_statistics() is None
+
+    layout_item.set_linked_layer(nc_layer)
+
+    statistics = layout_item.bivariate_statistics()
+
+    # renderer classes are counted, not classified again
+    assert statistics.classes_1 is layout_item.renderer.field_1_classes
+    assert statistics.breaks_2.breaks == layout_item.renderer.field_2_breaks.breaks
+    assert statistics.counts.tolist() == expected_counts(
+        nc_layer, layout_item.renderer.field_1_breaks,
+        layout_item.renderer.field_2_breaks).tolist()
+    assert statistics.classified_count == nc_layer.featureCount()
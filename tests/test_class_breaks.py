@@ -0,0 +1,35 @@
+import math
+
+from qgis.core import QgsClassificationRange, NULL
+
+from BivariateRenderer.classification.class_breaks import ClassBreaks
+
+
+def test_class_breaks():
+
+    classes = [
+        QgsClassificationRange("0 - 1", 0, 1),
+        QgsClassificationRange("1 - 2", 1, 2),
+        QgsClassificationRange("2 - 3", 2, 3)
+    ]
+
+    class_breaks = ClassBreaks(classes)
+
+    assert len(class_breaks) == 3
+    assert class_breaks.breaks == (0, 1, 2, 3)
+    assert class_breaks.midpoints == (0.5, 1.5, 2.5)
+
+    assert class_breaks.class_index(0) == 0
+    assert class_breaks.class_index(0.5) == 0
+    assert class_breaks.class_index(1) == 1
+    assert class_breaks.class_index(2.5) == 2
+    assert class_breaks.class_index(3) == 2
+
+    assert class_breaks.class_index(-10) == 0
+    assert class_breaks.class_index(10) == 2
+
+    assert class_breaks.class_index(None) is None
+    assert class_breaks.class_index(NULL) is None
+    assert class_breaks.class_index(math.nan) is None
+
+    assert ClassBreaks([]).class_index(1) is None
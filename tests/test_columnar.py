@@ -0,0 +1,59 @@
+import math
+
+import pytest
+
+from qgis.core import QgsVectorLayer, QgsFeatureRequest
+
+from BivariateRenderer.classification.columnar import (read_numeric_columns,
+                                                       arrow_stream_available, ogr_source_uri,
+                                                       ogr_aggregates)
+
+
+@pytest.mark.skipif(not arrow_stream_available(), reason="GDAL Arrow stream not available")
+def test_read_numeric_columns(nc_layer: QgsVectorLayer):
+
+    columns = read_numeric_columns(nc_layer, ["AREA", "PERIMETER"])
+
+    assert columns is not None
+
+    fids, (areas, perimeters) = columns
+
+    assert len(fids) == nc_layer.featureCount()
+
+    values = {
+        feature.id(): (feature.attribute("AREA"), feature.attribute("PERIMETER"))
+        for feature in nc_layer.getFeatures()
+    }
+
+    for fid, area, perimeter in zip(fids.tolist(), areas.tolist(), perimeters.tolist()):
+        assert math.isclose(values[fid][0], area)
+        assert math.isclose(values[fid][1], perimeter)
+
+
+def test_read_numeric_columns_not_possible(nc_layer: QgsVectorLayer):
+
+    assert read_numeric_columns(nc_layer, ["AREA", "NOT_EXISTING_FIELD"]) is None
+
+    memory_layer = nc_layer.materialize(QgsFeatureRequest())
+
+    assert read_numeric_columns(memory_layer, ["AREA", "PERIMETER"]) is None
+
+
+def test_ogr_aggregates(nc_layer: QgsVectorLayer):
+
+    aggregates = ogr_aggregates(ogr_source_uri(nc_layer), ["AREA", "PERIMETER"])
+
+    assert aggregates is not None
+
+    for field_name, (count, null_count, minimum, maximum) in zip(["AREA", "PERIMETER"],
+                                                                 aggregates):
+
+        index = nc_layer.fields().lookupField(field_name)
+
+        assert count == nc_layer.featureCount()
+        assert null_count == 0
+        assert minimum == pytest.approx(nc_layer.minimumValue(index))
+        assert maximum == pytest.approx(nc_layer.maximumValue(index))
+
+    assert ogr_aggregates(ogr_source_uri(nc_layer), ["NOT_EXISTING_FIELD"]) is None
+    assert ogr_source_uri(nc_layer.materialize(QgsFeatureRequest())) is None
@@ -0,0 +1,226 @@
+import time
+from typing import Optional, Tuple
+
+from qgis.core import (QgsVectorLayer, QgsReadWriteContext, QgsFeatureRequest, QgsProject,
+                       QgsField, QgsFeature, QgsRenderContext, QgsExpressionContext,
+                       QgsExpressionContextUtils, NULL)
+from qgis.PyQt.QtXml import QDomDocument
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+
+from BivariateRenderer.renderer.bivariate_renderer import BivariateRenderer
+from BivariateRenderer.renderer.feature_class_cache import (FeatureClassCache,
+                                                            FeatureClassCacheConfig)
+
+from tests import set_up_bivariate_renderer
+
+
+def test_feature_class_cache_config(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER")
+
+    config = FeatureClassCacheConfig(nc_layer.id(), "AREA", "PERIMETER",
+                                     bivariate_renderer.field_1_breaks,
+                                     bivariate_renderer.field_2_breaks)
+
+    clone = bivariate_renderer.clone()
+
+    assert config == FeatureClassCacheConfig(nc_layer.id(), "AREA", "PERIMETER",
+                                             clone.field_1_breaks, clone.field_2_breaks)
+
+    for feature in nc_layer.getFeatures():
+
+        code = config.code(feature.attribute("AREA"), feature.attribute("PERIMETER"))
+
+        class_index_1, class_index_2 = divmod(code, len(bivariate_renderer.field_2_breaks))
+
+        assert class_index_1 == bivariate_renderer.classIndexField1(feature.attribute("AREA"))
+        assert class_index_2 == bivariate_renderer.classIndexField2(
+            feature.attribute("PERIMETER"))
+
+    assert config.code(NULL, 1) == FeatureClassCache.NO_CLASS
+
+
+def test_feature_cache_option(nc_layer: QgsVectorLayer):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER")
+
+    assert bivariate_renderer.feature_cache is None
+
+    bivariate_renderer.setUseFeatureCache(True)
+
+    assert isinstance(bivariate_renderer.feature_cache, FeatureClassCache)
+    assert bivariate_renderer.clone().feature_cache is bivariate_renderer.feature_cache
+
+    renderer_from_xml = BivariateRenderer.create_render_from_element(
+        bivariate_renderer.save(QDomDocument("doc"), QgsReadWriteContext()))
+
+    assert renderer_from_xml.use_feature_cache
+
+
+def wait_for_codes(cache: FeatureClassCache,
+                   config: FeatureClassCacheConfig) -> Optional[bytearray]:
+
+    deadline = time.monotonic() + 10
+
+    while cache.codes_for(config) is None and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+
+    return cache.codes_for(config)
+
+
+def cached_layer(nc_layer: QgsVectorLayer) -> Tuple[QgsVectorLayer, FeatureClassCacheConfig]:
+
+    layer = nc_layer.materialize(QgsFeatureRequest())
+
+    QgsProject.instance().addMapLayer(layer)
+
+    bivariate_renderer = set_up_bivariate_renderer(layer, field1="AREA", field2="PERIMETER")
+
+    config = FeatureClassCacheConfig(layer.id(), "AREA", "PERIMETER",
+                                     bivariate_renderer.field_1_breaks,
+                                     bivariate_renderer.field_2_breaks)
+
+    return layer, config
+
+
+def test_feature_cache_provider_update(nc_layer: QgsVectorLayer):
+
+    layer, config = cached_layer(nc_layer)
+
+    cache = FeatureClassCache()
+
+    codes = wait_for_codes(cache, config)
+
+    feature = next(layer.getFeatures())
+
+    assert codes[feature.id()] == config.code(feature.attribute("AREA"),
+                                              feature.attribute("PERIMETER"))
+
+    # write outside of edit buffer, as processing tools do
+    layer.dataProvider().changeAttributeValues(
+        {feature.id(): {
+            layer.fields().lookupField("AREA"): None
+        }})
+    layer.dataProvider().reloadData()
+
+    assert cache.codes is None
+
+    assert wait_for_codes(cache, config)[feature.id()] == FeatureClassCache.NO_CLASS
+
+    QgsProject.instance().removeMapLayer(layer)
+
+
+def test_feature_cache_reload(nc_layer: QgsVectorLayer):
+
+    layer, config = cached_layer(nc_layer)
+
+    cache = FeatureClassCache()
+
+    assert wait_for_codes(cache, config) is not None
+
+    layer.reload()
+
+    assert cache.codes is None
+    assert wait_for_codes(cache, config) is not None
+
+    layer.dataProvider().addAttributes([QgsField("new_field", QVariant.Int)])
+    layer.updateFields()
+
+    assert cache.codes is None
+
+    QgsProject.instance().removeMapLayer(layer)
+
+
+def test_feature_cache_edits(nc_layer: QgsVectorLayer):
+
+    layer, config = cached_layer(nc_layer)
+
+    cache = FeatureClassCache()
+
+    codes = wait_for_codes(cache, config)
+
+    field_index = layer.fields().lookupField("AREA")
+
+    feature = next(layer.getFeatures())
+    fid = feature.id()
+
+    code = config.code(feature.attribute("AREA"), feature.attribute("PERIMETER"))
+
+    assert codes[fid] == code
+
+    layer.startEditing()
+
+    # edits in the edit buffer update codes of single features
+    layer.changeAttributeValue(fid, field_index, NULL)
+
+    assert cache.codes is codes
+    assert codes[fid] == FeatureClassCache.NO_CLASS
+
+    layer.changeAttributeValue(fid, field_index, feature.attribute("AREA"))
+
+    assert codes[fid] == code
+
+    other_feature = next(layer.getFeatures(QgsFeatureRequest().setFilterExpression(
+        f"$id != {fid}")))
+
+    layer.deleteFeature(other_feature.id())
+
+    assert codes[other_feature.id()] == FeatureClassCache.NOT_CACHED
+
+    # rollback drops the whole cache
+    layer.rollBack()
+
+    assert cache.codes is None
+
+    QgsProject.instance().removeMapLayer(layer)
+
+
+def test_renderer_uses_cached_codes(nc_layer: QgsVectorLayer):
+
+    layer, config = cached_layer(nc_layer)
+
+    bivariate_renderer = set_up_bivariate_renderer(layer, field1="AREA", field2="PERIMETER")
+    bivariate_renderer.setUseFeatureCache(True)
+
+    context = QgsRenderContext()
+    context.setExpressionContext(
+        QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(layer)))
+
+    config = FeatureClassCacheConfig(layer.id(), "AREA", "PERIMETER",
+                                     bivariate_renderer.field_1_breaks,
+                                     bivariate_renderer.field_2_breaks)
+
+    # first render requests the build
+    bivariate_renderer.startRender(context, layer.fields())
+    bivariate_renderer.stopRender(context)
+
+    codes = wait_for_codes(bivariate_renderer.feature_cache, config)
+
+    features = list(layer.getFeatures())
+
+    classified_feature = QgsFeature(features[0])
+    edited_feature = QgsFeature(features[1])
+
+    layer.startEditing()
+    layer.changeAttributeValue(edited_feature.id(), layer.fields().lookupField("AREA"), NULL)
+
+    assert codes[edited_feature.id()] == FeatureClassCache.NO_CLASS
+
+    bivariate_renderer.startRender(context, layer.fields())
+
+    plan = bivariate_renderer.render_plan
+
+    assert plan.feature_codes is codes
+
+    # symbols come from the codes, attributes of the features are not classified
+    classified_feature.setAttribute("AREA", NULL)
+
+    assert bivariate_renderer.symbolForFeature(
+        classified_feature, context) is plan.palette_by_code[codes[classified_feature.id()]]
+    assert bivariate_renderer.symbolForFeature(edited_feature, context) is None
+
+    bivariate_renderer.stopRender(context)
+
+    layer.rollBack()
+
+    QgsProject.instance().removeMapLayer(layer)
@@ -0,0 +1,266 @@
+import numpy as np
+import pytest
+
+from qgis.core import (QgsVectorLayer, QgsFeatureRequest, QgsClassificationEqualInterval,
+                       QgsClassificationQuantile, QgsClassificationJenks)
+
+from BivariateRenderer.classification.class_breaks import ClassBreaks
+from BivariateRenderer.classification.field_statistics import (FieldStatistics,
+                                                               FieldValuesCollector,
+                                                               calculate_field_statistics,
+                                                               FieldStatisticsReader,
+                                                               calculate_fields_statistics)
+from BivariateRenderer.classification.field_statistics_cache import FieldStatisticsCache
+from BivariateRenderer.classification.sqlite_source import SqliteSource
+
+
+def bounds(classes):
+    return [(x.lowerBound(), x.upperBound()) for x in classes]
+
+
+def test_from_values():
+
+    statistics = FieldStatistics.from_values(np.array([3, np.nan, 1, 2, np.nan]))
+
+    assert statistics.count == 3
+    assert statistics.null_count == 2
+    assert statistics.minimum == 1
+    assert statistics.maximum == 3
+    assert statistics.values.tolist() == [1, 2, 3]
+
+
+@pytest.mark.parametrize("with_values", [True, False])
+def test_calculate_field_statistics(nc_layer: QgsVectorLayer, with_values: bool):
+
+    memory_layer = nc_layer.materialize(QgsFeatureRequest())
+
+    statistics_database = calculate_field_statistics(nc_layer, "AREA", with_values)
+    statistics_memory = calculate_field_statistics(memory_layer, "AREA", with_values)
+
+    assert statistics_database.count == statistics_memory.count == nc_layer.featureCount()
+    assert statistics_database.minimum == statistics_memory.minimum
+    assert statistics_database.maximum == statistics_memory.maximum
+
+    if with_values:
+        assert statistics_database.values.tolist() == statistics_memory.values.tolist()
+
+
+@pytest.mark.parametrize(
+    "method",
+    [QgsClassificationEqualInterval(),
+     QgsClassificationQuantile(),
+     QgsClassificationJenks()])
+def test_classes(nc_layer: QgsVectorLayer, method):
+
+    statistics = calculate_field_statistics(nc_layer, "PERIMETER", True)
+
+    for number_of_classes in [2, 3, 4, 5]:
+        assert bounds(statistics.classes(method, number_of_classes)) == \
+            pytest.approx(bounds(method.classes(nc_layer, "PERIMETER", number_of_classes)))
+
+
+def test_cache(nc_layer: QgsVectorLayer):
+
+    layer = nc_layer.materialize(QgsFeatureRequest())
+
+    cache = FieldStatisticsCache()
+
+    assert cache.cached(layer, "AREA") is None
+
+    statistics = cache.statistics(layer, "AREA")
+
+    assert cache.statistics(layer, "AREA") is statistics
+
+    # statistics read without values do not satisfy request for values
+    assert not statistics.has_values
+    assert cache.cached(layer, "AREA", with_values=True) is None
+
+    statistics = cache.statistics(layer, "AREA", with_values=True)
+
+    assert statistics.has_values
+    assert cache.cached(layer, "AREA", with_values=True) is statistics
+    assert cache.cached(layer, "AREA") is statistics
+
+    layer.startEditing()
+    layer.changeAttributeValue(next(layer.getFeatures()).id(),
+                               layer.fields().lookupField("AREA"), 1000)
+
+    assert cache.cached(layer, "AREA") is None
+    assert cache.statistics(layer, "AREA").maximum == 1000
+
+    layer.rollBack()
+
+    assert cache.cached(layer, "AREA") is None
+
+
+def test_sampled_statistics():
+
+    values = np.random.default_rng(1).normal(50, 10, 100000)
+    values[::10] = np.nan
+
+    statistics = FieldStatistics.from_values(values, sample_size=1000)
+
+    assert statistics.sampled
+    assert len(statistics.values) == 1000
+    assert statistics.count == 90000
+    assert statistics.null_count == 10000
+    assert statistics.minimum == np.nanmin(values)
+    assert statistics.maximum == np.nanmax(values)
+
+    # sample is reproducible, also when values come in chunks
+    collector = FieldValuesCollector(1000)
+
+    for chunk in np.array_split(values, 7):
+        collector.add(chunk)
+
+    assert collector.statistics().values.tolist() == statistics.values.tolist()
+
+    method = QgsClassificationQuantile()
+
+    classes = statistics.classes(method, 4)
+
+    error = statistics.sampling_error(classes)
+
+    assert error.sample_size == 1000
+    assert sum(error.estimated_counts) == pytest.approx(90000, abs=4)
+
+    exact_counts = np.bincount(ClassBreaks(classes).class_indices(values[~np.isnan(values)]),
+                               minlength=4)
+
+    for estimated, exact in zip(error.estimated_counts, exact_counts):
+        assert abs(estimated - exact) <= error.max_count_error
+
+
+def test_not_sampled_statistics():
+
+    statistics = FieldStatistics.from_values(np.array([1.0, 2.0, 3.0]), sample_size=10)
+
+    assert not statistics.sampled
+    assert statistics.values.tolist() == [1, 2, 3]
+    assert statistics.sampling_error(statistics.classes(QgsClassificationQuantile(), 2)) is None
+
+
+def test_sketch_statistics():
+
+    values = np.random.default_rng(3).exponential(10, 200000)
+
+    collector = FieldValuesCollector(max_values=10000)
+
+    for chunk in np.array_split(values, 20):
+        collector.add(chunk)
+
+    statistics = collector.statistics()
+
+    assert statistics.values is None
+    assert statistics.sketch is not None
+    assert statistics.has_values
+    assert statistics.count == len(values)
+
+    method = QgsClassificationQuantile()
+
+    classes = statistics.classes(method, 5)
+    exact_classes = FieldStatistics.from_values(values).classes(method, 5)
+
+    sorted_values = np.sort(values)
+
+    for sketch_class, exact_class in zip(classes, exact_classes):
+        rank = np.searchsorted(sorted_values, sketch_class.upperBound())
+        exact_rank = np.searchsorted(sorted_values, exact_class.upperBound())
+        assert abs(rank - exact_rank) / len(values) < 0.01
+
+
+@pytest.mark.parametrize("with_values", [True, False])
+def test_calculate_fields_statistics(nc_layer: QgsVectorLayer, with_values: bool):
+
+    memory_layer = nc_layer.materialize(QgsFeatureRequest())
+
+    for layer in [nc_layer, memory_layer]:
+
+        statistics = calculate_fields_statistics(layer, ["AREA", "PERIMETER"], with_values)
+
+        for field_name, field_statistics in zip(["AREA", "PERIMETER"], statistics):
+
+            expected = calculate_field_statistics(layer, field_name, with_values)
+
+            assert field_statistics.count == expected.count
+            assert field_statistics.null_count == expected.null_count
+            assert field_statistics.minimum == pytest.approx(expected.minimum)
+            assert field_statistics.maximum == pytest.approx(expected.maximum)
+            assert field_statistics.has_values == with_values
+
+
+def test_collector_without_values():
+
+    collector = FieldValuesCollector(with_values=False)
+
+    collector.add(np.array([3, np.nan, 1]))
+    collector.add(np.array([np.nan, 7]))
+
+    statistics = collector.statistics()
+
+    assert (statistics.count, statistics.null_count) == (3, 2)
+    assert (statistics.minimum, statistics.maximum) == (1, 7)
+    assert not statistics.has_values
+
+
+def test_aggregates_without_values(nc_layer: QgsVectorLayer, monkeypatch):
+
+    def no_chunks(self):
+        raise AssertionError("Values of fields should not be read.")
+
+    monkeypatch.setattr(FieldStatisticsReader, "column_chunks", no_chunks)
+
+    # aggregated by SQLite SQL, then by OGR SQL
+    for use_sqlite in [True, False]:
+
+        reader = FieldStatisticsReader(nc_layer, ["AREA", "PERIMETER"])
+
+        if not use_sqlite:
+            reader.sqlite_source = None
+
+        for statistics in reader.read(with_values=False):
+
+            assert statistics.count == nc_layer.featureCount()
+            assert statistics.values is None
+            assert statistics.sketch is None
+            assert not statistics.has_values
+
+
+def test_sqlite_ranked_values(nc_layer: QgsVectorLayer, monkeypatch):
+
+    loaded = FieldStatisticsReader(nc_layer, ["AREA"]).read(with_values=True)[0]
+
+    assert loaded.values is not None
+
+    # large columns stay in the database
+    monkeypatch.setattr(
+        "BivariateRenderer.classification.field_statistics.MAX_LOADED_SQLITE_VALUES", 10)
+
+    statistics = FieldStatisticsReader(nc_layer, ["AREA"]).read(with_values=True)[0]
+
+    assert statistics.values is None
+    assert statistics.ranked_source is not None
+    assert statistics.has_values
+
+    loads = []
+    sorted_values = SqliteSource.sorted_values
+
+    def recorded_sorted_values(self, column):
+        loads.append(column)
+        return sorted_values(self, column)
+
+    monkeypatch.setattr(SqliteSource, "sorted_values", recorded_sorted_values)
+
+    # quantiles select values at ranks only
+    for number_of_classes in [3, 5]:
+        assert bounds(statistics.classes(QgsClassificationQuantile(), number_of_classes)) == \
+            pytest.approx(bounds(loaded.classes(QgsClassificationQuantile(), number_of_classes)))
+
+    assert loads == []
+
+    # all values are loaded once, for methods that need them
+    for number_of_classes in [3, 4]:
+        assert bounds(statistics.classes(QgsClassificationJenks(), number_of_classes)) == \
+            pytest.approx(bounds(loaded.classes(QgsClassificationJenks(), number_of_classes)))
+
+    assert loads == ["AREA"]
@@ -0,0 +1,57 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from BivariateRenderer.classification.jenks import jenks_breaks
+
+
+def sum_of_squared_deviations(values: np.ndarray, breaks) -> float:
+
+    values = np.sort(values)
+
+    ends = np.searchsorted(values, breaks[1:], side="right")
+
+    return sum(((x - x.mean())**2).sum() for x in np.split(values, ends[:-1]) if len(x))
+
+
+def brute_force_minimum(values: np.ndarray, number_of_classes: int) -> float:
+
+    unique_values = np.unique(values)
+
+    return min(
+        sum_of_squared_deviations(values, [unique_values[0]] +
+                                  [unique_values[end - 1] for end in ends] + [unique_values[-1]])
+        for ends in itertools.combinations(range(1, len(unique_values)), number_of_classes - 1))
+
+
+@pytest.mark.parametrize("number_of_classes", [2, 3, 4, 5])
+def test_optimal(number_of_classes):
+
+    random = np.random.default_rng(0)
+
+    for _ in range(20):
+
+        values = np.round(random.exponential(5, 12), 1)
+
+        breaks = jenks_breaks(values, number_of_classes)
+
+        assert len(breaks) == number_of_classes + 1
+        assert breaks[0] == values.min()
+        assert breaks[-1] == values.max()
+        assert sum_of_squared_deviations(values, breaks) == \
+            pytest.approx(brute_force_minimum(values, number_of_classes))
+
+
+def test_weights():
+
+    values = np.array([1.0, 2.0, 10.0, 11.0, 30.0])
+    weights = np.array([3, 1, 2, 2, 1])
+
+    assert jenks_breaks(values, 3, weights) == jenks_breaks(np.repeat(values, weights), 3)
+
+
+def test_few_values():
+
+    assert jenks_breaks(np.array([5.0, 1.0, np.nan, 1.0, 2.0]), 5) == [1, 1, 2, 5]
+    assert jenks_breaks(np.array([np.nan]), 3) == []
@@ -0,0 +1,60 @@
+import pytest
+
+from qgis.core import (QgsVectorLayer, QgsFeatureRequest, QgsClassificationEqualInterval,
+                       QgsClassificationQuantile, QgsClassificationJenks)
+
+from BivariateRenderer.classification.layer_classification import field_classes
+from BivariateRenderer.classification.field_statistics import quantile_breaks
+from BivariateRenderer.classification.sqlite_source import sqlite_source
+
+
+def bounds(classes):
+    return [(x.lowerBound(), x.upperBound()) for x in classes]
+
+
+def test_sqlite_source(nc_layer: QgsVectorLayer):
+
+    source = sqlite_source(nc_layer)
+
+    assert source is not None
+    assert source.table == "nc_data"
+    assert source.has_column("AREA")
+
+    assert sqlite_source(nc_layer.materialize(QgsFeatureRequest())) is None
+
+
+@pytest.mark.parametrize("method",
+                         [QgsClassificationEqualInterval(),
+                          QgsClassificationQuantile()])
+@pytest.mark.parametrize("number_of_classes", [2, 3, 5])
+def test_field_classes_sql(nc_layer: QgsVectorLayer, method, number_of_classes: int):
+
+    classes = field_classes(nc_layer, "AREA", method, number_of_classes)
+    expected = method.classes(nc_layer, "AREA", number_of_classes)
+
+    assert bounds(classes) == pytest.approx(bounds(expected))
+    assert [x.label() for x in classes] == [x.label() for x in expected]
+
+
+def test_field_classes_fallback(nc_layer: QgsVectorLayer):
+
+    memory_layer = nc_layer.materialize(QgsFeatureRequest())
+
+    method = QgsClassificationJenks()
+
+    assert bounds(field_classes(nc_layer, "PERIMETER", method, 3)) == \
+        bounds(method.classes(nc_layer, "PERIMETER", 3))
+
+    method = QgsClassificationQuantile()
+
+    assert bounds(field_classes(memory_layer, "PERIMETER", method, 3)) == \
+        bounds(method.classes(memory_layer, "PERIMETER", 3))
+
+
+def test_quantile_breaks():
+
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+
+    assert quantile_breaks(values.__getitem__, len(values), 2) == [1, 6, 11]
+    assert quantile_breaks(values.__getitem__, len(values), 4) == [1, 3.5, 6, 8.5, 11]
+    assert quantile_breaks([5].__getitem__, 1, 3) == [5, 5, 5, 5]
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from BivariateRenderer.classification.quantile_sketch import KllSketch
+
+
+def rank_error(sketch: KllSketch, sorted_values: np.ndarray) -> float:
+
+    ranks = np.linspace(0, len(sorted_values) - 1, 101).astype(int)
+
+    errors = [
+        abs(np.searchsorted(sorted_values, sketch.value_at_rank(rank)) - rank) for rank in ranks
+    ]
+
+    return max(errors) / len(sorted_values)
+
+
+def test_small_input_is_exact():
+
+    sketch = KllSketch(k=200)
+    sketch.update(np.array([5.0, np.nan, 1.0, 3.0, 2.0, 4.0]))
+
+    assert sketch.count == 5
+    assert [sketch.value_at_rank(i) for i in range(5)] == [1, 2, 3, 4, 5]
+
+
+def test_bounded_size_and_error():
+
+    values = np.random.default_rng(0).lognormal(0, 1, 1000000)
+
+    sketch = KllSketch(k=200, seed=1)
+
+    for chunk in np.array_split(values, 50):
+        sketch.update(chunk)
+
+    assert sketch.count == len(values)
+    assert sketch.minimum == values.min()
+    assert sketch.maximum == values.max()
+    assert sketch.number_of_items < 1000
+    assert sketch.weighted_items()[1][-1] == len(values)
+
+    assert rank_error(sketch, np.sort(values)) < 0.01
+
+
+def test_merge():
+
+    values = np.random.default_rng(2).normal(0, 1, 300000)
+
+    sketches = []
+
+    for i, chunk in enumerate(np.array_split(values, 3)):
+        sketch = KllSketch(k=200, seed=i)
+        sketch.update(chunk)
+        sketches.append(sketch)
+
+    merged = sketches[0]
+    merged.merge(sketches[1])
+    merged.merge(sketches[2])
+
+    assert merged.count == len(values)
+    assert merged.weighted_items()[1][-1] == len(values)
+    assert rank_error(merged, np.sort(values)) < 0.01
+
+    with pytest.raises(ValueError):
+        merged.merge(KllSketch(k=100))
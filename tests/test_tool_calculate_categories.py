@@ -0,0 +1,188 @@
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from qgis.core import (QgsVectorLayer, QgsFeatureRequest, QgsProcessingContext,
+                       QgsProcessingFeedback, QgsProcessingException, QgsField,
+                       QgsClassificationEqualInterval)
+from qgis.PyQt.QtCore import QVariant
+
+from BivariateRenderer.classification.class_breaks import ClassBreaks
+from BivariateRenderer.classification.columnar import arrow_stream_available
+from BivariateRenderer.classification.sqlite_source import SqliteSource
+from BivariateRenderer.tools import tool_calculate_categories
+from BivariateRenderer.tools.tool_calculate_categories import CalculateCategoriesAlgorithm
+
+from tests import set_up_bivariate_renderer
+
+
+def run_algorithm(layer: QgsVectorLayer, **extra_parameters) -> None:
+
+    algorithm = CalculateCategoriesAlgorithm()
+    algorithm.initAlgorithm()
+
+    parameters = {
+        CalculateCategoriesAlgorithm.INPUT_LAYER: layer,
+        CalculateCategoriesAlgorithm.FIELD_1: "AREA",
+        CalculateCategoriesAlgorithm.FIELD_2: "PERIMETER",
+        CalculateCategoriesAlgorithm.NUMBER_CLASSES: 3,
+        CalculateCategoriesAlgorithm.RESULT_FIELD_NAME: "Category",
+    }
+
+    parameters.update(extra_parameters)
+
+    algorithm.processAlgorithm(parameters, QgsProcessingContext(), QgsProcessingFeedback())
+
+
+def test_calculate_categories(nc_layer: QgsVectorLayer):
+
+    layer = nc_layer.materialize(QgsFeatureRequest())
+
+    run_algorithm(layer, **{CalculateCategoriesAlgorithm.CHUNK_SIZE: 7})
+
+    assert layer.fields().indexOf("Category") >= 0
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER")
+
+    for feature in layer.getFeatures():
+
+        class_1 = bivariate_renderer.classIndexField1(feature.attribute("AREA")) + 1
+        class_2 = bivariate_renderer.classIndexField2(feature.attribute("PERIMETER")) + 1
+
+        assert feature.attribute("Category") == f"{class_1}-{class_2}"
+
+
+def test_calculate_categories_parallel(nc_layer: QgsVectorLayer):
+
+    layer_sequential = nc_layer.materialize(QgsFeatureRequest())
+    layer_parallel = nc_layer.materialize(QgsFeatureRequest())
+
+    run_algorithm(layer_sequential, **{CalculateCategoriesAlgorithm.CHUNK_SIZE: 10})
+    run_algorithm(
+        layer_parallel, **{
+            CalculateCategoriesAlgorithm.CHUNK_SIZE: 10,
+            CalculateCategoriesAlgorithm.NUMBER_OF_WORKERS: 4
+        })
+
+    categories_sequential = {f.id(): f.attribute("Category") for f in layer_sequential.getFeatures()}
+    categories_parallel = {f.id(): f.attribute("Category") for f in layer_parallel.getFeatures()}
+
+    assert categories_sequential == categories_parallel
+
+
+def test_calculate_categories_in_database(nc_layer: QgsVectorLayer, tmp_path: Path):
+
+    path = tmp_path / "nc_data.gpkg"
+    shutil.copy(Path(__file__).parent / "data" / "nc_data.gpkg", path)
+
+    layer = QgsVectorLayer(f"{path.as_posix()}|layername=nc_data", "layer", "ogr")
+
+    assert CalculateCategoriesAlgorithm.update_in_database(
+        layer, "AREA", "PERIMETER", "NOT_EXISTING_FIELD", None, None,
+        QgsProcessingFeedback()) is False
+
+    run_algorithm(layer)
+
+    layer_memory = nc_layer.materialize(QgsFeatureRequest())
+
+    run_algorithm(layer_memory)
+
+    categories_database = {f.id(): f.attribute("Category") for f in layer.getFeatures()}
+    categories_memory = {f.id(): f.attribute("Category") for f in layer_memory.getFeatures()}
+
+    assert list(categories_database.values()) == list(categories_memory.values())
+
+
+@pytest.mark.skipif(not arrow_stream_available(), reason="GDAL Arrow stream not available")
+def test_calculate_categories_columns(tmp_path: Path, monkeypatch):
+
+    layers = []
+
+    for name in ["columns", "features"]:
+
+        path = tmp_path / f"{name}.gpkg"
+        shutil.copy(Path(__file__).parent / "data" / "nc_data.gpkg", path)
+
+        layers.append(QgsVectorLayer(f"{path.as_posix()}|layername=nc_data", name, "ogr"))
+
+    layer_columns, layer_features = layers
+
+    # without SQL update the OGR layer is read as columns, in streamed chunks
+    monkeypatch.setattr(CalculateCategoriesAlgorithm, "update_in_database",
+                        staticmethod(lambda *args: False))
+
+    batches = []
+
+    iterate_numeric_columns = tool_calculate_categories.iterate_numeric_columns
+
+    def recorded_batches(layer, field_names):
+        batches.append(layer.name())
+        return iterate_numeric_columns(layer, field_names)
+
+    monkeypatch.setattr(tool_calculate_categories, "iterate_numeric_columns", recorded_batches)
+
+    run_algorithm(layer_columns, **{CalculateCategoriesAlgorithm.CHUNK_SIZE: 7})
+
+    assert batches == ["columns"]
+
+    # chunks of feature ids are read by feature requests
+    monkeypatch.setattr(tool_calculate_categories, "iterate_numeric_columns", lambda *args: None)
+
+    run_algorithm(layer_features, **{CalculateCategoriesAlgorithm.CHUNK_SIZE: 7})
+
+    categories_columns = {f.id(): f.attribute("Category") for f in layer_columns.getFeatures()}
+    categories_features = {f.id(): f.attribute("Category") for f in layer_features.getFeatures()}
+
+    assert None not in categories_columns.values()
+    assert categories_columns == categories_features
+
+
+def test_calculate_categories_read_only(nc_layer: QgsVectorLayer, tmp_path: Path):
+
+    path = tmp_path / "nc_data.csv"
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("AREA,PERIMETER\n")
+        for feature in nc_layer.getFeatures():
+            file.write(f"{feature.attribute('AREA')},{feature.attribute('PERIMETER')}\n")
+
+    layer = QgsVectorLayer(f"{path.as_uri()}?type=csv&geomType=none", "nc_data",
+                           "delimitedtext")
+
+    assert layer.isValid()
+
+    # data source that cannot be written is reported instead of silently skipping the writes
+    with pytest.raises(QgsProcessingException):
+        run_algorithm(layer)
+
+
+def test_calculate_categories_update_failure(nc_layer: QgsVectorLayer, tmp_path: Path,
+                                             monkeypatch):
+
+    path = tmp_path / "nc_data.gpkg"
+    shutil.copy(Path(__file__).parent / "data" / "nc_data.gpkg", path)
+
+    layer = QgsVectorLayer(f"{path.as_posix()}|layername=nc_data", "layer", "ogr")
+
+    def failing_update(*args):
+        raise sqlite3.NotSupportedError("Geometry functions are not available.")
+
+    monkeypatch.setattr(SqliteSource, "update_categories", failing_update)
+
+    warnings = []
+
+    feedback = QgsProcessingFeedback()
+    monkeypatch.setattr(feedback, "pushWarning", warnings.append)
+
+    layer.dataProvider().addAttributes([QgsField("Category", QVariant.String)])
+    layer.updateFields()
+
+    classes = ClassBreaks(QgsClassificationEqualInterval().classes(0, 1, 3))
+
+    assert CalculateCategoriesAlgorithm.update_in_database(layer, "AREA", "PERIMETER", "Category",
+                                                           classes, classes, feedback) is False
+
+    assert len(warnings) == 1
+    assert "geometry functions" in warnings[0]
@@ -0,0 +1,113 @@
+import pytest
+
+from qgis.core import (QgsVectorLayer, QgsProcessingContext, QgsProcessingFeedback,
+                       QgsProcessingUtils, QgsProject, QgsFeatureRequest, QgsProcessingException)
+
+from BivariateRenderer.colorramps.bivariate_color_ramp import BivariateColorRampGreenPink
+from BivariateRenderer.tools.tool_create_bivariate_classes import CreateBivariateClassesAlgorithm
+
+from tests import set_up_bivariate_renderer
+
+
+def run_algorithm(layer: QgsVectorLayer, context: QgsProcessingContext,
+                  **extra_parameters) -> QgsVectorLayer:
+
+    algorithm = CreateBivariateClassesAlgorithm()
+    algorithm.initAlgorithm()
+
+    parameters = {
+        CreateBivariateClassesAlgorithm.INPUT: layer,
+        CreateBivariateClassesAlgorithm.FIELD_1: "AREA",
+        CreateBivariateClassesAlgorithm.FIELD_2: "PERIMETER",
+        CreateBivariateClassesAlgorithm.NUMBER_CLASSES: 3,
+        CreateBivariateClassesAlgorithm.COLOR_RAMP: 0,
+        CreateBivariateClassesAlgorithm.COLOR_MIXING_METHOD: 0,
+        CreateBivariateClassesAlgorithm.USE_LAYER_RENDERER: True,
+        CreateBivariateClassesAlgorithm.OUTPUT: "memory:"
+    }
+
+    parameters.update(extra_parameters)
+
+    feedback = QgsProcessingFeedback()
+
+    # renderer of the layer is cloned in prepareAlgorithm, as when run by QGIS
+    assert algorithm.prepareAlgorithm(parameters, context, feedback)
+
+    result = algorithm.processAlgorithm(parameters, context, feedback)
+
+    return QgsProcessingUtils.mapLayerFromString(result[CreateBivariateClassesAlgorithm.OUTPUT],
+                                                 context)
+
+
+def test_create_bivariate_classes(nc_layer: QgsVectorLayer, qgs_project: QgsProject):
+
+    bivariate_renderer = set_up_bivariate_renderer(nc_layer,
+                                                   field1="AREA",
+                                                   field2="PERIMETER",
+                                                   color_ramps=BivariateColorRampGreenPink())
+
+    nc_layer.setRenderer(bivariate_renderer.clone())
+
+    feature_count = nc_layer.featureCount()
+    field_count = nc_layer.fields().count()
+
+    context = QgsProcessingContext()
+    context.setProject(qgs_project)
+
+    output = run_algorithm(nc_layer, context)
+
+    assert output.featureCount() == feature_count
+    assert output.fields().count() == field_count + 4
+    assert nc_layer.fields().count() == field_count
+
+    for feature in output.getFeatures():
+
+        class_1 = bivariate_renderer.classIndexField1(feature.attribute("AREA"))
+        class_2 = bivariate_renderer.classIndexField2(feature.attribute("PERIMETER"))
+
+        color = bivariate_renderer.getFeatureColor(feature.attribute("AREA"),
+                                                   feature.attribute("PERIMETER"))
+
+        assert feature.attribute("class_1") == class_1 + 1
+        assert feature.attribute("class_2") == class_2 + 1
+        assert feature.attribute("class_code") == class_1 * 3 + class_2
+        assert feature.attribute("color") == color.name()
+
+
+def test_create_bivariate_classes_renderer_fields(nc_layer: QgsVectorLayer,
+                                                  qgs_project: QgsProject):
+
+    nc_layer.setRenderer(set_up_bivariate_renderer(nc_layer, field1="AREA", field2="PERIMETER"))
+
+    context = QgsProcessingContext()
+    context.setProject(qgs_project)
+
+    with pytest.raises(QgsProcessingException):
+        run_algorithm(nc_layer, context, **{CreateBivariateClassesAlgorithm.FIELD_1: "PERIMETER"})
+
+    output = run_algorithm(
+        nc_layer, context, **{
+            CreateBivariateClassesAlgorithm.FIELD_1: "PERIMETER",
+            CreateBivariateClassesAlgorithm.USE_LAYER_RENDERER: False
+        })
+
+    assert output.featureCount() == nc_layer.featureCount()
+
+
+def test_create_bivariate_classes_null_field(nc_layer: QgsVectorLayer, qgs_project: QgsProject):
+
+    layer = nc_layer.materialize(QgsFeatureRequest())
+
+    field_index = layer.fields().lookupField("AREA")
+
+    layer.dataProvider().changeAttributeValues(
+        {feature.id(): {
+            field_index: None
+        } for feature in layer.getFeatures()})
+
+    context = QgsProcessingContext()
+    context.setProject(qgs_project)
+
+    with pytest.raises(QgsProcessingException, match="only NULL values"):
+        run_algorithm(layer, context,
+                      **{CreateBivariateClassesAlgorithm.USE_LAYER_RENDERER: False})